@@ -0,0 +1,234 @@
+import asyncio
+import logging
+import time
+from typing import Any, Iterable
+
+import requests
+
+from src.config import logs_path
+from src.quota import (
+    DEFAULT_TIMEOUT,
+    DEFAULT_USER,
+    INTERACTIVE,
+    QuotaExceeded,
+    is_daily_limit,
+    is_rate_limited,
+    stock_quota,
+)
+from src.rates import BASE_CURRENCY
+from src.utils import (
+    CBR_DAILY_URL,
+    RATE_LIMIT_RETRIES,
+    market_data_flight,
+    read_user_settings,
+    select_rates,
+    select_stock_price,
+    stock_flight_key,
+    stock_url,
+)
+from src.views import (
+    compute_sections,
+    greeting,
+    json_answer_cashback,
+    json_answer_search,
+    page_operations,
+    save_answer,
+    select_sections,
+)
+
+try:
+    import aiohttp
+except ImportError:  # без aiohttp запросы выполняются в потоках через requests
+    aiohttp = None  # type: ignore[assignment]
+
+logging.basicConfig(
+    filename=f"{logs_path}/logs.log",
+    encoding="utf-8",
+    filemode="w",
+    level=logging.DEBUG,
+    format="%(asctime)s - %(filename)s - %(levelname)s: %(message)s",
+)
+
+logger_util = logging.getLogger("app.async_views")
+
+HTTP_TIMEOUT = 10
+MARKET_SECTIONS = ("currency_rates", "stock_prices")
+NETWORK_ERRORS: tuple = (requests.exceptions.RequestException, asyncio.TimeoutError)
+if aiohttp is not None:
+    NETWORK_ERRORS += (aiohttp.ClientError,)
+
+
+async def _get_json(session: Any, url: str) -> Any:
+    if session is None:
+        response = await asyncio.to_thread(requests.get, url, timeout=HTTP_TIMEOUT)
+        return response.json()
+    async with session.get(url) as response:
+        return await response.json(content_type=None)
+
+
+async def currency_rates_async(session: Any = None) -> list | str:
+    """Асинхронная функция получения курса валют"""
+    try:
+        logger_util.info("Запуск функции асинхронного получения курса валют")
+        valute_list = await asyncio.to_thread(read_user_settings, "user_currencies")
+        if valute_list is None:
+            logger_util.error("Ошибка получения курса валют: не прочитан список валют пользователя")
+            return "Ошибка получения курса валют: не прочитан список валют пользователя"
+        data = await market_data_flight.do_async("cbr", _get_json, session, CBR_DAILY_URL, wait=HTTP_TIMEOUT)
+        sorted_valute = select_rates(data, valute_list)
+        logger_util.info("Курсы валют собраны успешно")
+        return sorted_valute
+    except NETWORK_ERRORS as e:
+        logger_util.error(f"Ошибка получения курса валют. Код ошибки: {e}")
+        return f"Ошибка получения курса валют. Код ошибки: {e}"
+    except (KeyError, TypeError) as e:
+        logger_util.error(f"Ошибка получения курса валют. Код ошибки: {e}")
+        return f"Ошибка получения курса валют. Код ошибки {e}"
+
+
+async def _fetch_stock_quote_async(session: Any, stock: str, user: str, priority: int, timeout: float | None) -> Any:
+    # Асинхронный вариант fetch_stock_quote: ждет разрешения планировщика квоты, не блокируя цикл событий
+    deadline = None if timeout is None else time.monotonic() + timeout
+    data: Any = None
+    for _ in range(RATE_LIMIT_RETRIES + 1):
+        remaining = None if deadline is None else max(deadline - time.monotonic(), 0.0)
+        await asyncio.wrap_future(stock_quota.submit(user, priority, remaining))
+        data = await _get_json(session, stock_url(stock))
+        if not is_rate_limited(data):
+            return data
+        stock_quota.report_limited(is_daily_limit(data))
+    return data
+
+
+async def _stock_price_async(session: Any, stock: str, user: str, priority: int, timeout: float | None) -> dict:
+    try:
+        data = await market_data_flight.do_async(
+            stock_flight_key(stock, priority),
+            _fetch_stock_quote_async,
+            session,
+            stock,
+            user,
+            priority,
+            timeout,
+            wait=timeout,
+        )
+    except QuotaExceeded as e:
+        logger_util.error(f"Стоимость акции {stock} не получена: {e}")
+        return {"stock": stock, "price": None}
+    if is_rate_limited(data):
+        logger_util.error(f"Стоимость акции {stock} не получена: превышен лимит запросов")
+        return {"stock": stock, "price": None}
+    return select_stock_price(stock, data)
+
+
+async def stocks_prices_async(
+    session: Any = None, user: str = DEFAULT_USER, priority: int = INTERACTIVE, timeout: float | None = DEFAULT_TIMEOUT
+) -> list | str:
+    """
+    Асинхронная функция получения стоимости акций: запросы по всем бумагам выполняются одновременно
+    в пределах квоты Alpha Vantage и объединяются с одновременными запросами stocks_prices
+    """
+    try:
+        logger_util.info("Запуск функции асинхронного получения стоимости акций")
+        stock_list = await asyncio.to_thread(read_user_settings, "user_stocks")
+        if stock_list is None:
+            logger_util.error("Ошибка получения стоимости акций: не прочитан список акций пользователя")
+            return "Ошибка получения стоимости акций: не прочитан список акций пользователя"
+        sorted_stock = await asyncio.gather(
+            *(_stock_price_async(session, stock, user, priority, timeout) for stock in stock_list)
+        )
+        logger_util.info("Стоимости акций собраны успешно")
+        return list(sorted_stock)
+    except NETWORK_ERRORS as e:
+        logger_util.error(f"Ошибка получения стоимости акций. Код ошибки: {e}")
+        return f"Ошибка получения стоимости акций. Код ошибки: {e}"
+    except (KeyError, TypeError) as e:
+        logger_util.error(f"Ошибка получения стоимости акций. Код ошибки: {e}")
+        return f"Ошибка получения стоимости акций. Код ошибки: {e}"
+
+
+async def _market_data(session: Any = None, names: tuple[str, ...] = MARKET_SECTIONS) -> dict[str, list | str]:
+    names = tuple(name for name in MARKET_SECTIONS if name in names)
+    if not names:
+        return {}
+    if session is None and aiohttp is not None:
+        async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=HTTP_TIMEOUT)) as own_session:
+            return await _market_data(own_session, names)
+    fetchers = {"currency_rates": currency_rates_async, "stock_prices": stocks_prices_async}
+    answers = await asyncio.gather(*(fetchers[name](session) for name in names))
+    return dict(zip(names, answers))
+
+
+async def _render_page_async(
+    page: str,
+    start_date_str: str,
+    diapason: str,
+    currency: str,
+    session: Any,
+    sections: Iterable[str] | None,
+) -> dict:
+    selected = select_sections(page, sections)
+    operation_sections = tuple(name for name in selected if name not in MARKET_SECTIONS and name != "greeting")
+
+    async def operations_part() -> dict:
+        if not operation_sections:
+            return {}
+        return await asyncio.to_thread(
+            lambda: compute_sections(page_operations(start_date_str, diapason, currency), operation_sections)
+        )
+
+    values, market = await asyncio.gather(operations_part(), _market_data(session, selected))
+    if "greeting" in selected:
+        values["greeting"] = greeting()
+    return {name: {**values, **market}[name] for name in selected}
+
+
+async def json_answer_main_async(
+    start_date_str: str,
+    diapason: str = "M",
+    currency: str = BASE_CURRENCY,
+    session: Any = None,
+    sections: Iterable[str] | None = None,
+) -> str:
+    """
+    Асинхронный вариант json_answer_main: расчеты по операциям выполняются в пуле потоков,
+    пока запросы курсов ЦБ и стоимости акций ожидают ответа.
+    Время ответа - максимум из времени расчетов и сети, а не их сумма.
+    Если задан sections, выполняются только расчеты и запросы, нужные этим разделам.
+    """
+    logger_util.info("Запуск асинхронного формирования страницы Главная")
+    answer_dict = await _render_page_async("main", start_date_str, diapason, currency, session, sections)
+    return await asyncio.to_thread(save_answer, answer_dict, "answer_main.json")
+
+
+async def json_answer_events_async(
+    start_date_str: str,
+    diapason: str = "M",
+    currency: str = BASE_CURRENCY,
+    session: Any = None,
+    sections: Iterable[str] | None = None,
+) -> str:
+    """Асинхронный вариант json_answer_events (расчеты и сетевые запросы выполняются одновременно)"""
+    logger_util.info("Запуск асинхронного формирования страницы События")
+    answer_dict = await _render_page_async("events", start_date_str, diapason, currency, session, sections)
+    return await asyncio.to_thread(save_answer, answer_dict, "answer_events.json")
+
+
+async def json_answer_cashback_async(year_str: str, month_str: str) -> str:
+    """Асинхронный вариант json_answer_cashback (расчет выполняется в пуле потоков)"""
+    return await asyncio.to_thread(json_answer_cashback, year_str, month_str)
+
+
+async def json_answer_search_async(
+    search_data: str,
+    limit: int | None = None,
+    cursor: str | None = None,
+    order: str = "rank",
+    columns: list[str] | None = None,
+) -> str | None:
+    """
+    Асинхронный вариант json_answer_search (поиск выполняется в пуле потоков):
+    без limit и cursor - список операций, иначе страница из limit операций с курсором cursor,
+    порядком order и колонками columns
+    """
+    return await asyncio.to_thread(json_answer_search, search_data, limit, cursor, order, columns)
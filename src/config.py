@@ -4,3 +4,7 @@ root_path = Path(__file__).resolve().parent.parent
 logs_path = root_path / "logs"
 data_file = f"{root_path}/data/operations.xlsx"
 user_settings_file = f"{root_path}/data/user_settings.json"
+rates_file = f"{root_path}/data/currency_rates.csv"
+snapshot_path = f"{root_path}/data/snapshot"
+memory_budgets_file = f"{root_path}/data/memory_budgets.json"
+store_path = f"{root_path}/data/operations.sqlite"
@@ -0,0 +1,299 @@
+import logging
+import os
+import sys
+import time
+from datetime import datetime
+from typing import Any, Callable, Union
+
+import numpy as np
+import pandas as pd
+from dotenv import load_dotenv
+
+from src.config import data_file, logs_path
+from src.query import DATE_COLUMN, DATE_FORMAT, Source, TransactionQuery, as_query, json_ready
+from src.store import SqliteEngine, SqliteTable
+from src.top_n import top_n
+from src.xlsx import read_statement
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+except ImportError:  # без pyarrow доступен только движок pandas
+    pa = None
+    pc = None
+
+load_dotenv()
+
+logging.basicConfig(
+    filename=f"{logs_path}/logs.log",
+    encoding="utf-8",
+    filemode="w",
+    level=logging.DEBUG,
+    format="%(asctime)s - %(filename)s - %(levelname)s: %(message)s",
+)
+
+logger_util = logging.getLogger("app.engines")
+
+# Таблица операций: DataFrame или TransactionQuery (движок pandas), pyarrow.Table (движок arrow)
+# либо SqliteTable (движок sqlite)
+Table = Union[Source, "pa.Table", SqliteTable]
+
+# Скрытая колонка движка Arrow с разобранными датами операций (в to_records не попадает)
+DATES_COLUMN = "__dates"
+# Служебная колонка номеров строк для устойчивого отбора top_n
+ROW_COLUMN = "__row"
+
+
+class PandasEngine:
+    """
+    Движок таблиц на pandas: таблица - DataFrame или ленивый TransactionQuery,
+    фильтры и окно дат только дописываются в план запроса.
+    """
+
+    name = "pandas"
+
+    def open(
+        self, path_xls: str, load: Callable[[], pd.DataFrame], variant: str = "raw", depends: tuple[str, ...] = ()
+    ) -> Source:
+        """Возвращает таблицу выписки path_xls, прочитанную через load() (движок не хранит таблиц между вызовами)"""
+        return self.from_frame(load())
+
+    def load(self, path_xls: str) -> pd.DataFrame:
+        """Читает выписку Excel и оставляет успешные операции"""
+        return read_statement(path_xls)
+
+    def from_frame(self, df: pd.DataFrame) -> Source:
+        """Принимает уже прочитанную таблицу pandas"""
+        return df
+
+    def to_frame(self, table: Source) -> Source:
+        """Возвращает таблицу (запрос) pandas"""
+        return table
+
+    def window(self, table: Source, start: datetime, end: datetime) -> Source:
+        """Операции с датой в интервале [start, end]"""
+        return as_query(table).between(start, end)
+
+    def filter(self, table: Source, column: str, op: str, value: Any) -> Source:
+        """Операции, у которых column op value (op - одно из < <= > >= == != in)"""
+        return as_query(table).filter(column, op, value)
+
+    def search(self, table: Source, columns: tuple[str, ...], pattern: str, case: bool = False) -> Source:
+        """Операции, в которых регулярное выражение pattern найдено хотя бы в одной из колонок"""
+        return as_query(table).search(columns, pattern, case=case)
+
+    def group_sum(self, table: Source, by: str, column: str) -> pd.DataFrame:
+        """Сумма column по группам by, группы упорядочены по возрастанию ключа"""
+        return as_query(table).group(by).aggregate(column).collect().reset_index(drop=True)
+
+    def top_n(
+        self, table: Source, column: str, n: int, largest: bool = True, columns: tuple[str, ...] | None = None
+    ) -> pd.DataFrame:
+        """n строк с наибольшим (наименьшим) значением column, при равенстве - в исходном порядке"""
+        return top_n(table, column, n, largest, columns=columns)
+
+    def total(self, table: Source, column: str) -> float:
+        """Сумма колонки column"""
+        return float(as_query(table).project(column).collect()[column].sum())
+
+    def to_records(self, table: Source) -> list[dict]:
+        """Список строк-словарей, пропуски заменены на None"""
+        records: list[dict] = json_ready(as_query(table).collect()).to_dict(orient="records")
+        return records
+
+
+class ArrowEngine:
+    """
+    Движок таблиц на pyarrow.compute: колонки хранятся в колоночном формате Arrow,
+    даты операций разбираются один раз при загрузке, фильтры и поиск выполняются векторно.
+    """
+
+    name = "arrow"
+
+    _OPERATORS: dict[str, Callable] = {
+        "<": lambda column, value: pc.less(column, value),
+        "<=": lambda column, value: pc.less_equal(column, value),
+        ">": lambda column, value: pc.greater(column, value),
+        ">=": lambda column, value: pc.greater_equal(column, value),
+        "==": lambda column, value: pc.equal(column, value),
+        # как в pandas: пропуск не равен никакому значению
+        "!=": lambda column, value: pc.fill_null(pc.not_equal(column, value), True),
+        "in": lambda column, value: pc.is_in(column, value_set=pa.array(list(value))),
+    }
+
+    def __init__(self) -> None:
+        if pa is None:
+            raise ImportError(
+                "Для движка arrow требуется пакет pyarrow: установите его командой "
+                "poetry install -E arrow (или pip install pyarrow)"
+            )
+
+    def open(
+        self, path_xls: str, load: Callable[[], pd.DataFrame], variant: str = "raw", depends: tuple[str, ...] = ()
+    ) -> "pa.Table":
+        """Возвращает таблицу выписки path_xls, прочитанную через load() (движок не хранит таблиц между вызовами)"""
+        return self.from_frame(load())
+
+    def load(self, path_xls: str) -> "pa.Table":
+        """Читает выписку Excel и оставляет успешные операции"""
+        return self.from_frame(read_statement(path_xls))
+
+    def from_frame(self, df: Source) -> "pa.Table":
+        """
+        Переводит таблицу pandas в Arrow. Категориальные колонки (снимок операций)
+        раскрываются в строки, к таблице добавляется колонка разобранных дат.
+        """
+        if isinstance(df, pa.Table):
+            return df
+        if isinstance(df, TransactionQuery):
+            df = df.collect()
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        columns = [
+            pc.cast(column, column.type.value_type) if pa.types.is_dictionary(column.type) else column
+            for column in table.columns
+        ]
+        table = pa.table(columns, names=table.column_names)
+        if DATE_COLUMN not in table.column_names:
+            return table
+        dates = table[DATE_COLUMN]
+        if not pa.types.is_timestamp(dates.type):
+            dates = pc.strptime(dates, format=DATE_FORMAT, unit="s", error_is_null=True)
+        return table.append_column(DATES_COLUMN, dates)
+
+    def to_frame(self, table: "pa.Table") -> pd.DataFrame:
+        """Возвращает таблицу pandas без служебных колонок"""
+        return self._visible(table).to_pandas()
+
+    @staticmethod
+    def _visible(table: "pa.Table") -> "pa.Table":
+        return table.drop_columns([name for name in table.column_names if name == DATES_COLUMN])
+
+    def window(self, table: "pa.Table", start: datetime, end: datetime) -> "pa.Table":
+        """Операции с датой в интервале [start, end]"""
+        dates = table[DATES_COLUMN]
+        mask = pc.and_(
+            pc.greater_equal(dates, pa.scalar(start, dates.type)), pc.less_equal(dates, pa.scalar(end, dates.type))
+        )
+        return table.filter(mask)
+
+    def filter(self, table: "pa.Table", column: str, op: str, value: Any) -> "pa.Table":
+        """Операции, у которых column op value (op - одно из < <= > >= == != in)"""
+        if op not in self._OPERATORS:
+            raise ValueError(f"Неизвестный оператор фильтра: {op}")
+        return table.filter(self._OPERATORS[op](table[column], value))
+
+    def search(self, table: "pa.Table", columns: tuple[str, ...], pattern: str, case: bool = False) -> "pa.Table":
+        """Операции, в которых регулярное выражение pattern найдено хотя бы в одной из колонок"""
+        found = None
+        for column in columns:
+            hit = pc.fill_null(pc.match_substring_regex(table[column], pattern, ignore_case=not case), False)
+            found = hit if found is None else pc.or_(found, hit)
+        return table.filter(found)
+
+    def group_sum(self, table: "pa.Table", by: str, column: str) -> "pa.Table":
+        """Сумма column по группам by, группы упорядочены по возрастанию ключа"""
+        table = table.filter(pc.is_valid(table[by]))
+        sums = table.group_by(by).aggregate([(column, "sum", pc.ScalarAggregateOptions(min_count=0))])
+        sums = sums.rename_columns([by if name == by else column for name in sums.column_names])
+        return sums.select([by, column]).sort_by(by)
+
+    def top_n(
+        self,
+        table: "pa.Table",
+        column: str,
+        n: int,
+        largest: bool = True,
+        columns: tuple[str, ...] | None = None,
+    ) -> "pa.Table":
+        """n строк с наибольшим (наименьшим) значением column, при равенстве - в исходном порядке"""
+        values = table[column]
+        if pa.types.is_floating(values.type):
+            table = table.filter(pc.invert(pc.is_nan(values)))
+        table = table.filter(pc.is_valid(table[column]))
+        # Частичный отбор k строк без полной сортировки; номер строки - второй ключ,
+        # поэтому при равенстве сохраняется исходный порядок строк
+        keys = pa.table({column: table[column], ROW_COLUMN: pa.array(np.arange(table.num_rows))})
+        order = pc.select_k_unstable(
+            keys,
+            k=max(n, 0),
+            sort_keys=[(column, "descending" if largest else "ascending"), (ROW_COLUMN, "ascending")],
+        )
+        result = table.take(order)
+        return result.select(list(columns)) if columns is not None else result
+
+    def total(self, table: "pa.Table", column: str) -> float:
+        """Сумма колонки column"""
+        return float(pc.sum(table[column], min_count=0).as_py())
+
+    def to_records(self, table: "pa.Table") -> list[dict]:
+        """Список строк-словарей, пропуски заменены на None"""
+        records: list[dict] = self._visible(table).to_pylist()
+        return records
+
+
+ENGINES: dict[str, type] = {"pandas": PandasEngine, "arrow": ArrowEngine, "sqlite": SqliteEngine}
+_settings = {"engine": os.getenv("DATAFRAME_ENGINE", "pandas")}
+
+
+def get_engine(name: str | None = None) -> Any:
+    """
+    Функция, которая возвращает движок таблиц name; без имени - движок из настройки
+    DATAFRAME_ENGINE (.env) или выбранный через set_engine.
+    """
+    name = name or _settings["engine"]
+    if name not in ENGINES:
+        raise ValueError(f"Неизвестный движок таблиц: {name}")
+    return ENGINES[name]()
+
+
+def set_engine(name: str) -> None:
+    """Функция, которая выбирает движок таблиц по умолчанию (pandas, arrow или sqlite)"""
+    get_engine(name)
+    _settings["engine"] = name
+
+
+def engine_for(table: Any) -> Any:
+    """Функция, которая возвращает движок, которому принадлежит таблица"""
+    if pa is not None and isinstance(table, pa.Table):
+        return ArrowEngine()
+    if isinstance(table, SqliteTable):
+        return SqliteEngine()
+    return PandasEngine()
+
+
+def benchmark_engines(path_xls: str = data_file, repeat: int = 20) -> dict[str, dict[str, float]]:
+    """
+    Функция, которая сравнивает движки на операциях страниц: для каждой операции
+    возвращает медианное время в миллисекундах по каждому доступному движку.
+    """
+    names = [name for name in ENGINES if name != "arrow" or pa is not None]
+    latest = read_statement(path_xls, dates=True)[DATE_COLUMN].max().to_pydatetime()
+    results: dict[str, dict[str, float]] = {}
+    for name in names:
+        engine = get_engine(name)
+        started = time.perf_counter()
+        table = engine.load(path_xls)
+        results.setdefault("load", {})[name] = (time.perf_counter() - started) * 1000
+        expenses = engine.filter(table, "Сумма платежа", "<", 0)
+        operations: dict[str, Callable[[], Any]] = {
+            "window": lambda: engine.to_records(engine.window(table, datetime(latest.year, 1, 1), latest)),
+            "filter": lambda: engine.total(engine.filter(table, "Сумма платежа", "<", 0), "Сумма платежа"),
+            "group_sum": lambda: engine.to_records(engine.group_sum(expenses, "Категория", "Сумма платежа")),
+            "top_n": lambda: engine.to_records(engine.top_n(expenses, "Сумма платежа", 5, largest=False)),
+            "search": lambda: engine.to_records(engine.search(table, ("Описание", "Категория"), "авиа")),
+            "to_records": lambda: engine.to_records(table),
+        }
+        for operation, run in operations.items():
+            timings = []
+            for _ in range(repeat):
+                started = time.perf_counter()
+                run()
+                timings.append((time.perf_counter() - started) * 1000)
+            results.setdefault(operation, {})[name] = float(np.median(timings))
+    return results
+
+
+if __name__ == "__main__":
+    benchmark = benchmark_engines(sys.argv[1] if len(sys.argv) > 1 else data_file)
+    for operation, timings in benchmark.items():
+        print(f"{operation:<12}" + "".join(f"{name:>10}: {value:8.2f} мс" for name, value in timings.items()))
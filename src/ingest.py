@@ -0,0 +1,197 @@
+import hashlib
+import json
+import logging
+import os
+from typing import Any, Iterable
+
+import numpy as np
+import pandas as pd
+
+from src.config import logs_path
+from src.sketch import SKETCHES_FILE, load_sketches, save_sketches, update_sketches
+from src.snapshot import append_snapshot, attach_snapshot, publish_snapshot, writer_lock
+from src.xlsx import read_statement, read_statement_tail
+
+logging.basicConfig(
+    filename=f"{logs_path}/logs.log",
+    encoding="utf-8",
+    filemode="w",
+    level=logging.DEBUG,
+    format="%(asctime)s - %(filename)s - %(levelname)s: %(message)s",
+)
+
+logger_util = logging.getLogger("app.ingest")
+
+KEY_COLUMNS = ("Дата операции", "Номер карты", "Статус", "Сумма платежа", "Описание")
+FINGERPRINTS_FILE = "fingerprints.npy"
+AGGREGATES_FILE = "aggregates.json"
+STATE_FILE = "ingest.json"
+
+
+def _key_value(value: Any) -> str:
+    if value is None or (isinstance(value, float) and np.isnan(value)):
+        return ""
+    if isinstance(value, (int, float)):
+        return repr(float(value))
+    return str(value)
+
+
+def _fingerprint(text: str, number: int) -> int:
+    digest = hashlib.blake2b(f"{text}\x1e{number}".encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "little")
+
+
+def _contains(known: np.ndarray, value: int) -> bool:
+    position = int(np.searchsorted(known, np.uint64(value)))
+    return position < len(known) and int(known[position]) == value
+
+
+def fingerprints(keys: Iterable[tuple], known: np.ndarray | None = None) -> np.ndarray:
+    """
+    Функция, которая возвращает устойчивые (не зависящие от процесса) отпечатки операций
+    по дате, карте, статусу, сумме и описанию. Одинаковые операции различаются номером повтора;
+    known - отсортированные отпечатки уже загруженного начала файла, повторы продолжают их нумерацию.
+    """
+    seen: dict[str, int] = {}
+    result = []
+    for key in keys:
+        text = "\x1f".join(_key_value(value) for value in key)
+        if text not in seen:
+            seen[text] = 0
+            while known is not None and _contains(known, _fingerprint(text, seen[text] + 1)):
+                seen[text] += 1
+        seen[text] += 1
+        result.append(_fingerprint(text, seen[text]))
+    return np.array(result, dtype="uint64")
+
+
+def _keys(df: pd.DataFrame) -> Iterable[tuple]:
+    keys: Iterable[tuple] = df[list(KEY_COLUMNS)].itertuples(index=False, name=None)
+    return keys
+
+
+def read_all_rows(path_xls: str) -> tuple[pd.DataFrame, dict | None]:
+    """
+    Функция, которая читает все строки выписки (без фильтра по статусу) и состояние чтения
+    для последующего дочитывания (None, если файл другой схемы и читается через pandas)
+    """
+    tail = read_statement_tail(path_xls)
+    if tail is not None:
+        return tail[0].reset_index(drop=True), tail[1]
+    return read_statement(path_xls, status=None).reset_index(drop=True), None
+
+
+def _save_json(path: str, data: dict, indent: int | None = None) -> None:
+    with open(f"{path}.tmp{os.getpid()}", "w", encoding="utf-8") as f:
+        f.write(json.dumps(data, ensure_ascii=False, indent=indent))
+    os.replace(f"{path}.tmp{os.getpid()}", path)
+
+
+def load_state(state_path: str) -> dict:
+    """Функция, которая читает состояние последней загрузки (число строк листа и отпечатки начала файла)"""
+    try:
+        with open(os.path.join(state_path, STATE_FILE), "r", encoding="utf-8") as f:
+            state: dict = json.load(f)
+            return state
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+
+def load_aggregates(state_path: str) -> dict:
+    """Функция, которая читает накопленные агрегаты по картам и категориям"""
+    try:
+        with open(os.path.join(state_path, AGGREGATES_FILE), "r", encoding="utf-8") as f:
+            aggregates: dict = json.load(f)
+            return aggregates
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {"cards": {}, "categories": {}}
+
+
+def update_aggregates(aggregates: dict, df: pd.DataFrame) -> dict:
+    """
+    Функция, которая дополняет агрегаты только новыми операциями:
+    расходы и кешбэк по картам, расходы и поступления по категориям за каждый месяц.
+    """
+    if df.empty:
+        return aggregates
+    amounts = df["Сумма платежа"].to_numpy(dtype="float64")
+    expenses = np.where(amounts < 0, -amounts, 0.0)
+    months = pd.to_datetime(df["Дата операции"], format="%d.%m.%Y %H:%M:%S").dt.strftime("%Y-%m")
+    frame = pd.DataFrame(
+        {
+            "card": df["Номер карты"].to_numpy(),
+            "category": df["Категория"].to_numpy(),
+            "month": months.to_numpy(),
+            "expenses": expenses,
+            "income": np.where(amounts > 0, amounts, 0.0),
+        }
+    )
+    for card, spent in frame.groupby("card")["expenses"].sum().items():
+        entry = aggregates["cards"].setdefault(str(card), {"total_spent": 0.0})
+        entry["total_spent"] = round(entry["total_spent"] + float(spent), 2)
+        entry["cashback"] = round(entry["total_spent"] / 100, 2)
+    for (month, category), sums in frame.groupby(["month", "category"])[["expenses", "income"]].sum().iterrows():
+        entry = aggregates["categories"].setdefault(month, {}).setdefault(category, {"expenses": 0.0, "income": 0.0})
+        entry["expenses"] = round(entry["expenses"] + float(sums["expenses"]), 2)
+        entry["income"] = round(entry["income"] + float(sums["income"]), 2)
+    return aggregates
+
+
+def ingest_statement(path_xls: str, state_path: str) -> dict[str, int]:
+    """
+    Функция инкрементальной загрузки выписки в снимок state_path.
+    Если начало файла не изменилось (сверяется по отпечатку исходного XML), разбираются только
+    строки после последней загруженной; иначе новые операции определяются по отпечатку
+    (дата, карта, статус, сумма, описание). В снимок дописываются и в агрегатах и скетчах сумм
+    расходов учитываются только новые операции. Если из файла пропали ранее загруженные операции
+    (в том числе сменился статус), снимок, агрегаты и скетчи строятся заново.
+    Настройки user_settings.json (валюты и акции) из выписки не вычисляются и здесь не обновляются.
+    """
+    logger_util.info(f"Запуск инкрементальной загрузки выписки {path_xls}")
+    fingerprints_path = os.path.join(state_path, FINGERPRINTS_FILE)
+    with writer_lock(state_path):
+        stored = attach_snapshot(state_path) if os.path.exists(fingerprints_path) else None
+        has_sketches = os.path.exists(os.path.join(state_path, SKETCHES_FILE))
+        if stored is not None and has_sketches and attach_snapshot(state_path, path_xls) is not None:
+            logger_util.info("Снимок уже соответствует выписке")
+            return {"new": 0, "total": len(stored)}
+        known = np.load(fingerprints_path) if stored is not None else np.empty(0, dtype="uint64")
+        state = load_state(state_path) if stored is not None else {}
+        aggregates = load_aggregates(state_path)
+        sketches = load_sketches(state_path)
+        sheet: dict | None
+        tail = read_statement_tail(path_xls, state["sheet"]) if state.get("sheet") else None
+        if tail is not None:
+            logger_util.info(f"Начало выписки не изменилось, разбираются строки после {state['sheet']['rows']}")
+            new_rows, sheet = tail[0].reset_index(drop=True), tail[1]
+            added = np.sort(fingerprints(_keys(new_rows), known))
+            all_fingerprints = np.insert(known, np.searchsorted(known, added), added)
+        else:
+            rows, sheet = read_all_rows(path_xls)
+            all_fingerprints = fingerprints(_keys(rows))
+            is_new = ~np.isin(all_fingerprints, known)
+            all_fingerprints = np.sort(all_fingerprints)
+            new_rows = rows[is_new].reset_index(drop=True)
+            if int((~is_new).sum()) < len(known):
+                logger_util.info("Из выписки удалены операции, снимок строится заново")
+                new_rows, stored, aggregates, sketches = rows, None, {"cards": {}, "categories": {}}, None
+        new_rows = new_rows[new_rows["Статус"] == "OK"].reset_index(drop=True) if not new_rows.empty else new_rows
+        if stored is None:
+            publish_snapshot(new_rows, state_path, path_xls)
+        elif not append_snapshot(new_rows, state_path, path_xls):
+            publish_snapshot(pd.concat([stored, new_rows], ignore_index=True), state_path, path_xls)
+        total = len(new_rows) + (len(stored) if stored is not None else 0)
+        tmp_path = f"{fingerprints_path}.tmp{os.getpid()}"
+        with open(tmp_path, "wb") as f:
+            np.save(f, all_fingerprints)
+        os.replace(tmp_path, fingerprints_path)
+        _save_json(os.path.join(state_path, STATE_FILE), {"sheet": sheet})
+        _save_json(os.path.join(state_path, AGGREGATES_FILE), update_aggregates(aggregates, new_rows), indent=4)
+        # Снимок, загруженный до появления скетчей, получает их по всем операциям, а не только по новым
+        if sketches is None:
+            sketches = update_sketches({}, attach_snapshot(state_path))
+        else:
+            sketches = update_sketches(sketches, new_rows)
+        save_sketches(sketches, state_path)
+    logger_util.info(f"Загрузка выписки завершена: новых операций {len(new_rows)}, всего {total}")
+    return {"new": len(new_rows), "total": total}
@@ -0,0 +1,273 @@
+import argparse
+import gc
+import json
+import logging
+import os
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from contextlib import ExitStack
+from typing import Any, Callable
+from unittest.mock import patch
+
+import numpy as np
+import pandas as pd
+
+from src import services, utils, views
+from src.config import data_file, logs_path, memory_budgets_file
+from src.query import parse_dates
+
+logging.basicConfig(
+    filename=f"{logs_path}/logs.log",
+    encoding="utf-8",
+    filemode="w",
+    level=logging.DEBUG,
+    format="%(asctime)s - %(filename)s - %(levelname)s: %(message)s",
+)
+
+logger_util = logging.getLogger("app.memory_profile")
+
+DEFAULT_SIZES = (1000, 5000, 20000)
+DEFAULT_TOLERANCE = 0.25
+# Абсолютный допуск, чтобы шум аллокатора на маленьких функциях не считался регрессией
+SLACK_KB = 256
+RSS_INTERVAL = 0.005
+# Показатели бюджета: ключ в файле бюджетов, ключ замера measure и название в отчете
+BUDGET_METRICS = (
+    ("peak_kb", "peak_kb", "пик"),
+    ("retained_kb", "retained_kb", "остаток"),
+    ("rss_kb", "rss_peak_kb", "пик RSS"),
+)
+
+
+def _current_rss_kb() -> int | None:
+    try:
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") // 1024
+    except (OSError, ValueError, IndexError, AttributeError):
+        return None
+
+
+class RssSampler:
+    """Фоновый поток, который замеряет RSS процесса и запоминает пиковый прирост"""
+
+    def __init__(self, interval: float = RSS_INTERVAL) -> None:
+        self._interval = interval
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._start_kb = _current_rss_kb()
+        self._peak_kb = self._start_kb
+
+    def _run(self) -> None:
+        while not self._stop.wait(self._interval):
+            self._sample()
+
+    def _sample(self) -> None:
+        current = _current_rss_kb()
+        if current is not None and self._peak_kb is not None:
+            self._peak_kb = max(self._peak_kb, current)
+
+    def __enter__(self) -> "RssSampler":
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self._stop.set()
+        self._thread.join()
+        self._sample()
+
+    @property
+    def peak_kb(self) -> int | None:
+        """Пиковый прирост RSS относительно начала замера (None, если RSS недоступен)"""
+        if self._start_kb is None or self._peak_kb is None:
+            return None
+        return self._peak_kb - self._start_kb
+
+
+def measure(func: Callable, *args: Any, **kwargs: Any) -> dict[str, int | None]:
+    """
+    Функция, которая вызывает func и возвращает пиковую (peak_kb) и оставшуюся после
+    освобождения результата (retained_kb) память по tracemalloc, а также пиковый прирост RSS.
+    """
+    gc.collect()
+    with RssSampler() as sampler:
+        tracemalloc.start()
+        try:
+            result = func(*args, **kwargs)
+            _, peak = tracemalloc.get_traced_memory()
+            del result
+            gc.collect()
+            retained, _ = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+    return {"peak_kb": round(peak / 1024), "retained_kb": round(retained / 1024), "rss_peak_kb": sampler.peak_kb}
+
+
+def scaled_statement(source: pd.DataFrame, rows: int) -> pd.DataFrame:
+    """
+    Функция, которая строит выписку из rows строк, повторяя строки source.
+    Платежи выражены в рублях, чтобы профилирование не обращалось к курсам ЦБ.
+    """
+    df = source.iloc[np.arange(rows) % len(source)].reset_index(drop=True)
+    return df.assign(**{"Валюта платежа": "RUB"})
+
+
+def profile_targets(df: pd.DataFrame, path_xls: str) -> dict[str, Callable[[], Any]]:
+    """
+    Функция, которая возвращает профилируемые функции: чтение выписки, агрегаты utils,
+    функции services и ответы views (views читают выписку path_xls).
+    """
+    latest = parse_dates(df["Дата операции"]).max()
+    date_str = latest.strftime("%Y-%m-%d %H:%M:%S")
+    year, month = str(latest.year), str(latest.month)
+    return {
+        "read_info": lambda: utils.read_info(path_xls),
+        "sorted_by_date": lambda: utils.sorted_by_date(df, date_str),
+        "cards_info": lambda: utils.cards_info(df),
+        "top_transactions": lambda: utils.top_transactions(df),
+        "total_expenses": lambda: utils.total_expenses(df),
+        "expenses_by_category": lambda: utils.expenses_by_category(df),
+        "total_income": lambda: utils.total_income(df),
+        "income_by_category": lambda: utils.income_by_category(df),
+        "cashback": lambda: services.cashback(df, year, month),
+        "search_word": lambda: services.search_word(df, "авиа"),
+        "search_number": lambda: services.search_number(df, "cellphone"),
+        "search_name": lambda: services.search_name(df, "transfer"),
+        "json_answer_main": lambda: views.json_answer_main(date_str),
+        "json_answer_events": lambda: views.json_answer_events(date_str),
+        "json_answer_cashback": lambda: views.json_answer_cashback(year, month),
+        "json_answer_search": lambda: views.json_answer_search("авиа"),
+    }
+
+
+def _offline(stack: ExitStack, work_path: str, path_xls: str) -> None:
+    # Ответы пишутся во временный каталог, а курсы и котировки не запрашиваются из сети
+    os.makedirs(os.path.join(work_path, "data"), exist_ok=True)
+    stack.enter_context(patch.object(views, "data_file", path_xls))
+    stack.enter_context(patch.object(views, "snapshot_path", os.path.join(work_path, "snapshot")))
+    stack.enter_context(patch.object(views, "root_path", work_path))
+    stack.enter_context(patch.object(services, "root_path", work_path))
+    stack.enter_context(patch.object(views, "currency_rates", lambda: []))
+    stack.enter_context(patch.object(views, "stocks_prices", lambda: []))
+
+
+def profile_functions(
+    sizes: tuple[int, ...] = DEFAULT_SIZES, names: list[str] | None = None, source: str = data_file
+) -> dict[str, dict[str, dict]]:
+    """
+    Функция, которая замеряет память каждой функции на выписках из sizes строк.
+    Возвращает {функция: {размер: {"peak_kb", "retained_kb", "rss_peak_kb"}}}.
+    """
+    logger_util.info(f"Запуск профилирования памяти на размерах {sizes}")
+    statement = pd.read_excel(source)
+    results: dict[str, dict[str, dict]] = {}
+    with tempfile.TemporaryDirectory() as work_path, ExitStack() as stack:
+        for rows in sizes:
+            path_xls = os.path.join(work_path, f"operations_{rows}.xlsx")
+            scaled_statement(statement, rows).to_excel(path_xls, index=False)
+            _offline(stack, os.path.join(work_path, str(rows)), path_xls)
+            df = utils.read_info(path_xls)
+            targets = profile_targets(df, path_xls)
+            for name, target in targets.items():
+                if names is not None and name not in names:
+                    continue
+                target()  # прогрев: импорты, кеши и снимок операций не должны попадать в замер
+                results.setdefault(name, {})[str(rows)] = measure(target)
+            logger_util.info(f"Профилирование на {rows} строках завершено")
+    return results
+
+
+def load_budgets(path: str = memory_budgets_file) -> dict:
+    """Функция, которая читает бюджеты памяти по функциям"""
+    with open(path, "r", encoding="utf-8") as f:
+        budgets: dict = json.load(f)
+    return budgets
+
+
+def save_budgets(results: dict, sizes: tuple[int, ...], path: str = memory_budgets_file) -> None:
+    """Функция, которая записывает замеры как новые бюджеты памяти"""
+    budgets = {
+        "tolerance": DEFAULT_TOLERANCE,
+        "slack_kb": SLACK_KB,
+        "sizes": list(sizes),
+        "budgets": {
+            name: {
+                rows: {"peak_kb": value["peak_kb"], "retained_kb": value["retained_kb"]}
+                for rows, value in by_size.items()
+            }
+            for name, by_size in results.items()
+        },
+    }
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(budgets, f, ensure_ascii=False, indent=4)
+        f.write("\n")
+
+
+def check_budgets(results: dict, budgets: dict) -> list[str]:
+    """
+    Функция, которая сравнивает замеры с бюджетами и возвращает список регрессий:
+    пиковая память (peak_kb), оставшаяся память (retained_kb) или пиковый прирост RSS (rss_kb)
+    больше бюджета с учетом относительного (tolerance) и абсолютного (slack_kb) допуска.
+    Проверяются только показатели, для которых в бюджете функции задано значение.
+    """
+    tolerance = budgets.get("tolerance", DEFAULT_TOLERANCE)
+    slack_kb = budgets.get("slack_kb", SLACK_KB)
+    regressions = []
+    for name, by_size in results.items():
+        for rows, value in by_size.items():
+            budget = budgets["budgets"].get(name, {}).get(rows)
+            if budget is None:
+                continue
+            for key, measured, label in BUDGET_METRICS:
+                if budget.get(key) is None or value.get(measured) is None:
+                    continue
+                limit = budget[key] * (1 + tolerance) + slack_kb
+                if value[measured] > limit:
+                    regressions.append(
+                        f"{name} на {rows} строках: {label} {value[measured]} КБ, бюджет {budget[key]} КБ "
+                        f"(допуск до {round(limit)} КБ)"
+                    )
+    return regressions
+
+
+def format_report(results: dict) -> str:
+    """Функция, которая формирует таблицу замеров"""
+    lines = [f"{'функция':<24}{'строк':>8}{'пик, КБ':>12}{'остаток, КБ':>14}{'RSS, КБ':>12}"]
+    for name, by_size in results.items():
+        for rows, value in by_size.items():
+            rss = "-" if value["rss_peak_kb"] is None else value["rss_peak_kb"]
+            lines.append(f"{name:<24}{rows:>8}{value['peak_kb']:>12}{value['retained_kb']:>14}{rss:>12}")
+    return "\n".join(lines)
+
+
+def main(argv: list[str] | None = None) -> int:
+    """
+    Точка входа: python -m src.memory_profile [--update] [--sizes ...] [--only ...].
+    Возвращает 1, если пиковая память какой-либо функции превысила бюджет.
+    """
+    parser = argparse.ArgumentParser(description="Профилирование памяти и проверка бюджетов")
+    parser.add_argument("--sizes", type=int, nargs="+", default=None, help="размеры выписки в строках")
+    parser.add_argument("--only", nargs="+", default=None, help="профилировать только эти функции")
+    parser.add_argument("--update", action="store_true", help="записать замеры как новые бюджеты")
+    parser.add_argument("--budgets", default=memory_budgets_file, help="файл с бюджетами")
+    args = parser.parse_args(argv)
+    budgets = None if args.update else load_budgets(args.budgets)
+    sizes = tuple(args.sizes or (budgets["sizes"] if budgets else DEFAULT_SIZES))
+    started = time.perf_counter()
+    results = profile_functions(sizes, args.only)
+    print(format_report(results))
+    print(f"Профилирование заняло {time.perf_counter() - started:.1f} с")
+    if budgets is None:
+        save_budgets(results, sizes, args.budgets)
+        print(f"Бюджеты записаны в {args.budgets}")
+        return 0
+    regressions = check_budgets(results, budgets)
+    for regression in regressions:
+        print(f"РЕГРЕССИЯ: {regression}")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,252 @@
+import logging
+import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Any, Callable
+
+from dotenv import load_dotenv
+
+from src import views
+from src.config import data_file, logs_path, rates_file, user_settings_file
+from src.query import DATE_COLUMN, parse_dates
+from src.quota import BACKGROUND
+from src.rates import BASE_CURRENCY
+from src.services import compute_cashback
+from src.store import source_stamp
+from src.utils import output_date
+
+load_dotenv()
+
+logging.basicConfig(
+    filename=f"{logs_path}/logs.log",
+    encoding="utf-8",
+    filemode="w",
+    level=logging.DEBUG,
+    format="%(asctime)s - %(filename)s - %(levelname)s: %(message)s",
+)
+
+logger_util = logging.getLogger("app.precompute")
+
+DATE_STR_FORMAT = "%Y-%m-%d %H:%M:%S"
+HOT_DIAPASONS = ("W", "M", "Y")
+# Выписка, курсы ЦБ и настройки пользователя (список валют и акций): при их изменении ответы пересчитываются
+WATCHED_FILES = (data_file, rates_file, user_settings_file)
+DEFAULT_INTERVAL = float(os.getenv("PRECOMPUTE_INTERVAL", "300"))
+DEFAULT_WORKERS = int(os.getenv("PRECOMPUTE_WORKERS", "2"))
+# Сколько фоновый запрос акции ждет квоту Alpha Vantage: дольше поток пула не занимается
+MARKET_TIMEOUT = float(os.getenv("PRECOMPUTE_MARKET_TIMEOUT", "5"))
+POLL_INTERVAL = 1.0
+
+
+def previous_period_end(date: datetime, diapason: str) -> datetime:
+    """Функция, которая возвращает последнюю секунду периода, предшествующего периоду даты date"""
+    start = output_date(date.strftime(DATE_STR_FORMAT), diapason)
+    if not isinstance(start, datetime):
+        raise ValueError(f"Ошибка даты: неизвестный диапазон {diapason}")
+    return start - timedelta(seconds=1)
+
+
+def hot_jobs(now: datetime, currency: str = BASE_CURRENCY) -> list[tuple[str, tuple]]:
+    """
+    Функция, которая возвращает самые востребованные ответы: страницы "Главная" и "События"
+    за текущие и предыдущие неделю, месяц и год и кешбэк за текущий месяц.
+    """
+    jobs: list[tuple[str, tuple]] = []
+    for diapason in HOT_DIAPASONS:
+        for date in (now, previous_period_end(now, diapason)):
+            date_str = date.strftime(DATE_STR_FORMAT)
+            jobs.append(("main", (date_str, diapason, currency)))
+            jobs.append(("events", (date_str, diapason, currency)))
+    jobs.append(("cashback", (str(now.year), str(now.month))))
+    return jobs
+
+
+class PrecomputeScheduler:
+    """
+    Планировщик фонового расчета ответов страниц. Пересчет запускается при изменении выписки,
+    курсов или настроек пользователя и не реже чем раз в interval секунд (обновление курсов и акций).
+    Расчеты выполняются пулом из max_workers потоков; при запуске нового пересчета задачи
+    предыдущего, еще не начатые, отменяются, а результаты уже выполняющихся отбрасываются.
+    Ответы answer_* выдаются из готовых результатов, если они рассчитаны по текущим файлам.
+    """
+
+    def __init__(
+        self,
+        interval: float = DEFAULT_INTERVAL,
+        max_workers: int = DEFAULT_WORKERS,
+        watched: tuple[str, ...] = WATCHED_FILES,
+        clock: Callable[[], datetime] = datetime.now,
+    ) -> None:
+        self.interval = interval
+        self.watched = watched
+        self._clock = clock
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="precompute")
+        self._lock = threading.Lock()
+        self._generation = 0
+        self._futures: list[Future] = []
+        self._results: dict[tuple, Any] = {}
+        self._stamp: str | None = None
+        self._latest: datetime | None = None
+        self._last_run: datetime | None = None
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+        self._stats = {"scheduled": 0, "completed": 0, "cancelled": 0, "discarded": 0, "hits": 0, "misses": 0}
+
+    def _key(self, page: str, args: tuple) -> tuple:
+        # Окна, которые заканчиваются после последней операции выписки, содержат одни и те же
+        # операции, поэтому запрос "на сейчас" совпадает с ответом, рассчитанным чуть раньше
+        if page == "cashback":
+            return page, *args
+        date_str, diapason, currency = args
+        end = datetime.strptime(date_str, DATE_STR_FORMAT)
+        start = output_date(date_str, diapason)
+        if self._latest is not None and end > self._latest:
+            end = self._latest
+        return page, diapason, currency, start, end
+
+    def due(self) -> bool:
+        """Нужен ли пересчет: изменились отслеживаемые файлы или прошел интервал"""
+        if self._stamp != source_stamp(self.watched) or self._last_run is None:
+            return True
+        return (self._clock() - self._last_run).total_seconds() >= self.interval
+
+    def refresh(self) -> int:
+        """
+        Запускает новый пересчет всех востребованных ответов и отменяет задачи предыдущего.
+        Возвращает номер пересчета.
+        """
+        stamp = source_stamp(self.watched)
+        now = self._clock()
+        operations = views.read_info(views.data_file, views.snapshot_path)
+        latest = None
+        if operations is None:
+            logger_util.error(
+                f"Выписка {views.data_file} не прочитана: окна ответов не сдвигаются к последней операции"
+            )
+        else:
+            dates = parse_dates(operations[DATE_COLUMN])
+            latest = dates.max() if dates.notna().any() else None
+        with self._lock:
+            self._generation += 1
+            generation = self._generation
+            for future in self._futures:
+                if future.cancel():
+                    self._stats["cancelled"] += 1
+            if stamp != self._stamp:
+                self._results.clear()
+            self._stamp = stamp
+            self._latest = None if latest is None else latest.to_pydatetime()
+            self._last_run = now
+            market = self._executor.submit(self._market, generation)
+            self._futures = [market]
+            for page, args in hot_jobs(now):
+                self._futures.append(self._executor.submit(self._run, generation, page, args))
+            self._stats["scheduled"] += len(self._futures)
+        logger_util.info(f"Запущен пересчет ответов №{generation}: {len(self._futures)} задач")
+        return generation
+
+    def _store(self, generation: int, key: tuple, value: Any) -> None:
+        with self._lock:
+            if generation != self._generation:
+                self._stats["discarded"] += 1
+                return
+            self._results[key] = value
+            self._stats["completed"] += 1
+
+    def _market(self, generation: int) -> None:
+        # Фоновые запросы акций уступают квоту Alpha Vantage запросам пользователей
+        stocks = views.stocks_prices(priority=BACKGROUND, timeout=MARKET_TIMEOUT)
+        self._store(generation, ("market",), {"currency_rates": views.currency_rates(), "stock_prices": stocks})
+
+    def _run(self, generation: int, page: str, args: tuple) -> None:
+        if generation != self._generation:
+            with self._lock:
+                self._stats["discarded"] += 1
+            return
+        try:
+            if page in views.OPERATION_SECTIONS:
+                value = views.compute_sections(views.page_operations(*args), views.OPERATION_SECTIONS[page])
+            else:
+                value = {"cashback": compute_cashback(views.statement(), *args)}
+        except Exception as e:
+            logger_util.error(f"Ошибка фонового расчета {page}{args}: {e}")
+            return
+        self._store(generation, self._key(page, args), value)
+
+    def _cached(self, page: str, args: tuple) -> Any:
+        with self._lock:
+            current = self._stamp is not None and self._stamp == source_stamp(self.watched)
+            value = self._results.get(self._key(page, args)) if current else None
+            market = self._results.get(("market",)) if current else None
+            if value is None or (page != "cashback" and market is None):
+                self._stats["misses"] += 1
+                return None
+            self._stats["hits"] += 1
+            if page == "cashback" or market is None:
+                return value
+            return {**value, **market}
+
+    def answer_main(self, start_date_str: str, diapason: str = "M", currency: str = BASE_CURRENCY) -> str:
+        """Ответ страницы "Главная" (как views.json_answer_main), по возможности из готового результата"""
+        cached = self._cached("main", (start_date_str, diapason, currency))
+        if cached is None:
+            return views.json_answer_main(start_date_str, diapason, currency)
+        sections = {key: value for key, value in cached.items() if key not in ("currency_rates", "stock_prices")}
+        answer_dict = {
+            "greeting": views.greeting(),
+            **sections,
+            "currency_rates": cached["currency_rates"],
+            "stock_prices": cached["stock_prices"],
+        }
+        return views.save_answer(answer_dict, "answer_main.json")
+
+    def answer_events(self, start_date_str: str, diapason: str = "M", currency: str = BASE_CURRENCY) -> str:
+        """Ответ страницы "События" (как views.json_answer_events), по возможности из готового результата"""
+        cached = self._cached("events", (start_date_str, diapason, currency))
+        if cached is None:
+            return views.json_answer_events(start_date_str, diapason, currency)
+        return views.save_answer(cached, "answer_events.json")
+
+    def answer_cashback(self, year_str: str, month_str: str) -> str:
+        """Ответ страницы "Сервисы" (как views.json_answer_cashback), по возможности из готового результата"""
+        cached = self._cached("cashback", (year_str, month_str))
+        if cached is None:
+            return views.json_answer_cashback(year_str, month_str)
+        return views.save_answer(cached, "answer_events.json")
+
+    def wait(self, timeout: float | None = None) -> None:
+        """Ожидает завершения задач текущего пересчета"""
+        with self._lock:
+            futures = list(self._futures)
+        for future in futures:
+            if not future.cancelled():
+                future.exception(timeout)
+
+    def _loop(self, poll: float) -> None:
+        while not self._stop.is_set():
+            try:
+                if self.due():
+                    self.refresh()
+            except Exception as e:
+                logger_util.error(f"Ошибка планировщика фонового расчета: {e}")
+            self._stop.wait(poll)
+
+    def start(self, poll: float = POLL_INTERVAL) -> "PrecomputeScheduler":
+        """Запускает фоновый поток, который проверяет файлы каждые poll секунд"""
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, args=(poll,), daemon=True, name="precompute-scheduler")
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        """Останавливает планировщик и отменяет незапущенные задачи"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self._executor.shutdown(wait=True, cancel_futures=True)
+
+    def stats(self) -> dict[str, int]:
+        """Счетчики: запланировано, выполнено, отменено, отброшено задач; попадания и промахи ответов"""
+        with self._lock:
+            return dict(self._stats)
@@ -0,0 +1,359 @@
+import copy
+import logging
+from datetime import datetime
+from typing import Any, Union
+
+import numpy as np
+import pandas as pd
+
+from src.config import logs_path
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+except ImportError:  # без pyarrow даты разбираются через pandas
+    pa = None
+    pc = None
+
+logging.basicConfig(
+    filename=f"{logs_path}/logs.log",
+    encoding="utf-8",
+    filemode="w",
+    level=logging.DEBUG,
+    format="%(asctime)s - %(filename)s - %(levelname)s: %(message)s",
+)
+
+logger_util = logging.getLogger("app.query")
+
+DATE_COLUMN = "Дата операции"
+DATE_FORMAT = "%d.%m.%Y %H:%M:%S"
+
+AGGREGATION_BACKENDS = ("pandas", "numpy")
+_settings = {"aggregation_backend": "pandas"}
+
+_OPERATORS = {
+    "<": lambda column, value: column < value,
+    "<=": lambda column, value: column <= value,
+    ">": lambda column, value: column > value,
+    ">=": lambda column, value: column >= value,
+    "==": lambda column, value: column == value,
+    "!=": lambda column, value: column != value,
+    "in": lambda column, value: column.isin(value),
+}
+
+
+def partial_argsort(values: np.ndarray, count: int, ascending: bool = True) -> np.ndarray:
+    """
+    Функция, которая возвращает позиции count наименьших (наибольших при ascending=False)
+    значений в порядке сортировки. Вместо полной сортировки используется argpartition,
+    сортируются только отобранные значения; при равенстве выигрывает более ранняя позиция.
+    Пропуски (NaN/NaT) идут после всех значений в порядке позиций, как na_position="last" в pandas.
+    """
+    keys = np.asarray(values)
+    if keys.dtype.kind == "M":
+        valid = ~np.isnat(keys)
+        keys = keys.view("int64")
+    elif keys.dtype.kind == "f":
+        valid = ~np.isnan(keys)
+    elif keys.dtype.kind in "bu":
+        keys = keys.astype("int64")
+        valid = np.ones(len(keys), dtype=bool)
+    else:
+        valid = np.ones(len(keys), dtype=bool)
+    positions = np.flatnonzero(valid)
+    missing = np.flatnonzero(~valid)
+    keys = keys[positions]
+    if not ascending:
+        keys = -keys
+    if count <= 0:
+        return positions[:0]
+    if count < len(keys):
+        kth = keys[np.argpartition(keys, count - 1)[count - 1]]
+        below = np.flatnonzero(keys < kth)
+        equal = np.flatnonzero(keys == kth)[: count - len(below)]
+        selected = np.concatenate([below, equal])
+    else:
+        selected = np.arange(len(keys))
+    order = selected[np.lexsort((selected, keys[selected]))]
+    result: np.ndarray = np.concatenate([positions[order], missing[: count - len(order)]])
+    return result
+
+
+def set_aggregation_backend(backend: str) -> None:
+    """Функция, которая выбирает движок группировки по умолчанию (pandas или numpy)"""
+    if backend not in AGGREGATION_BACKENDS:
+        raise ValueError(f"Неизвестный движок группировки: {backend}")
+    _settings["aggregation_backend"] = backend
+
+
+def get_aggregation_backend() -> str:
+    """Функция, которая возвращает движок группировки по умолчанию"""
+    return _settings["aggregation_backend"]
+
+
+def _group_codes(column: pd.Series, rows: np.ndarray) -> tuple[np.ndarray, pd.Index]:
+    """Целочисленные коды групп (-1 для пропусков) и отсортированные значения ключа"""
+    if isinstance(column.dtype, pd.CategoricalDtype):
+        codes = column.array.codes[rows].astype("int64")
+        present = codes >= 0
+        used = np.flatnonzero(np.bincount(codes[present], minlength=len(column.cat.categories)))
+        remap = np.full(len(column.cat.categories), -1, dtype="int64")
+        remap[used] = np.arange(len(used))
+        return np.where(present, remap[np.where(present, codes, 0)], -1), column.cat.categories[used]
+    codes, uniques = pd.factorize(column.to_numpy()[rows], sort=True)
+    return codes.astype("int64"), pd.Index(uniques)
+
+
+def group_aggregate_numpy(
+    df: pd.DataFrame, rows: np.ndarray, keys: list[str], aggregations: dict[str, str]
+) -> pd.DataFrame:
+    """
+    Функция группировки на целочисленных кодах групп: суммы и количества считаются через
+    np.bincount, минимумы и максимумы - через reduceat по отсортированным кодам.
+    Результат совпадает с df.groupby(keys).agg(aggregations).reset_index().
+    """
+    factorized = [_group_codes(df[key], rows) for key in keys]
+    valid = np.ones(len(rows), dtype=bool)
+    for codes, _ in factorized:
+        valid &= codes >= 0
+    if len(keys) == 1:
+        group_codes = factorized[0][0][valid]
+        key_positions = [np.arange(len(factorized[0][1]))]
+    else:
+        combined = np.ravel_multi_index(
+            [codes[valid] for codes, _ in factorized], [max(len(uniques), 1) for _, uniques in factorized]
+        )
+        group_codes, combined_uniques = pd.factorize(combined, sort=True)
+        key_positions = list(np.unravel_index(combined_uniques, [max(len(u), 1) for _, u in factorized]))
+    size = len(key_positions[0])
+    result = {key: uniques[positions] for key, (_, uniques), positions in zip(keys, factorized, key_positions)}
+    for column, func in aggregations.items():
+        raw = df[column].to_numpy()[rows][valid]
+        values = raw.astype("float64")
+        present = ~np.isnan(values)
+        if func in ("sum", "mean", "count"):
+            sums = np.bincount(group_codes, weights=np.where(present, values, 0.0), minlength=size)
+            counts = np.bincount(group_codes[present], minlength=size)
+            if func == "sum":
+                result[column] = sums.round().astype(raw.dtype) if raw.dtype.kind in "iu" else sums
+            elif func == "count":
+                result[column] = counts.astype("int64")
+            else:
+                result[column] = np.divide(sums, counts, out=np.full(size, np.nan), where=counts > 0)
+        elif func in ("min", "max"):
+            order = np.argsort(group_codes, kind="stable")
+            starts = np.flatnonzero(np.r_[True, np.diff(group_codes[order]) != 0]) if size else order
+            reduce = np.fmin if func == "min" else np.fmax
+            result[column] = reduce.reduceat(values[order], starts) if size else np.empty(0)
+        else:
+            raise ValueError(f"Агрегат {func} не поддерживается движком numpy")
+    return pd.DataFrame(result).reset_index(drop=True)
+
+
+def parse_dates(column: pd.Series) -> pd.Series:
+    """Функция, приводящая колонку с датами операций к типу datetime (если она еще не приведена)"""
+    if pd.api.types.is_datetime64_any_dtype(column):
+        return column
+    if isinstance(column.dtype, pd.CategoricalDtype):
+        # в снимке даты хранятся категориями: разбираются только уникальные значения, код -1 дает NaT
+        categories = parse_dates(pd.Series(column.cat.categories)).to_numpy()
+        values = np.append(categories, np.array("NaT", dtype=categories.dtype))[column.cat.codes.to_numpy()]
+        return pd.Series(values, index=column.index, name=column.name)
+    if pa is not None and isinstance(column.dtype, pd.StringDtype) and column.dtype.storage == "pyarrow":
+        # строки уже лежат в Arrow: разбор без создания Python-строк на каждую операцию
+        try:
+            dates = pc.strptime(pa.array(column), format=DATE_FORMAT, unit="us")
+            return pd.Series(dates.to_numpy(zero_copy_only=False), index=column.index, name=column.name)
+        except pa.ArrowInvalid:
+            pass
+    return pd.to_datetime(column, format=DATE_FORMAT)
+
+
+class TransactionQuery:
+    """
+    Ленивый запрос к таблице операций.
+    Шаги filter/between/search/group/aggregate/project/sort/limit только записываются в план,
+    все условия сливаются в одну маску, а из исходной таблицы копируются лишь нужные
+    колонки отобранных строк - и только при вызове collect().
+    """
+
+    def __init__(self, df: pd.DataFrame) -> None:
+        self._df = df
+        self._predicates: list[tuple[str, str, Any]] = []
+        self._searches: list[tuple[tuple[str, ...], str, bool, bool]] = []
+        self._window: tuple[datetime, datetime] | None = None
+        self._columns: list[str] | None = None
+        self._group: list[str] = []
+        self._aggregations: dict[str, str] = {}
+        self._sort: tuple[str, bool] | None = None
+        self._limit: int | None = None
+        self._backend: str | None = None
+        self._cache: dict[str, Any] = {}
+
+    @property
+    def frame(self) -> pd.DataFrame:
+        """Исходная таблица, над которой построен запрос"""
+        return self._df
+
+    def dates(self) -> pd.Series:
+        """Колонка дат операций, разобранная один раз на все производные запросы"""
+        if "dates" not in self._cache:
+            self._cache["dates"] = parse_dates(self._df[DATE_COLUMN])
+        return self._cache["dates"]
+
+    def _derive(self) -> "TransactionQuery":
+        query = copy.copy(self)
+        query._predicates = list(self._predicates)
+        query._searches = list(self._searches)
+        query._group = list(self._group)
+        query._aggregations = dict(self._aggregations)
+        return query
+
+    def filter(self, column: str, operator: str, value: Any) -> "TransactionQuery":
+        """Добавляет условие вида <колонка> <оператор> <значение>"""
+        if operator not in _OPERATORS:
+            raise ValueError(f"Неизвестный оператор фильтра: {operator}")
+        query = self._derive()
+        query._predicates.append((column, operator, value))
+        return query
+
+    def between(self, start_date: datetime, end_date: datetime) -> "TransactionQuery":
+        """Ограничивает операции промежутком [start_date, end_date]"""
+        query = self._derive()
+        if query._window is not None:
+            start_date = max(start_date, query._window[0])
+            end_date = min(end_date, query._window[1])
+        query._window = (start_date, end_date)
+        return query
+
+    def search(
+        self, columns: tuple[str, ...], pattern: str, case: bool = False, regex: bool = True
+    ) -> "TransactionQuery":
+        """Оставляет операции, в которых хотя бы одна из колонок содержит шаблон"""
+        query = self._derive()
+        query._searches.append((tuple(columns), pattern, case, regex))
+        return query
+
+    def project(self, *columns: str) -> "TransactionQuery":
+        """Оставляет в результате только перечисленные колонки"""
+        query = self._derive()
+        query._columns = list(columns)
+        return query
+
+    def group(self, *keys: str) -> "TransactionQuery":
+        """Группирует операции по колонкам"""
+        query = self._derive()
+        query._group = list(keys)
+        return query
+
+    def aggregate(self, column: str, func: str = "sum") -> "TransactionQuery":
+        """Добавляет агрегат колонки (sum, count, mean, min, max) для сгруппированного запроса"""
+        query = self._derive()
+        query._aggregations[column] = func
+        return query
+
+    def sort(self, column: str, ascending: bool = True) -> "TransactionQuery":
+        """Упорядочивает строки результата по колонке"""
+        query = self._derive()
+        query._sort = (column, ascending)
+        return query
+
+    def limit(self, count: int) -> "TransactionQuery":
+        """Ограничивает число строк результата"""
+        query = self._derive()
+        query._limit = count
+        return query
+
+    def using(self, backend: str | None) -> "TransactionQuery":
+        """Выбирает движок группировки (pandas или numpy) для этого запроса"""
+        if backend is not None and backend not in AGGREGATION_BACKENDS:
+            raise ValueError(f"Неизвестный движок группировки: {backend}")
+        query = self._derive()
+        query._backend = backend
+        return query
+
+    def mask(self) -> np.ndarray:
+        """Единая булева маска всех условий запроса"""
+        df = self._df
+        mask = np.ones(len(df), dtype=bool)
+        for column, operator, value in self._predicates:
+            mask &= np.asarray(_OPERATORS[operator](df[column], value).fillna(False), dtype=bool)
+        if self._window is not None:
+            dates = self.dates()
+            start_date, end_date = self._window
+            mask &= np.asarray(dates.between(start_date, end_date), dtype=bool)
+        for columns, pattern, case, regex in self._searches:
+            found = np.zeros(len(df), dtype=bool)
+            for column in columns:
+                found |= np.asarray(df[column].str.contains(pattern, case=case, regex=regex, na=False), dtype=bool)
+            mask &= found
+        return mask
+
+    def _needed_columns(self) -> list[str]:
+        if self._group:
+            needed = self._group + list(self._aggregations)
+        elif self._columns is not None:
+            needed = list(self._columns)
+        else:
+            needed = list(self._df.columns)
+        if not self._group and self._sort is not None and self._sort[0] not in needed:
+            needed.append(self._sort[0])
+        return needed
+
+    def _ordered_rows(self, rows: np.ndarray) -> np.ndarray:
+        if self._sort is None:
+            return rows
+        column, ascending = self._sort
+        if column == DATE_COLUMN:
+            values = self.dates().to_numpy()[rows]
+        else:
+            values = self._df[column].to_numpy()[rows]
+        if values.dtype.kind in "biufM":
+            count = len(values) if self._limit is None else self._limit
+            selected: np.ndarray = rows[partial_argsort(values, count, ascending)]
+            return selected
+        order = pd.Series(values).sort_values(ascending=ascending, kind="stable", na_position="last").index
+        ordered: np.ndarray = rows[order.to_numpy()]
+        return ordered
+
+    def collect(self) -> pd.DataFrame:
+        """Выполняет запрос и возвращает итоговую (небольшую) таблицу"""
+        logger_util.info("Выполнение запроса к таблице операций")
+        rows = np.flatnonzero(self.mask())
+        if not self._group:
+            rows = self._ordered_rows(rows)
+            if self._limit is not None:
+                rows = rows[: self._limit]
+        needed = self._needed_columns()
+        if self._group:
+            if (self._backend or get_aggregation_backend()) == "numpy":
+                result = group_aggregate_numpy(self._df, rows, self._group, self._aggregations)
+            else:
+                result = self._df.iloc[rows, [self._df.columns.get_loc(column) for column in needed]]
+                result = result.groupby(self._group)[list(self._aggregations)].agg(self._aggregations).reset_index()
+            if self._sort is not None:
+                column, ascending = self._sort
+                result = result.sort_values(by=column, ascending=ascending, kind="stable")
+            if self._limit is not None:
+                result = result[: self._limit]
+        else:
+            result = self._df.iloc[rows, [self._df.columns.get_loc(column) for column in needed]]
+            if self._columns is not None:
+                result = result.loc[:, self._columns]
+        logger_util.info(f"Запрос выполнен, строк в результате: {len(result)}")
+        return result
+
+
+Source = Union[pd.DataFrame, TransactionQuery]
+
+
+def as_query(data: Source) -> TransactionQuery:
+    """Функция, которая принимает таблицу операций или запрос и возвращает запрос"""
+    if isinstance(data, TransactionQuery):
+        return data
+    return TransactionQuery(data)
+
+
+def json_ready(df: pd.DataFrame) -> pd.DataFrame:
+    """Функция, заменяющая пропуски на None в (уже отобранном) результате для выгрузки в JSON"""
+    return df.astype(object).where(pd.notnull(df), None)
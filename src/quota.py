@@ -0,0 +1,323 @@
+import heapq
+import itertools
+import logging
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+from contextlib import contextmanager
+from typing import Callable, Iterator
+
+from dotenv import load_dotenv
+
+from src.config import logs_path
+
+load_dotenv()
+
+logging.basicConfig(
+    filename=f"{logs_path}/logs.log",
+    encoding="utf-8",
+    filemode="w",
+    level=logging.DEBUG,
+    format="%(asctime)s - %(filename)s - %(levelname)s: %(message)s",
+)
+
+logger_util = logging.getLogger("app.quota")
+
+INTERACTIVE = 0
+BACKGROUND = 1
+DEFAULT_USER = "default"
+MINUTE = 60.0
+DAY = 86400.0
+# Бесплатный ключ Alpha Vantage: 5 запросов в минуту и 25 в день; 0 - без ограничения
+DEFAULT_PER_MINUTE = int(os.getenv("ALPHA_VANTAGE_PER_MINUTE", "5"))
+DEFAULT_PER_DAY = int(os.getenv("ALPHA_VANTAGE_PER_DAY", "25"))
+DEFAULT_TIMEOUT = float(os.getenv("ALPHA_VANTAGE_TIMEOUT", "10"))
+
+
+class QuotaExceeded(RuntimeError):
+    """Запрос отброшен: квота поставщика не освободится до его крайнего срока"""
+
+
+class TokenBucket:
+    """
+    Корзина маркеров: вмещает capacity маркеров и пополняется равномерно,
+    capacity маркеров за period секунд. Каждый запрос к поставщику забирает один маркер.
+    """
+
+    def __init__(self, capacity: int, period: float, clock: Callable[[], float] = time.monotonic) -> None:
+        if capacity <= 0 or period <= 0:
+            raise ValueError(f"Некорректный лимит: {capacity} за {period} с")
+        self.capacity = capacity
+        self.rate = capacity / period
+        self._clock = clock
+        self._tokens = float(capacity)
+        self._updated = clock()
+
+    def _refill(self) -> None:
+        now = self._clock()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def wait_time(self) -> float:
+        """Через сколько секунд появится маркер (0 - есть сейчас)"""
+        self._refill()
+        return 0.0 if self._tokens >= 1 else (1 - self._tokens) / self.rate
+
+    def take(self) -> None:
+        """Забирает маркер (его наличие проверяется через wait_time)"""
+        self._refill()
+        self._tokens -= 1
+
+    def drain(self) -> None:
+        """Обнуляет корзину: поставщик сообщил о превышении лимита"""
+        self._refill()
+        self._tokens = min(self._tokens, 0.0)
+
+    def export(self) -> tuple[float, float]:
+        """Число маркеров и время последнего пополнения по часам системы (для хранения вне процесса)"""
+        return self._tokens, time.time() - (self._clock() - self._updated)
+
+    def restore(self, tokens: float, updated: float) -> None:
+        """Восстанавливает корзину из export(), в том числе сохраненной другим процессом"""
+        self._tokens = min(tokens, float(self.capacity))
+        self._updated = self._clock() - max(time.time() - updated, 0.0)
+
+
+class SharedQuotaState:
+    """
+    Состояние корзин маркеров в SQLite (path): корзины делят все процессы, которые работают с одним
+    ключом, а дневная квота не восстанавливается при перезапуске. Маркеры хранятся вместе со временем
+    последнего пополнения по часам системы и на время одной операции планировщика блокируются
+    транзакцией, поэтому два процесса не получат один и тот же маркер.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._connection: sqlite3.Connection | None = None
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._connection is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            self._connection = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS buckets "
+                "(name TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL)"
+            )
+        return self._connection
+
+    @contextmanager
+    def synced(self, buckets: dict[str, TokenBucket]) -> Iterator[None]:
+        """Загружает корзины из базы на время операции и записывает их обратно одной транзакцией"""
+        connection = self._connect()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            for name, tokens, updated in connection.execute("SELECT name, tokens, updated FROM buckets"):
+                if name in buckets:
+                    buckets[name].restore(tokens, updated)
+            yield
+            connection.executemany(
+                "INSERT OR REPLACE INTO buckets (name, tokens, updated) VALUES (?, ?, ?)",
+                [(name, *bucket.export()) for name, bucket in buckets.items()],
+            )
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+
+    def close(self) -> None:
+        """Закрывает соединение с базой"""
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+
+class _Request:
+    __slots__ = ("future", "user", "priority", "deadline")
+
+    def __init__(self, user: str, priority: int, deadline: float | None) -> None:
+        self.future: Future = Future()
+        self.user = user
+        self.priority = priority
+        self.deadline = deadline
+
+
+class QuotaScheduler:
+    """
+    Планировщик запросов к поставщику с лимитами per_minute в минуту и per_day в день
+    (None или 0 - без ограничения). Запрос получает разрешение, когда в обеих корзинах есть маркер:
+    сначала интерактивные (INTERACTIVE), затем фоновые (BACKGROUND); внутри приоритета пользователи
+    обслуживаются по очереди, так что длинный список одного не задерживает других. Запрос, крайний срок
+    которого наступит раньше, чем освободится квота, сразу отбрасывается с QuotaExceeded.
+    Если задан state_path, корзины хранятся в SQLite (SharedQuotaState) и общие для всех процессов.
+    time_scale сжимает минуту и день (для проверок на заглушке поставщика).
+    """
+
+    def __init__(
+        self,
+        per_minute: int | None = DEFAULT_PER_MINUTE,
+        per_day: int | None = DEFAULT_PER_DAY,
+        time_scale: float = 1.0,
+        clock: Callable[[], float] = time.monotonic,
+        state_path: str | None = None,
+    ) -> None:
+        self._clock = clock
+        self._minute = TokenBucket(per_minute, MINUTE * time_scale, clock) if per_minute else None
+        self._day = TokenBucket(per_day, DAY * time_scale, clock) if per_day else None
+        self._named = {
+            name: bucket for name, bucket in (("minute", self._minute), ("day", self._day)) if bucket is not None
+        }
+        self._buckets = list(self._named.values())
+        self._state = SharedQuotaState(state_path) if state_path is not None and self._buckets else None
+        # Корзины и общее состояние защищены отдельно от очереди: ожидание блокировки SQLite
+        # другим процессом не задерживает постановку запросов в очередь
+        self._buckets_lock = threading.Lock()
+        self._condition = threading.Condition()
+        self._queue: list[tuple[int, int, int, _Request]] = []
+        self._sequence = itertools.count()
+        self._round = {INTERACTIVE: 0, BACKGROUND: 0}
+        self._user_rounds: dict[tuple[int, str], int] = {}
+        self._thread: threading.Thread | None = None
+        self._closed = False
+        self._stats = {"submitted": 0, "granted": 0, "dropped": 0, "limited": 0}
+
+    def submit(self, user: str = DEFAULT_USER, priority: int = INTERACTIVE, timeout: float | None = None) -> Future:
+        """
+        Ставит запрос в очередь и возвращает Future, который завершается, когда запрос можно
+        выполнить, или ошибкой QuotaExceeded, если за timeout секунд квота не освободится
+        """
+        request = _Request(user, priority, None if timeout is None else self._clock() + timeout)
+        with self._condition:
+            if self._closed:
+                raise RuntimeError("Планировщик квоты остановлен")
+            # Очередной запрос пользователя попадает в следующий круг обслуживания его приоритета
+            key = (priority, user)
+            tag = max(self._user_rounds.get(key, 0), self._round.get(priority, 0)) + 1
+            self._user_rounds[key] = tag
+            heapq.heappush(self._queue, (priority, tag, next(self._sequence), request))
+            self._stats["submitted"] += 1
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._dispatch, daemon=True, name="quota-scheduler")
+                self._thread.start()
+            self._condition.notify()
+        return request.future
+
+    def acquire(self, user: str = DEFAULT_USER, priority: int = INTERACTIVE, timeout: float | None = None) -> None:
+        """Ждет разрешения на запрос к поставщику; QuotaExceeded - если квота не освободится за timeout секунд"""
+        self.submit(user, priority, timeout).result()
+
+    def report_limited(self, daily: bool = False) -> None:
+        """
+        Поставщик ответил превышением лимита: до пополнения минутной корзины (при daily=True -
+        и дневной) новые разрешения не выдаются
+        """
+        with self._buckets_lock, self._synced():
+            for bucket in (self._minute, self._day if daily else None):
+                if bucket is not None:
+                    bucket.drain()
+        with self._condition:
+            self._stats["limited"] += 1
+        logger_util.info(f"Поставщик сообщил о превышении {'дневного ' if daily else ''}лимита запросов")
+
+    @contextmanager
+    def _synced(self) -> Iterator[None]:
+        if self._state is None:
+            yield
+            return
+        with self._state.synced(self._named):
+            yield
+
+    def _take(self) -> float:
+        # Забирает маркер из всех корзин, если он есть везде; возвращает, сколько ждать маркера (0 - забран)
+        with self._buckets_lock, self._synced():
+            wait = max((bucket.wait_time() for bucket in self._buckets), default=0.0)
+            if wait == 0:
+                for bucket in self._buckets:
+                    bucket.take()
+            return wait
+
+    def _drop_hopeless(self, wait: float) -> None:
+        now = self._clock()
+        kept = []
+        for entry in self._queue:
+            request = entry[3]
+            if request.future.cancelled():
+                continue
+            if request.deadline is not None and request.deadline < now + wait:
+                if request.future.set_running_or_notify_cancel():
+                    request.future.set_exception(
+                        QuotaExceeded(f"Квота не освободится за отведенное время ({wait:.1f} с)")
+                    )
+                    self._stats["dropped"] += 1
+                continue
+            kept.append(entry)
+        if len(kept) != len(self._queue):
+            heapq.heapify(kept)
+            self._queue = kept
+
+    def _dispatch(self) -> None:
+        # Первый запрос очереди извлекается под условием, а маркер берется уже без него; если маркера нет,
+        # запрос возвращается на прежнее место, а запросы, которые не дождутся маркера, отбрасываются.
+        # Запрос, для которого маркер есть сразу, выдается без проверки крайнего срока (в том числе timeout=0)
+        while True:
+            with self._condition:
+                while not self._closed and not self._queue:
+                    self._condition.wait()
+                if self._closed:
+                    return
+                entry = heapq.heappop(self._queue)
+            priority, tag, _, request = entry
+            if request.future.cancelled():
+                continue
+            wait = self._take()
+            with self._condition:
+                if wait == 0:
+                    if request.future.set_running_or_notify_cancel():
+                        self._round[priority] = tag
+                        self._stats["granted"] += 1
+                        request.future.set_result(None)
+                    continue
+                if self._closed:
+                    if request.future.set_running_or_notify_cancel():
+                        request.future.set_exception(QuotaExceeded("Планировщик квоты остановлен"))
+                    return
+                heapq.heappush(self._queue, entry)
+                self._drop_hopeless(wait)
+                if self._queue:
+                    self._condition.wait(wait)
+
+    def close(self) -> None:
+        """Останавливает планировщик; ожидающие запросы завершаются ошибкой QuotaExceeded"""
+        with self._condition:
+            self._closed = True
+            for *_, request in self._queue:
+                if request.future.set_running_or_notify_cancel():
+                    request.future.set_exception(QuotaExceeded("Планировщик квоты остановлен"))
+            self._queue = []
+            self._condition.notify_all()
+        if self._thread is not None:
+            self._thread.join()
+        if self._state is not None:
+            with self._buckets_lock:
+                self._state.close()
+
+    def stats(self) -> dict[str, int]:
+        """Счетчики: поставлено в очередь, разрешено, отброшено по сроку, ответов о превышении лимита"""
+        with self._condition:
+            return dict(self._stats)
+
+
+def is_rate_limited(data: object) -> bool:
+    """Функция, которая определяет ответ Alpha Vantage о превышении лимита (Note или Information без данных)"""
+    return isinstance(data, dict) and "Global Quote" not in data and ("Note" in data or "Information" in data)
+
+
+def is_daily_limit(data: object) -> bool:
+    """Функция, которая определяет ответ Alpha Vantage об исчерпании дневной квоты (Information о запросах в день)"""
+    message = data.get("Information") if isinstance(data, dict) and is_rate_limited(data) else None
+    return isinstance(message, str) and "per day" in message
+
+
+# Общие для процессов корзины включаются путем к файлу SQLite в ALPHA_VANTAGE_QUOTA_FILE (.env)
+stock_quota = QuotaScheduler(state_path=os.getenv("ALPHA_VANTAGE_QUOTA_FILE") or None)
@@ -0,0 +1,239 @@
+import json
+import logging
+import os
+import threading
+import time
+import xml.etree.ElementTree as ET
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+import requests
+
+from src.config import logs_path, rates_file
+from src.query import parse_dates
+from src.utils import CBR_DAILY_URL
+
+logging.basicConfig(
+    filename=f"{logs_path}/logs.log",
+    encoding="utf-8",
+    filemode="w",
+    level=logging.DEBUG,
+    format="%(asctime)s - %(filename)s - %(levelname)s: %(message)s",
+)
+
+logger_util = logging.getLogger("app.rates")
+
+BASE_CURRENCY = "RUB"
+RATES_COLUMNS = ["date", "currency", "rate"]
+CBR_DYNAMIC_URL = "https://www.cbr.ru/scripts/XML_dynamic.asp"
+# ЦБ не публикует курсы в выходные и праздники (в январе - до 10 дней подряд): ряд запрашивается
+# с запасом, чтобы у самой ранней операции выписки был предшествующий курс
+RATES_LOOKBACK_DAYS = 14
+# После неудачного обновления курсов сеть не опрашивается повторно на каждом запросе страницы
+RETRY_INTERVAL = 300.0
+
+_failures: dict[str, float] = {}
+# Коды валют, которых нет в справочнике ЦБ: для них курсы больше не запрашиваются
+_unknown_currencies: set[str] = set()
+_failures_lock = threading.Lock()
+
+
+def load_rates(path: str = rates_file) -> pd.DataFrame:
+    """Функция, которая читает локальный ряд курсов ЦБ (дата, валюта, курс за 1 единицу в рублях)"""
+    logger_util.info(f"Чтение локального хранилища курсов {path}")
+    if not os.path.exists(path):
+        return pd.DataFrame({"date": pd.Series(dtype="datetime64[ns]"), "currency": [], "rate": []})
+    rates = pd.read_csv(path, parse_dates=["date"])
+    return rates.loc[:, RATES_COLUMNS]
+
+
+def _coverage_path(path: str) -> str:
+    return f"{os.path.splitext(path)[0]}_coverage.json"
+
+
+def load_coverage(path: str = rates_file) -> dict[str, tuple[datetime, datetime]]:
+    """Функция, которая читает уже загруженные периоды курсов по каждой валюте"""
+    try:
+        with open(_coverage_path(path), "r", encoding="utf-8") as json_file:
+            content = json.load(json_file)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+    return {
+        currency: (datetime.fromisoformat(first), datetime.fromisoformat(last))
+        for currency, (first, last) in content.items()
+    }
+
+
+def _write_atomic(path: str, content: str) -> None:
+    temporary = f"{path}.tmp{os.getpid()}"
+    with open(temporary, "w", encoding="utf-8") as f:
+        f.write(content)
+    os.replace(temporary, path)
+
+
+def cbr_currency_ids() -> dict[str, str]:
+    """Функция, которая возвращает внутренние коды ЦБ валют (USD -> R01235)"""
+    data = requests.get(CBR_DAILY_URL, timeout=10).json()
+    return {code: value["ID"] for code, value in data["Valute"].items()}
+
+
+def fetch_rates(currency_id: str, currency: str, start_date: datetime, end_date: datetime) -> pd.DataFrame:
+    """Функция получения всех курсов валюты за период одним запросом к ЦБ"""
+    logger_util.info(f"Запрос курсов {currency} за {start_date:%d.%m.%Y} - {end_date:%d.%m.%Y}")
+    params = {
+        "date_req1": start_date.strftime("%d/%m/%Y"),
+        "date_req2": end_date.strftime("%d/%m/%Y"),
+        "VAL_NM_RQ": currency_id,
+    }
+    response = requests.get(CBR_DYNAMIC_URL, params=params, timeout=30)
+    root = ET.fromstring(response.content)
+    records = [
+        {
+            "date": datetime.strptime(record.attrib["Date"], "%d.%m.%Y"),
+            "currency": currency,
+            "rate": float(record.findtext("Value", "0").replace(",", "."))
+            / float(record.findtext("Nominal", "1").replace(",", ".")),
+        }
+        for record in root.iter("Record")
+    ]
+    return pd.DataFrame(records, columns=RATES_COLUMNS)
+
+
+def update_rates(
+    currencies: list[str], start_date: datetime, end_date: datetime, path: str = rates_file
+) -> pd.DataFrame:
+    """
+    Функция, которая дополняет локальный ряд курсов до периода [start_date, end_date].
+    Для каждой валюты запрашиваются только недостающие начало и хвост ряда
+    (по одному запросу на отрезок), уже сохраненная история повторно не скачивается.
+    """
+    logger_util.info("Запуск функции обновления локального хранилища курсов")
+    rates = load_rates(path)
+    coverage = load_coverage(path)
+    missing = []
+    for currency in dict.fromkeys(currencies):
+        if currency == BASE_CURRENCY or currency in _unknown_currencies:
+            continue
+        if currency not in coverage:
+            missing.append((currency, start_date, end_date))
+            continue
+        first, last = coverage[currency]
+        if start_date < first:
+            missing.append((currency, start_date, first - timedelta(days=1)))
+        if end_date > last:
+            missing.append((currency, last + timedelta(days=1), end_date))
+    if not missing:
+        logger_util.info("Локальное хранилище курсов актуально")
+        return rates
+    with _failures_lock:
+        failed_at = _failures.get(path)
+    if failed_at is not None and time.monotonic() - failed_at < RETRY_INTERVAL:
+        logger_util.info("Курсы недавно не удалось обновить, используется локальное хранилище")
+        return rates
+    try:
+        currency_ids = cbr_currency_ids()
+        unknown = {currency for currency, _, _ in missing if currency not in currency_ids}
+        if unknown:
+            logger_util.warning(f"Валюты {', '.join(sorted(unknown))} нет в справочнике ЦБ, курсы не запрашиваются")
+            with _failures_lock:
+                _unknown_currencies.update(unknown)
+            missing = [item for item in missing if item[0] not in unknown]
+        fetched = [fetch_rates(currency_ids[currency], currency, first, last) for currency, first, last in missing]
+    except (requests.exceptions.RequestException, ET.ParseError, KeyError) as e:
+        logger_util.error(f"Ошибка обновления курсов валют. Код ошибки: {e}")
+        with _failures_lock:
+            _failures[path] = time.monotonic()
+        return rates
+    with _failures_lock:
+        _failures.pop(path, None)
+    rates = pd.concat([rates, *fetched], ignore_index=True)
+    rates = rates.drop_duplicates(subset=["date", "currency"]).sort_values(["currency", "date"])
+    # Файлы пишутся во временные и подменяются целиком: сбой не оставит наполовину записанный ряд
+    _write_atomic(path, rates.to_csv(index=False, date_format="%Y-%m-%d"))
+    # Сегодняшний курс может быть еще не опубликован, поэтому покрытие фиксируется до вчерашнего дня
+    yesterday = datetime.combine(datetime.now().date(), datetime.min.time()) - timedelta(days=1)
+    for currency, first, last in missing:
+        last = min(last, yesterday)
+        if currency in coverage:
+            first, last = min(first, coverage[currency][0]), max(last, coverage[currency][1])
+        coverage[currency] = (first, last)
+    _write_atomic(
+        _coverage_path(path),
+        json.dumps({key: [first.isoformat(), last.isoformat()] for key, (first, last) in coverage.items()}),
+    )
+    logger_util.info(f"Хранилище курсов обновлено, записей: {len(rates)}")
+    return rates.reset_index(drop=True)
+
+
+def rates_asof(rates: pd.DataFrame, dates: pd.Series, currencies: pd.Series) -> np.ndarray:
+    """
+    Функция, которая для каждой пары (дата, валюта) возвращает последний известный
+    на эту дату курс ЦБ (векторный as-of join). Для рублей курс равен 1.
+    """
+    request = pd.DataFrame({"date": dates.to_numpy(), "currency": currencies.to_numpy()})
+    request["position"] = np.arange(len(request))
+    request = request.dropna(subset=["date"]).sort_values("date")
+    table = rates.dropna().sort_values("date")
+    joined = pd.merge_asof(
+        request,
+        table.astype({"date": request["date"].dtype, "currency": request["currency"].dtype}),
+        on="date",
+        by="currency",
+        direction="backward",
+    )
+    result = np.full(len(dates), np.nan)
+    result[joined["position"].to_numpy()] = joined["rate"].to_numpy()
+    result[(currencies == BASE_CURRENCY).to_numpy()] = 1.0
+    return result
+
+
+def to_currency(
+    df: pd.DataFrame,
+    currency: str,
+    rates: pd.DataFrame | None = None,
+    amount_column: str = "Сумма платежа",
+    currency_column: str = "Валюта платежа",
+) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Функция, которая пересчитывает суммы операций в выбранную валюту по курсу ЦБ на дату
+    операции. Возвращает пару таблиц: пересчитанные операции (все итоги и разбивки по категориям
+    строятся уже в новой валюте) и операции, для которых курса нет (ЦБ недоступен или не знает валюту),
+    в исходной валюте - чтобы они не смешивались с пересчитанными суммами.
+    """
+    logger_util.info(f"Запуск функции пересчета операций в валюту {currency}")
+    if rates is None:
+        rates = load_rates()
+    dates = parse_dates(df["Дата операции"])
+    source_currencies = df[currency_column].fillna(BASE_CURRENCY)
+    to_rub = rates_asof(rates, dates, source_currencies)
+    from_rub = rates_asof(rates, dates, pd.Series(currency, index=df.index))
+    factor = to_rub / from_rub
+    factor[(source_currencies == currency).to_numpy()] = 1.0
+    missing = np.isnan(factor)
+    amounts = df[amount_column].to_numpy(dtype="float64")
+    converted = df.assign(**{amount_column: (amounts * factor).round(2), currency_column: currency})
+    if missing.any():
+        logger_util.warning(f"Нет курса для {int(missing.sum())} операций, они не пересчитаны в {currency}")
+    logger_util.info(f"Пересчет в валюту {currency} завершен")
+    return converted.loc[~missing], df.loc[missing]
+
+
+def normalize_currency(df: pd.DataFrame, currency: str = BASE_CURRENCY, path: str = rates_file) -> pd.DataFrame:
+    """
+    Функция, которая выражает все операции в выбранной валюте: при необходимости дополняет
+    локальный ряд курсов на период выписки (с запасом RATES_LOOKBACK_DAYS дней до первой операции)
+    и пересчитывает суммы по курсу на дату операции. Выписка, уже целиком выраженная в этой валюте,
+    возвращается без изменений и без обращения к курсам. Операции без курса в результат не попадают,
+    чтобы итоги не складывали суммы в разных валютах (их число записывается в лог как ошибка).
+    """
+    source = set(df["Валюта платежа"].fillna(BASE_CURRENCY).unique())
+    if df.empty or source <= {currency}:
+        return df
+    dates = parse_dates(df["Дата операции"])
+    start = dates.min().to_pydatetime() - timedelta(days=RATES_LOOKBACK_DAYS)
+    rates = update_rates([currency, *source], start, dates.max().to_pydatetime(), path)
+    converted, unconverted = to_currency(df, currency, rates)
+    if not unconverted.empty:
+        logger_util.error(f"Операции без курса исключены из пересчета в {currency}: {len(unconverted)}")
+    return converted
@@ -7,6 +7,7 @@ import pandas as pd
 from dateutil.relativedelta import relativedelta
 
 from src.config import logs_path, root_path
+from src.engines import engine_for
 
 logging.basicConfig(
     filename=logs_path / "logs.log",
@@ -78,15 +79,10 @@ def spending_by_category(transactions: pd.DataFrame, category: str, date: Option
         date_obj = datetime.datetime.strptime(date, "%Y-%m-%d %H:%M:%S")
     beginning_date = date_obj - relativedelta(months=3)
 
-    df_transactions_in_category = transactions[
-        (transactions["Статус"] == "OK")
-        & (transactions["Сумма платежа"] <= 0)
-        & (transactions["Категория"] == category)
-    ]
-    df_in_date = df_transactions_in_category[
-        (df_transactions_in_category["Дата операции"] >= beginning_date)
-        & (df_transactions_in_category["Дата операции"] <= date_obj)
-    ]
-    df_sum_in_category = df_in_date.groupby("Категория")
-    sum_transactions_in_category = df_sum_in_category["Сумма платежа"].sum()
+    engine = engine_for(transactions)
+    operations = engine.window(transactions, beginning_date, date_obj)
+    for column, op, value in (("Статус", "==", "OK"), ("Сумма платежа", "<=", 0), ("Категория", "==", category)):
+        operations = engine.filter(operations, column, op, value)
+    sums = engine.to_frame(engine.group_sum(operations, "Категория", "Сумма платежа"))
+    sum_transactions_in_category = sums.set_index("Категория")["Сумма платежа"]
     return sum_transactions_in_category
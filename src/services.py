@@ -1,11 +1,16 @@
+import base64
 import calendar
 import json
 import logging
+import re
+from typing import Any
 
-import pandas as pd
+import numpy as np
 
 from src.config import logs_path, root_path
-from src.utils import sorted_by_date
+from src.engines import Table, engine_for
+from src.query import DATE_COLUMN, Source, as_query, json_ready, parse_dates
+from src.utils import date_window
 
 logging.basicConfig(
     filename=f"{logs_path}/logs.log",
@@ -17,50 +22,162 @@ logging.basicConfig(
 
 logger_util = logging.getLogger("app.services")
 
+SEARCH_ORDERS = ("rank", "date", "amount")
+DEFAULT_PAGE_SIZE = 20
 
-def cashback(df: pd.DataFrame, year: str, month: str) -> str:
-    """Функция, подсчитывающая, сколько на каждой категории можно заработать кешбэка."""
-    logger_util.info("Запуск функции подсчета кэшбэка успешен")
-    df = df.where(pd.notnull(df), None)
+
+def compute_cashback(df: Table, year: str, month: str) -> str:
+    """
+    Функция, подсчитывающая, сколько на каждой категории можно заработать кешбэка,
+    без записи файла (для фоновых расчетов). Возвращает строку в формате JSON.
+    """
     _, last_day = calendar.monthrange(int(year), int(month))
     end_date = f"{year}-{month}-{last_day} 23:59:59"
-    df = sorted_by_date(df, end_date)
-    df = df[df["Статус"] == "OK"]
-    df = df[df["Кэшбэк"] > 0]
-    df = df.loc[:, ["Кэшбэк", "Категория"]].groupby("Категория").sum().reset_index()
-    df_list = df.to_dict(orient="records")
-    answer_string = json.dumps(df_list, ensure_ascii=False, indent=4)
+    engine = engine_for(df)
+    operations = engine.filter(engine.filter(date_window(df, end_date), "Статус", "==", "OK"), "Кэшбэк", ">", 0)
+    df_list = engine.to_records(engine.group_sum(operations, "Категория", "Кэшбэк"))
+    return json.dumps(df_list, ensure_ascii=False, indent=4)
+
+
+def cashback(df: Table, year: str, month: str) -> str:
+    """Функция, подсчитывающая, сколько на каждой категории можно заработать кешбэка."""
+    logger_util.info("Запуск функции подсчета кэшбэка успешен")
+    answer_string = compute_cashback(df, year, month)
     with open(f"{root_path}/data/cashback.json", "w", encoding="utf-8") as f:
         json.dump(answer_string, f, ensure_ascii=False, indent=4)
     logger_util.info("Файл cashback.json и подсчет кэшбэка сформирован успешно")
     return answer_string
 
 
-def search_word(df: pd.DataFrame, search_word_str: str) -> str | None:
-    """Функция поиска слова в описании или категории"""
+def _encode_cursor(order: str, key: list) -> str:
+    payload = json.dumps({"order": order, "key": key}).encode("utf-8")
+    return base64.urlsafe_b64encode(payload).decode("ascii")
+
+
+def _decode_cursor(cursor: str, order: str) -> list:
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+    except (ValueError, UnicodeError) as e:
+        raise ValueError(f"Некорректный курсор поиска: {e}")
+    if not isinstance(payload, dict) or not isinstance(payload.get("key"), list):
+        raise ValueError("Некорректный курсор поиска: ожидается объект с ключом key")
+    if payload.get("order") != order:
+        raise ValueError("Курсор поиска получен для другого порядка сортировки")
+    key: list = payload["key"]
+    return key
+
+
+def search_page(
+    df: Source,
+    rows: np.ndarray,
+    ranks: np.ndarray,
+    limit: int,
+    cursor: str | None = None,
+    order: str = "rank",
+    columns: list[str] | None = None,
+) -> dict[str, Any]:
+    """
+    Функция, которая формирует страницу результатов поиска:
+        rows - позиции найденных операций, ranks - качество совпадения (чем больше, тем лучше);
+        order - порядок: rank (качество, затем дата), date (сначала новые), amount (сначала крупные);
+        cursor - продолжение с места, где закончилась предыдущая страница (не зависит от смещения);
+        columns - колонки, которые попадут в ответ.
+    Возвращает словарь {"results": [...], "next_cursor": str | None}.
+    """
+    if order not in SEARCH_ORDERS:
+        raise ValueError(f"Неизвестный порядок сортировки: {order}")
+    frame = as_query(df).frame
+    if order == "amount":
+        amounts = np.abs(frame["Сумма платежа"].to_numpy(dtype="float64")[rows])
+        keys = [np.nan_to_num(-amounts, nan=np.inf)]
+    else:
+        dates = parse_dates(frame[DATE_COLUMN].iloc[rows]).to_numpy().astype("int64")
+        keys = [-dates] if order == "date" else [-ranks.astype("int64"), -dates]
+    keys.append(rows.astype("int64"))
+    candidates = np.arange(len(rows))
+    if cursor is not None:
+        after = np.zeros(len(rows), dtype=bool)
+        equal = np.ones(len(rows), dtype=bool)
+        for key, last in zip(keys, _decode_cursor(cursor, order)):
+            after |= equal & (key > last)
+            equal &= key == last
+        candidates = np.flatnonzero(after)
+    page = candidates[np.lexsort([key[candidates] for key in reversed(keys)])[:limit]]
+    next_cursor = None
+    if len(candidates) > limit:
+        next_cursor = _encode_cursor(order, [key[page[-1]].item() for key in keys])
+    result = frame.iloc[rows[page]]
+    if columns is not None:
+        result = result.loc[:, columns]
+    return {"results": json_ready(result).to_dict(orient="records"), "next_cursor": next_cursor}
+
+
+def search_word(
+    df: Table,
+    search_word_str: str,
+    limit: int | None = None,
+    cursor: str | None = None,
+    order: str = "rank",
+    columns: list[str] | None = None,
+) -> str | None:
+    """
+    Функция поиска слова в описании или категории.
+    Если задан limit (или cursor), возвращает страницу результатов, упорядоченных по качеству
+    совпадения: совпадение в категории > начало описания > вхождение в описание.
+    В этом режиме search_word_str ищется как обычный текст, а не как регулярное выражение.
+    """
     logger_util.info("Запуск функции поиска")
-    df = df.where(pd.notnull(df), None)
-    df = df[
-        (df["Описание"].str.contains(search_word_str, case=False, na=False))
-        | (df["Категория"].str.contains(search_word_str, case=False, na=False))
-    ]
-    df_list = df.to_dict(orient="records")
-    answer_string = json.dumps(df_list, ensure_ascii=False, indent=4)
+    engine = engine_for(df)
+    if limit is None and cursor is None:
+        answer: Any = engine.to_records(engine.search(df, ("Описание", "Категория"), search_word_str))
+    else:
+        query = as_query(engine.to_frame(df))
+        rows = np.flatnonzero(query.search(("Описание", "Категория"), search_word_str, regex=False).mask())
+        category_hit = (
+            query.frame["Категория"].iloc[rows].str.contains(search_word_str, case=False, na=False, regex=False)
+        )
+        prefix_hit = query.frame["Описание"].iloc[rows].str.match(re.escape(search_word_str), case=False, na=False)
+        ranks = np.where(category_hit.to_numpy(dtype=bool), 3, np.where(prefix_hit.to_numpy(dtype=bool), 2, 1))
+        answer = search_page(query, rows, ranks, limit or DEFAULT_PAGE_SIZE, cursor, order, columns)
+    answer_string = json.dumps(answer, ensure_ascii=False, indent=4)
     with open(f"{root_path}/data/search_word.json", "w", encoding="utf-8") as f:
         json.dump(answer_string, f, ensure_ascii=False, indent=4)
     logger_util.info("Файл search_world.json и поиск сформирован успешно")
     return answer_string
 
 
-def search_number(df: pd.DataFrame, search_word_str: str) -> str | None:
+def _pattern_search(
+    df: Table,
+    pattern: str,
+    limit: int | None,
+    cursor: str | None,
+    order: str,
+    columns: list[str] | None,
+) -> Any:
+    engine = engine_for(df)
+    if limit is None and cursor is None:
+        return engine.to_records(engine.search(df, ("Описание",), pattern, case=True))
+    query = as_query(engine.to_frame(df)).search(("Описание",), pattern, case=True)
+    rows = np.flatnonzero(query.mask())
+    return search_page(
+        query, rows, np.ones(len(rows), dtype="int64"), limit or DEFAULT_PAGE_SIZE, cursor, order, columns
+    )
+
+
+def search_number(
+    df: Table,
+    search_word_str: str,
+    limit: int | None = None,
+    cursor: str | None = None,
+    order: str = "date",
+    columns: list[str] | None = None,
+) -> str | None:
     """Функция поиска транзакций, в описании содержащий мобильные номера"""
     logger_util.info("Запуск функции поиска транзакций с мобильными номерами в описании")
     number_mask = r"(8 | \+7).\d+"
     if search_word_str == "cellphone":
-        df = df.where(pd.notnull(df), None)
-        df = df[(df["Описание"].str.contains(number_mask, na=False))]
-        df_list = df.to_dict(orient="records")
-        answer_string = json.dumps(df_list, ensure_ascii=False, indent=4)
+        answer = _pattern_search(df, number_mask, limit, cursor, order, columns)
+        answer_string = json.dumps(answer, ensure_ascii=False, indent=4)
         with open(f"{root_path}/data/search_number.json", "w", encoding="utf-8") as f:
             json.dump(answer_string, f, ensure_ascii=False, indent=4)
         logger_util.info(
@@ -71,15 +188,20 @@ def search_number(df: pd.DataFrame, search_word_str: str) -> str | None:
         return None
 
 
-def search_name(df: pd.DataFrame, search_word_str: str) -> str | None:
+def search_name(
+    df: Table,
+    search_word_str: str,
+    limit: int | None = None,
+    cursor: str | None = None,
+    order: str = "date",
+    columns: list[str] | None = None,
+) -> str | None:
     """Функция поиска транзакций, в описании содержащий имена для перевода"""
     logger_util.info("Запуск функции поиска транзакций с именами в описании")
     letter_mask = r"[А-Я]\."
     if search_word_str == "transfer":
-        df = df.where(pd.notnull(df), None)
-        df = df[(df["Описание"].str.contains(letter_mask, na=False))]
-        df_list = df.to_dict(orient="records")
-        answer_string = json.dumps(df_list, ensure_ascii=False, indent=4)
+        answer = _pattern_search(df, letter_mask, limit, cursor, order, columns)
+        answer_string = json.dumps(answer, ensure_ascii=False, indent=4)
         with open(f"{root_path}/data/search_number.json", "w", encoding="utf-8") as f:
             json.dump(answer_string, f, ensure_ascii=False, indent=4)
         logger_util.info("Файл search_number.json и поиск транзакций с именами в описании сформирован успешно")
@@ -0,0 +1,292 @@
+import json
+import logging
+import math
+import os
+from datetime import date, datetime, timedelta
+from typing import Any, Iterable
+
+import numpy as np
+import pandas as pd
+
+from src.config import logs_path
+
+logging.basicConfig(
+    filename=f"{logs_path}/logs.log",
+    encoding="utf-8",
+    filemode="w",
+    level=logging.DEBUG,
+    format="%(asctime)s - %(filename)s - %(levelname)s: %(message)s",
+)
+
+logger_util = logging.getLogger("app.sketch")
+
+SKETCHES_FILE = "sketches.json"
+RELATIVE_ACCURACY = 0.01
+MAX_BINS = 2048
+DEFAULT_QUANTILES = (0.5, 0.9, 0.99)
+DAY_FORMAT = "%Y-%m-%d"
+MONTH_FORMAT = "%Y-%m"
+
+
+class QuantileSketch:
+    """
+    Сливаемый скетч распределения положительных сумм: значения попадают в логарифмические
+    корзины, поэтому любой квантиль оценивается с относительной ошибкой не больше
+    relative_accuracy, а память ограничена max_bins корзинами независимо от числа значений.
+    Скетчи с одинаковой точностью складываются без потери точности (merge).
+    """
+
+    def __init__(self, relative_accuracy: float = RELATIVE_ACCURACY, max_bins: int = MAX_BINS) -> None:
+        if not 0 < relative_accuracy < 1:
+            raise ValueError(f"Некорректная точность скетча: {relative_accuracy}")
+        self.relative_accuracy = relative_accuracy
+        self.max_bins = max_bins
+        self._gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self._gamma)
+        self.bins: dict[int, int] = {}
+        self.zero = 0
+        self.count = 0
+        self.total = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def add(self, value: float, count: int = 1) -> None:
+        """Учитывает значение value count раз (отрицательные значения не допускаются)"""
+        self.add_many(np.full(count, value, dtype="float64"))
+
+    def add_many(self, values: Iterable[float] | np.ndarray) -> None:
+        """Учитывает массив значений за один проход"""
+        array = np.asarray(values, dtype="float64")
+        array = array[~np.isnan(array)]
+        if array.size == 0:
+            return
+        if (array < 0).any():
+            raise ValueError("Скетч принимает только неотрицательные значения")
+        positive = array[array > 0]
+        self.zero += int(array.size - positive.size)
+        if positive.size:
+            indexes, counts = np.unique(
+                np.ceil(np.log(positive) / self._log_gamma).astype("int64"), return_counts=True
+            )
+            for index, count in zip(indexes.tolist(), counts.tolist()):
+                self.bins[index] = self.bins.get(index, 0) + count
+        self.count += int(array.size)
+        self.total += float(array.sum())
+        self.min = min(self.min, float(array.min()))
+        self.max = max(self.max, float(array.max()))
+        self._collapse()
+
+    def merge(self, other: "QuantileSketch") -> "QuantileSketch":
+        """Добавляет к скетчу значения другого скетча той же точности, возвращает себя"""
+        if other.relative_accuracy != self.relative_accuracy:
+            raise ValueError("Сливать можно только скетчи одинаковой точности")
+        for index, count in other.bins.items():
+            self.bins[index] = self.bins.get(index, 0) + count
+        self.zero += other.zero
+        self.count += other.count
+        self.total += other.total
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self._collapse()
+        return self
+
+    def _collapse(self) -> None:
+        # При превышении числа корзин младшие корзины объединяются: точность сохраняется для верхних квантилей
+        if len(self.bins) <= self.max_bins:
+            return
+        indexes = sorted(self.bins)
+        excess = indexes[: len(indexes) - self.max_bins + 1]
+        self.bins[excess[-1]] = sum(self.bins.pop(index) for index in excess[:-1]) + self.bins[excess[-1]]
+
+    def quantile(self, q: float) -> float | None:
+        """
+        Оценка квантиля q (от 0 до 1) по ближайшему рангу: значение, не меньше которого
+        доля q всех значений, или None для пустого скетча. Минимум и максимум точные.
+        """
+        if not 0 <= q <= 1:
+            raise ValueError(f"Некорректный квантиль: {q}")
+        if self.count == 0:
+            return None
+        rank = math.ceil(q * self.count) - 1
+        if rank <= 0:
+            return self.min
+        if rank >= self.count - 1:
+            return self.max
+        seen = self.zero
+        if rank < seen:
+            return 0.0
+        for index in sorted(self.bins):
+            seen += self.bins[index]
+            if rank < seen:
+                value = 2 * self._gamma**index / (self._gamma + 1)
+                return min(max(value, self.min), self.max)
+        return self.max
+
+    def to_dict(self) -> dict:
+        """Представление скетча для записи в JSON"""
+        return {
+            "accuracy": self.relative_accuracy,
+            "count": self.count,
+            "zero": self.zero,
+            "sum": self.total,
+            "min": self.min if self.count else None,
+            "max": self.max if self.count else None,
+            "bins": sorted(self.bins.items()),
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict, max_bins: int = MAX_BINS) -> "QuantileSketch":
+        """Восстанавливает скетч из представления to_dict"""
+        sketch = cls(data["accuracy"], max_bins)
+        sketch.bins = {int(index): int(count) for index, count in data["bins"]}
+        sketch.count = data["count"]
+        sketch.zero = data["zero"]
+        sketch.total = data["sum"]
+        if sketch.count:
+            sketch.min, sketch.max = data["min"], data["max"]
+        return sketch
+
+
+def _merge_into(target: dict, source: dict) -> None:
+    # target - разделы периода из скетчей, source - те же разделы в представлении to_dict:
+    # {"total": скетч, "categories": {категория: скетч}, "cards": {карта: скетч}}
+    for name, value in source.items():
+        if name == "total":
+            target.setdefault("total", QuantileSketch(value["accuracy"])).merge(QuantileSketch.from_dict(value))
+            continue
+        group = target.setdefault(name, {})
+        for key, data in value.items():
+            group.setdefault(key, QuantileSketch(data["accuracy"])).merge(QuantileSketch.from_dict(data))
+
+
+def _serialize(period: dict) -> dict:
+    return {
+        name: value.to_dict() if name == "total" else {key: sketch.to_dict() for key, sketch in value.items()}
+        for name, value in period.items()
+    }
+
+
+def _period_sketches(frame: pd.DataFrame) -> dict:
+    result: dict = {"total": QuantileSketch(), "categories": {}, "cards": {}}
+    result["total"].add_many(frame["spent"].to_numpy())
+    for column, group in (("category", "categories"), ("card", "cards")):
+        for key, values in frame.groupby(column)["spent"]:
+            sketch = result[group][str(key)] = QuantileSketch()
+            sketch.add_many(values.to_numpy())
+    return _serialize(result)
+
+
+def _update_period(stored: dict, period: dict) -> dict:
+    merged: dict = {}
+    _merge_into(merged, stored)
+    _merge_into(merged, period)
+    return _serialize(merged)
+
+
+def update_sketches(sketches: dict, df: pd.DataFrame) -> dict:
+    """
+    Функция, которая дополняет скетчи сумм расходов новыми операциями: для каждого дня
+    и каждого месяца хранятся скетчи всех расходов, расходов по категориям и по картам.
+    """
+    if df.empty:
+        return sketches
+    amounts = df["Сумма платежа"].to_numpy(dtype="float64")
+    dates = pd.to_datetime(df["Дата операции"], format="%d.%m.%Y %H:%M:%S", errors="coerce")
+    expense = (amounts < 0) & dates.notna().to_numpy()
+    if not expense.any():
+        return sketches
+    frame = pd.DataFrame(
+        {
+            "day": dates.dt.strftime(DAY_FORMAT).to_numpy()[expense],
+            "category": df["Категория"].to_numpy()[expense],
+            "card": df["Номер карты"].to_numpy()[expense],
+            "spent": -amounts[expense],
+        }
+    )
+    frame["month"] = frame["day"].str[:7]
+    months = sketches.setdefault("months", {})
+    for month, month_frame in frame.groupby("month"):
+        months[month] = _update_period(months.get(month, {}), _period_sketches(month_frame))
+        days = sketches.setdefault("days", {}).setdefault(month, {})
+        for day, day_frame in month_frame.groupby("day"):
+            days[day] = _update_period(days.get(day, {}), _period_sketches(day_frame))
+    return sketches
+
+
+def load_sketches(state_path: str) -> dict | None:
+    """Функция, которая читает скетчи из каталога снимка (None, если они еще не построены)"""
+    try:
+        with open(os.path.join(state_path, SKETCHES_FILE), "r", encoding="utf-8") as f:
+            sketches: dict = json.load(f)
+        return sketches
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+
+def save_sketches(sketches: dict, state_path: str) -> None:
+    """Функция, которая записывает скетчи в каталог снимка"""
+    path = os.path.join(state_path, SKETCHES_FILE)
+    with open(f"{path}.tmp{os.getpid()}", "w", encoding="utf-8") as f:
+        # json.dumps кодирует целиком на C, json.dump в файл - по частям на Python
+        f.write(json.dumps(sketches, ensure_ascii=False))
+    os.replace(f"{path}.tmp{os.getpid()}", path)
+
+
+def _month_bounds(month: str) -> tuple[date, date]:
+    first = datetime.strptime(month, MONTH_FORMAT).date()
+    following = (first.replace(day=28) + timedelta(days=4)).replace(day=1)
+    return first, following - timedelta(days=1)
+
+
+def window_sketches(sketches: dict, start: datetime, end: datetime) -> dict:
+    """
+    Функция, которая сливает скетчи дней с start по end включительно (дни берутся целиком)
+    в разделы {"total": скетч, "categories": {...}, "cards": {...}}:
+    полностью покрытые месяцы берутся готовыми, дни - только на краях окна, поэтому
+    стоимость не зависит от числа операций и растет лишь с числом месяцев окна.
+    """
+    first_day, last_day = start.date(), end.date()
+    result: dict = {}
+    for month, month_sketches in sketches.get("months", {}).items():
+        month_start, month_end = _month_bounds(month)
+        if month_end < first_day or month_start > last_day:
+            continue
+        if first_day <= month_start and month_end <= last_day:
+            _merge_into(result, month_sketches)
+            continue
+        for day, day_sketches in sketches.get("days", {}).get(month, {}).items():
+            if first_day <= datetime.strptime(day, DAY_FORMAT).date() <= last_day:
+                _merge_into(result, day_sketches)
+    return result
+
+
+def quantile_label(q: float) -> str:
+    """Функция, которая возвращает название квантиля: median для 0.5, p90 для 0.9 и т.д."""
+    return "median" if q == 0.5 else f"p{q * 100:g}"
+
+
+def summary(sketch: QuantileSketch | None, quantiles: tuple[float, ...] = DEFAULT_QUANTILES) -> dict[str, Any]:
+    """Функция, которая возвращает число операций и оценки квантилей скетча"""
+    sketch = sketch if sketch is not None else QuantileSketch()
+    result: dict[str, Any] = {"count": sketch.count}
+    for q in quantiles:
+        value = sketch.quantile(q)
+        result[quantile_label(q)] = None if value is None else round(value, 2)
+    return result
+
+
+def spend_quantiles(
+    sketches: dict, start: datetime, end: datetime, quantiles: tuple[float, ...] = DEFAULT_QUANTILES
+) -> dict:
+    """
+    Функция, которая возвращает приблизительные квантили сумм расходов за окно дат:
+    по всем расходам, по категориям и по картам (категории и карты - по убыванию числа операций).
+    """
+    merged = window_sketches(sketches, start, end)
+    categories = sorted(merged.get("categories", {}).items(), key=lambda item: (-item[1].count, item[0]))
+    cards = sorted(merged.get("cards", {}).items(), key=lambda item: (-item[1].count, item[0]))
+    return {
+        "total": summary(merged.get("total"), quantiles),
+        "categories": [{"category": key, **summary(value, quantiles)} for key, value in categories],
+        "cards": [{"last_digits": key[1:], **summary(value, quantiles)} for key, value in cards],
+    }
@@ -0,0 +1,309 @@
+import json
+import logging
+import os
+import shutil
+import sys
+import time
+from contextlib import contextmanager
+from typing import Iterator
+
+import numpy as np
+import pandas as pd
+
+from src.config import logs_path
+
+if sys.platform == "win32":
+    import msvcrt
+else:
+    import fcntl
+
+logging.basicConfig(
+    filename=f"{logs_path}/logs.log",
+    encoding="utf-8",
+    filemode="w",
+    level=logging.DEBUG,
+    format="%(asctime)s - %(filename)s - %(levelname)s: %(message)s",
+)
+
+logger_util = logging.getLogger("app.snapshot")
+
+META_PREFIX = "meta-"
+CURRENT_FILE = "CURRENT"
+LOCK_FILE = "LOCK"
+VERSION_PREFIX = "v"
+# Сколько последних версий снимка хранится: процесс, только что прочитавший указатель,
+# успевает отобразить колонки предыдущей версии до ее удаления
+KEEP_VERSIONS = 2
+ATTACH_ATTEMPTS = 3
+
+
+def _source_stamp(source: str) -> dict:
+    stat = os.stat(source)
+    return {"source": os.path.abspath(source), "mtime": stat.st_mtime, "size": stat.st_size}
+
+
+def _atomic_write(path: str, text: str) -> None:
+    # Новый файл подменяет старый через rename: читатель видит либо старое, либо новое содержимое целиком
+    tmp_path = f"{path}.tmp{os.getpid()}"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+
+
+def _codes_dtype(categories: int) -> np.dtype:
+    # Тот же тип кодов, что выбирает pandas: при подключении коды не приходится копировать
+    for dtype in (np.int8, np.int16, np.int32):
+        if categories < np.iinfo(dtype).max:
+            return np.dtype(dtype)
+    return np.dtype(np.int64)
+
+
+@contextmanager
+def writer_lock(snapshot_path: str) -> Iterator[None]:
+    """
+    Блокировка записи снимка между процессами: публикации и дописывания выполняются по очереди,
+    чтение (attach_snapshot) блокировку не берет
+    """
+    os.makedirs(snapshot_path, exist_ok=True)
+    with open(os.path.join(snapshot_path, LOCK_FILE), "a+b") as f:
+        if sys.platform == "win32":
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+        else:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if sys.platform == "win32":
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+            else:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def _pointer(snapshot_path: str) -> str | None:
+    try:
+        with open(os.path.join(snapshot_path, CURRENT_FILE), "r", encoding="utf-8") as f:
+            pointer = f.read().strip()
+    except FileNotFoundError:
+        return None
+    return pointer if pointer.count("/") == 1 else None
+
+
+def current_version(snapshot_path: str) -> str | None:
+    """Функция, которая возвращает имя каталога текущей версии снимка (None, если снимок не опубликован)"""
+    pointer = _pointer(snapshot_path)
+    return None if pointer is None else pointer.split("/")[0]
+
+
+def _read_meta(snapshot_path: str, pointer: str) -> dict:
+    with open(os.path.join(snapshot_path, pointer), "r", encoding="utf-8") as f:
+        meta: dict = json.load(f)
+    return meta
+
+
+def _switch(snapshot_path: str, version: str, meta: dict, previous: str | None) -> None:
+    # Метаданные версии записываются рядом с колонками, затем указатель атомарно переключается на них;
+    # хранятся колонки текущей и предыдущей версии, остальное удаляется
+    meta_name = f"{META_PREFIX}{meta['sequence']:06d}.json"
+    with open(os.path.join(snapshot_path, version, meta_name), "w", encoding="utf-8") as f:
+        json.dump(meta, f, ensure_ascii=False)
+    pointer = f"{version}/{meta_name}"
+    _atomic_write(os.path.join(snapshot_path, CURRENT_FILE), pointer)
+    kept = {pointer: meta}
+    if previous is not None:
+        try:
+            kept[previous] = _read_meta(snapshot_path, previous)
+        except (OSError, json.JSONDecodeError):
+            pass
+    used = {f"{name.split('/')[0]}/{column['file']}" for name, data in kept.items() for column in data["columns"]}
+    used |= set(kept)
+    for name in os.listdir(snapshot_path):
+        directory = os.path.join(snapshot_path, name)
+        if not name.startswith(VERSION_PREFIX) or not os.path.isdir(directory):
+            continue
+        if not any(pointer.startswith(f"{name}/") for pointer in kept):
+            shutil.rmtree(directory, ignore_errors=True)
+            continue
+        for file_name in os.listdir(directory):
+            if f"{name}/{file_name}" not in used:
+                os.remove(os.path.join(directory, file_name))
+
+
+def _write_array(path: str, array: np.ndarray, offset: int = 0) -> None:
+    # Колонки хранятся без заголовка: число строк версии записано в ее метаданных, поэтому дописывание
+    # в конец файла не меняет данные, которые уже отображены читателями предыдущих версий
+    with open(path, "r+b" if offset else "wb") as f:
+        f.seek(offset)
+        f.truncate()
+        np.ascontiguousarray(array).tofile(f)
+
+
+def _map_array(path: str, dtype: str, rows: int) -> np.ndarray:
+    if rows == 0:
+        array = np.empty(0, dtype=dtype)
+        array.flags.writeable = False
+        return array
+    return np.memmap(path, dtype=dtype, mode="r", shape=(rows,))
+
+
+def publish_snapshot(df: pd.DataFrame, snapshot_path: str, source: str) -> None:
+    """
+    Функция, которая один раз публикует нормализованные колонки операций в каталог snapshot_path:
+    числовые колонки - как массивы, строковые - как коды и словарь значений в метаданных версии.
+    Каждая публикация записывается в новый каталог версии, после чего указатель CURRENT
+    атомарно переключается на него, поэтому читатель никогда не смешивает колонки разных версий.
+    Другие процессы подключаются к снимку через attach_snapshot без повторного разбора Excel.
+    """
+    logger_util.info(f"Публикация снимка операций в {snapshot_path}")
+    os.makedirs(snapshot_path, exist_ok=True)
+    previous = _pointer(snapshot_path)
+    version = f"{VERSION_PREFIX}{time.time_ns():020d}-{os.getpid()}"
+    tmp_path = os.path.join(snapshot_path, f".{version}.tmp")
+    os.makedirs(tmp_path)
+    columns = []
+    for number, name in enumerate(df.columns):
+        column = df[name]
+        file_name = f"{number}-0.bin"
+        if pd.api.types.is_numeric_dtype(column) and not pd.api.types.is_bool_dtype(column):
+            values = column.to_numpy()
+            _write_array(os.path.join(tmp_path, file_name), values)
+            columns.append({"name": name, "kind": "numeric", "file": file_name, "dtype": values.dtype.str})
+        else:
+            categorical = pd.Categorical(column)
+            _write_array(os.path.join(tmp_path, file_name), categorical.codes)
+            columns.append(
+                {
+                    "name": name,
+                    "kind": "category",
+                    "file": file_name,
+                    "dtype": categorical.codes.dtype.str,
+                    "categories": categorical.categories.tolist(),
+                }
+            )
+    os.rename(tmp_path, os.path.join(snapshot_path, version))
+    meta = {**_source_stamp(source), "sequence": 0, "rows": len(df), "columns": columns}
+    _switch(snapshot_path, version, meta, previous)
+    logger_util.info(f"Снимок операций опубликован (версия {version}), строк: {len(df)}")
+
+
+def _append_column(version_path: str, column: dict, rows: int, values: pd.Series, sequence: int) -> dict | None:
+    # Дописывает значения в файл колонки; если меняется тип или порядок словаря значений,
+    # колонка целиком переписывается в новый файл. None - колонку дописать нельзя
+    path = os.path.join(version_path, column["file"])
+    numeric = pd.api.types.is_numeric_dtype(values) and not pd.api.types.is_bool_dtype(values)
+    if column["kind"] == "numeric":
+        if not numeric:
+            return None
+        added = values.to_numpy()
+        dtype = np.result_type(np.dtype(column["dtype"]), added.dtype)
+        if dtype == np.dtype(column["dtype"]):
+            _write_array(path, added.astype(dtype), rows * dtype.itemsize)
+            return column
+        stored = _map_array(path, column["dtype"], rows)
+        file_name = f"{column['file'].split('-')[0]}-{sequence}.bin"
+        _write_array(
+            os.path.join(version_path, file_name), np.concatenate([stored.astype(dtype), added.astype(dtype)])
+        )
+        return {**column, "file": file_name, "dtype": dtype.str}
+    if numeric and values.notna().any():
+        return None
+    added = pd.Series(values.to_numpy(), dtype=object)
+    known = pd.Index(column["categories"], dtype=object)
+    merged = pd.Categorical(pd.concat([pd.Series(known, dtype=object), added], ignore_index=True)).categories
+    remap = merged.get_indexer(known)
+    codes = merged.get_indexer(added)
+    dtype = _codes_dtype(len(merged))
+    result = {**column, "categories": merged.tolist(), "dtype": dtype.str}
+    if dtype == np.dtype(column["dtype"]) and np.array_equal(remap, np.arange(len(known))):
+        _write_array(path, codes.astype(dtype), rows * dtype.itemsize)
+        return result
+    # Новые значения попали внутрь отсортированного словаря: коды колонки пересчитываются без разбора Excel
+    stored = _map_array(path, column["dtype"], rows)
+    recoded = np.where(stored >= 0, remap[np.maximum(stored, 0)], -1)
+    file_name = f"{column['file'].split('-')[0]}-{sequence}.bin"
+    _write_array(os.path.join(version_path, file_name), np.concatenate([recoded, codes]).astype(dtype))
+    return {**result, "file": file_name}
+
+
+def append_snapshot(df: pd.DataFrame, snapshot_path: str, source: str) -> bool:
+    """
+    Функция, которая дописывает новые операции в конец текущей версии снимка: в файлы колонок
+    добавляются только новые строки, затем публикуются метаданные с новым числом строк и указатель
+    CURRENT атомарно переключается на них. Уже подключенные читатели продолжают видеть прежнее число строк.
+    Возвращает False, если снимка нет или колонки не совпадают (тогда снимок публикуется заново).
+    Вызывается под writer_lock.
+    """
+    previous = _pointer(snapshot_path)
+    if previous is None:
+        return False
+    try:
+        meta = _read_meta(snapshot_path, previous)
+    except (OSError, json.JSONDecodeError):
+        return False
+    if [column["name"] for column in meta["columns"]] != list(df.columns):
+        logger_util.info("Колонки новых операций не совпадают со снимком")
+        return False
+    version = previous.split("/")[0]
+    version_path = os.path.join(snapshot_path, version)
+    sequence = meta["sequence"] + 1
+    columns = []
+    for column in meta["columns"]:
+        appended = _append_column(version_path, column, meta["rows"], df[column["name"]], sequence)
+        if appended is None:
+            logger_util.info(f"Колонку {column['name']} нельзя дописать в снимок")
+            return False
+        columns.append(appended)
+    rows = meta["rows"] + len(df)
+    _switch(
+        snapshot_path,
+        version,
+        {**_source_stamp(source), "sequence": sequence, "rows": rows, "columns": columns},
+        previous,
+    )
+    logger_util.info(f"В снимок дописано операций: {len(df)}, всего строк: {rows}")
+    return True
+
+
+def _attach(snapshot_path: str, pointer: str, source: str | None) -> pd.DataFrame | None:
+    meta = _read_meta(snapshot_path, pointer)
+    if source is not None:
+        try:
+            stamp = _source_stamp(source)
+        except FileNotFoundError:
+            return None
+        if any(meta.get(key) != value for key, value in stamp.items()):
+            logger_util.info("Снимок операций устарел")
+            return None
+    version_path = os.path.join(snapshot_path, pointer.split("/")[0])
+    data = {}
+    for column in meta["columns"]:
+        array = _map_array(os.path.join(version_path, column["file"]), column["dtype"], meta["rows"])
+        if column["kind"] == "numeric":
+            data[column["name"]] = pd.Series(array, copy=False)
+        else:
+            data[column["name"]] = pd.Series(
+                pd.Categorical.from_codes(array, column["categories"], validate=False), copy=False
+            )
+    logger_util.info(f"Снимок операций подключен, строк: {meta['rows']}")
+    return pd.DataFrame(data, copy=False)
+
+
+def attach_snapshot(snapshot_path: str, source: str | None = None) -> pd.DataFrame | None:
+    """
+    Функция, которая подключается к текущей версии опубликованного снимка операций. Колонки
+    отображаются в память только для чтения (mmap) и разделяются всеми процессами без копирования.
+    Если снимка нет или он устарел относительно файла source, возвращает None.
+    """
+    logger_util.info(f"Подключение к снимку операций {snapshot_path}")
+    for _ in range(ATTACH_ATTEMPTS):
+        pointer = _pointer(snapshot_path)
+        if pointer is None:
+            break
+        try:
+            return _attach(snapshot_path, pointer, source)
+        except (FileNotFoundError, json.JSONDecodeError):
+            # Версия удалена публикатором между чтением указателя и отображением колонок: читаем указатель заново
+            logger_util.info(f"Версия снимка {pointer} уже удалена")
+    logger_util.info("Снимок операций не найден")
+    return None
@@ -0,0 +1,315 @@
+import logging
+import os
+import re
+import sqlite3
+import threading
+from datetime import datetime
+from typing import Any, Callable
+
+import pandas as pd
+
+from src.config import logs_path, store_path
+from src.query import DATE_COLUMN, parse_dates
+from src.xlsx import read_statement
+
+logging.basicConfig(
+    filename=f"{logs_path}/logs.log",
+    encoding="utf-8",
+    filemode="w",
+    level=logging.DEBUG,
+    format="%(asctime)s - %(filename)s - %(levelname)s: %(message)s",
+)
+
+logger_util = logging.getLogger("app.store")
+
+ROW_COLUMN = "__row"
+ISO_DATE_COLUMN = "__date"
+ISO_FORMAT = "%Y-%m-%d %H:%M:%S"
+INDEXED_COLUMNS = (ISO_DATE_COLUMN, "Категория", "Номер карты", "Статус")
+FTS_COLUMNS = ("Описание", "Категория")
+# Подстрочный поиск через FTS5 (trigram) возможен для искомой строки не короче трех символов
+FTS_MIN_LENGTH = 3
+
+_OPERATORS = {"<": "<", "<=": "<=", ">": ">", ">=": ">=", "==": "="}
+_local = threading.local()
+
+
+def _quote(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+
+def _regexp(pattern: str, value: Any) -> bool:
+    return value is not None and re.search(pattern, str(value)) is not None
+
+
+def connect(path: str) -> sqlite3.Connection:
+    """
+    Функция, которая возвращает соединение с базой path (одно на поток).
+    Базу в режиме WAL одновременно читают все процессы, данные не загружаются в память процесса.
+    """
+    connections = getattr(_local, "connections", None)
+    if connections is None:
+        connections = _local.connections = {}
+    connection = connections.get(path)
+    if connection is None:
+        connection = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        connection.create_function("regexp", 2, _regexp, deterministic=True)
+        if path != ":memory:":
+            connection.execute("PRAGMA journal_mode=WAL")
+        connections[path] = connection
+    return connection
+
+
+def source_stamp(paths: tuple[str, ...]) -> str:
+    """Функция, которая возвращает отпечаток файлов (путь, время изменения и размер); отсутствующий файл - пустой"""
+    parts = []
+    for path in paths:
+        try:
+            stat = os.stat(path)
+        except OSError:
+            parts.append(f"{os.path.abspath(path)}:-")
+            continue
+        parts.append(f"{os.path.abspath(path)}:{stat.st_mtime_ns}:{stat.st_size}")
+    return "|".join(parts)
+
+
+def _column_type(column: pd.Series) -> str:
+    if pd.api.types.is_bool_dtype(column) or pd.api.types.is_integer_dtype(column):
+        return "INTEGER"
+    if pd.api.types.is_float_dtype(column):
+        return "REAL"
+    return "TEXT"
+
+
+def _write_table(connection: sqlite3.Connection, name: str, df: pd.DataFrame) -> None:
+    # Таблица операций, индексы и полнотекстовый индекс создаются заново в текущей транзакции
+    fts = f"{name}_fts"
+    connection.execute(f"DROP TABLE IF EXISTS {_quote(name)}")
+    connection.execute(f"DROP TABLE IF EXISTS {_quote(fts)}")
+    columns = [f"{_quote(column)} {_column_type(df[column])}" for column in df.columns]
+    connection.execute(
+        f"CREATE TABLE {_quote(name)} ({_quote(ROW_COLUMN)} INTEGER PRIMARY KEY, "
+        f"{', '.join(columns)}, {_quote(ISO_DATE_COLUMN)} TEXT)"
+    )
+    if DATE_COLUMN in df.columns:
+        dates = parse_dates(df[DATE_COLUMN]).dt.strftime(ISO_FORMAT)
+    else:
+        dates = pd.Series(None, index=df.index, dtype=object)
+    values = df.astype(object).where(pd.notnull(df), None)
+    if pd.api.types.is_datetime64_any_dtype(df.get(DATE_COLUMN)):
+        values[DATE_COLUMN] = dates
+    rows = (
+        (*row, date)
+        for row, date in zip(
+            values.itertuples(index=False, name=None), dates.astype(object).where(dates.notna(), None)
+        )
+    )
+    placeholders = ", ".join("?" for _ in range(len(df.columns) + 1))
+    names = ", ".join([*(_quote(column) for column in df.columns), _quote(ISO_DATE_COLUMN)])
+    connection.executemany(f"INSERT INTO {_quote(name)} ({names}) VALUES ({placeholders})", rows)
+    for column in INDEXED_COLUMNS:
+        if column == ISO_DATE_COLUMN or column in df.columns:
+            connection.execute(f"CREATE INDEX {_quote(f'{name}_{column}')} ON {_quote(name)} ({_quote(column)})")
+    fts_columns = [column for column in FTS_COLUMNS if column in df.columns]
+    if fts_columns:
+        aliases = ", ".join(f"c{number}" for number in range(len(fts_columns)))
+        connection.execute(f"CREATE VIRTUAL TABLE {_quote(fts)} USING fts5({aliases}, tokenize='trigram')")
+        selected = ", ".join(_quote(column) for column in fts_columns)
+        connection.execute(
+            f"INSERT INTO {_quote(fts)} (rowid, {aliases}) SELECT {_quote(ROW_COLUMN)}, {selected} FROM {_quote(name)}"
+        )
+    connection.execute(f"ANALYZE {_quote(name)}")
+
+
+class SqliteTable:
+    """
+    Ленивый запрос к таблице операций в SQLite: фильтры, окно дат и поиск дописываются
+    в условие WHERE и выполняются по индексам только при выдаче результата.
+    """
+
+    def __init__(
+        self,
+        connection: sqlite3.Connection,
+        source: str,
+        columns: dict[str, str],
+        order: list[str],
+        params: tuple = (),
+        fts: str | None = None,
+    ) -> None:
+        self.connection = connection
+        self.source = source
+        self.columns = columns
+        self.order = order
+        self.params = params
+        self.fts = fts
+        self.where: list[str] = []
+        self.where_params: tuple = ()
+
+    def derive(self, condition: str, params: tuple = ()) -> "SqliteTable":
+        """Возвращает новый запрос с дополнительным условием"""
+        table = SqliteTable(self.connection, self.source, self.columns, self.order, self.params, self.fts)
+        table.where = [*self.where, condition]
+        table.where_params = (*self.where_params, *params)
+        return table
+
+    @property
+    def visible(self) -> list[str]:
+        """Колонки выписки (без служебных)"""
+        return [column for column in self.columns if not column.startswith("__")]
+
+    def body(self) -> str:
+        """Часть запроса FROM ... WHERE ..."""
+        text = f"FROM {self.source}"
+        if self.where:
+            text += " WHERE " + " AND ".join(f"({condition})" for condition in self.where)
+        return text
+
+    def sql(self, columns: list[str] | None = None, limit: int | None = None) -> tuple[str, tuple]:
+        """Текст запроса и его параметры"""
+        selected = ", ".join(_quote(column) for column in (columns or list(self.columns)))
+        text = f"SELECT {selected} {self.body()} ORDER BY {', '.join(self.order)}"
+        if limit is not None:
+            text += f" LIMIT {int(limit)}"
+        return text, (*self.params, *self.where_params)
+
+
+class SqliteEngine:
+    """
+    Движок таблиц на SQLite: выписка один раз материализуется в базу с индексами по дате,
+    категории, карте и статусу и полнотекстовым индексом FTS5 по описанию и категории.
+    Все операции страниц выполняются запросами к базе.
+    """
+
+    name = "sqlite"
+
+    def __init__(self, path: str = store_path) -> None:
+        self.path = path
+
+    def open(
+        self, path_xls: str, load: Callable[[], pd.DataFrame], variant: str = "raw", depends: tuple[str, ...] = ()
+    ) -> SqliteTable:
+        """
+        Возвращает таблицу варианта variant выписки path_xls. Таблица строится из load()
+        только если ее нет или изменилась выписка либо один из файлов depends (например, курсы);
+        иначе открытие не читает выписку и почти мгновенно.
+        """
+        connection = connect(self.path)
+        connection.execute("CREATE TABLE IF NOT EXISTS store_meta (variant TEXT PRIMARY KEY, stamp TEXT)")
+        stamp = source_stamp((path_xls, *depends))
+        name = f"operations_{variant}"
+        query = "SELECT stamp FROM store_meta WHERE variant = ?"
+        if connection.execute(query, (variant,)).fetchone() != (stamp,):
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                # другой процесс мог построить таблицу, пока ожидали блокировку
+                if connection.execute(query, (variant,)).fetchone() != (stamp,):
+                    logger_util.info(f"Построение хранилища {name} из {path_xls}")
+                    _write_table(connection, name, load())
+                    connection.execute("INSERT OR REPLACE INTO store_meta VALUES (?, ?)", (variant, stamp))
+                connection.execute("COMMIT")
+            except BaseException:
+                connection.execute("ROLLBACK")
+                raise
+        return self._table(connection, name)
+
+    @staticmethod
+    def _table(connection: sqlite3.Connection, name: str) -> SqliteTable:
+        columns = {row[1]: row[2] for row in connection.execute(f"PRAGMA table_info({_quote(name)})")}
+        exists = connection.execute("SELECT 1 FROM sqlite_master WHERE name = ?", (f"{name}_fts",)).fetchone()
+        fts = f"{name}_fts" if exists else None
+        return SqliteTable(connection, _quote(name), columns, [_quote(ROW_COLUMN)], fts=fts)
+
+    def load(self, path_xls: str) -> SqliteTable:
+        """Читает выписку Excel (успешные операции) через хранилище"""
+
+        return self.open(path_xls, lambda: read_statement(path_xls), "raw")
+
+    def from_frame(self, df: Any) -> SqliteTable:
+        """Переводит таблицу pandas во временную базу в памяти"""
+        if isinstance(df, SqliteTable):
+            return df
+        if not isinstance(df, pd.DataFrame):
+            df = df.collect()
+        connection = sqlite3.connect(":memory:", check_same_thread=False, isolation_level=None)
+        connection.create_function("regexp", 2, _regexp, deterministic=True)
+        connection.execute("BEGIN")
+        _write_table(connection, "operations", df)
+        connection.execute("COMMIT")
+        return self._table(connection, "operations")
+
+    def to_frame(self, table: SqliteTable) -> pd.DataFrame:
+        """Возвращает таблицу pandas без служебных колонок"""
+        text, params = table.sql(table.visible)
+        return pd.read_sql_query(text, table.connection, params=params)
+
+    def window(self, table: SqliteTable, start: datetime, end: datetime) -> SqliteTable:
+        """Операции с датой в интервале [start, end] (по индексу даты)"""
+        return table.derive(
+            f"{_quote(ISO_DATE_COLUMN)} BETWEEN ? AND ?", (start.strftime(ISO_FORMAT), end.strftime(ISO_FORMAT))
+        )
+
+    def filter(self, table: SqliteTable, column: str, op: str, value: Any) -> SqliteTable:
+        """Операции, у которых column op value (op - одно из < <= > >= == != in)"""
+        if op in _OPERATORS:
+            return table.derive(f"{_quote(column)} {_OPERATORS[op]} ?", (value,))
+        if op == "!=":
+            # как в pandas: пропуск не равен никакому значению
+            return table.derive(f"({_quote(column)} != ? OR {_quote(column)} IS NULL)", (value,))
+        if op == "in":
+            values = tuple(value)
+            return table.derive(f"{_quote(column)} IN ({', '.join('?' for _ in values)})", values)
+        raise ValueError(f"Неизвестный оператор фильтра: {op}")
+
+    def search(self, table: SqliteTable, columns: tuple[str, ...], pattern: str, case: bool = False) -> SqliteTable:
+        """
+        Операции, в которых регулярное выражение pattern найдено хотя бы в одной из колонок.
+        Поиск простой подстроки без учета регистра выполняется по индексу FTS5.
+        """
+        literal = re.escape(pattern) == pattern and len(pattern) >= FTS_MIN_LENGTH
+        if table.fts is not None and not case and literal and set(columns) <= set(FTS_COLUMNS):
+            aliases = " ".join(f"c{FTS_COLUMNS.index(column)}" for column in columns)
+            phrase = pattern.replace('"', '""')
+            condition = f"{_quote(ROW_COLUMN)} IN (SELECT rowid FROM {table.fts} WHERE {table.fts} MATCH ?)"
+            return table.derive(condition, (f'{{{aliases}}}: "{phrase}"',))
+        expression = pattern if case else f"(?i){pattern}"
+        condition = " OR ".join(f"regexp(?, {_quote(column)})" for column in columns)
+        return table.derive(condition, (expression,) * len(columns))
+
+    def _sum(self, table: SqliteTable, column: str) -> str:
+        # Сумма по вещественной колонке всегда вещественная (как в pandas), по целой - целая
+        if table.columns.get(column) == "REAL":
+            return f"TOTAL({_quote(column)})"
+        return f"COALESCE(SUM({_quote(column)}), 0)"
+
+    def group_sum(self, table: SqliteTable, by: str, column: str) -> SqliteTable:
+        """Сумма column по группам by, группы упорядочены по возрастанию ключа"""
+        grouped = table.derive(f"{_quote(by)} IS NOT NULL")
+        text = (
+            f"SELECT {_quote(by)}, {self._sum(table, column)} AS {_quote(column)} {grouped.body()} "
+            f"GROUP BY {_quote(by)}"
+        )
+        columns = {by: table.columns.get(by, "TEXT"), column: table.columns.get(column, "REAL")}
+        return SqliteTable(
+            table.connection, f"({text})", columns, [_quote(by)], (*table.params, *grouped.where_params)
+        )
+
+    def top_n(
+        self, table: SqliteTable, column: str, n: int, largest: bool = True, columns: tuple[str, ...] | None = None
+    ) -> SqliteTable:
+        """n строк с наибольшим (наименьшим) значением column, при равенстве - в исходном порядке"""
+        ranked = table.derive(f"{_quote(column)} IS NOT NULL")
+        ranked.order = [f"{_quote(column)} {'DESC' if largest else 'ASC'}", *table.order]
+        text, params = ranked.sql(limit=max(n, 0))
+        selected = table.columns if columns is None else {name: table.columns[name] for name in columns}
+        return SqliteTable(table.connection, f"({text})", dict(selected), ranked.order, params)
+
+    def total(self, table: SqliteTable, column: str) -> float:
+        """Сумма колонки column"""
+        text, params = table.sql([column])
+        return float(table.connection.execute(f"SELECT TOTAL({_quote(column)}) FROM ({text})", params).fetchone()[0])
+
+    def to_records(self, table: SqliteTable) -> list[dict]:
+        """Список строк-словарей, пропуски - None"""
+        columns = table.visible
+        text, params = table.sql(columns)
+        return [dict(zip(columns, row)) for row in table.connection.execute(text, params)]
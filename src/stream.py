@@ -0,0 +1,294 @@
+import bisect
+import json
+import logging
+import math
+import os
+import socketserver
+import threading
+from datetime import datetime, timedelta
+from typing import Any, Iterable
+
+import numpy as np
+import pandas as pd
+
+from src.config import logs_path
+from src.query import DATE_COLUMN, DATE_FORMAT
+from src.top_n import REMAINDER_LABEL
+
+logging.basicConfig(
+    filename=f"{logs_path}/logs.log",
+    encoding="utf-8",
+    filemode="w",
+    level=logging.DEBUG,
+    format="%(asctime)s - %(filename)s - %(levelname)s: %(message)s",
+)
+
+logger_util = logging.getLogger("app.stream")
+
+DIAPASONS = ("W", "M", "Y", "All")
+TAIL_INTERVAL = 0.5
+
+
+def period_key(date: datetime, diapason: str) -> Any:
+    """Функция, которая возвращает ключ периода (неделя, месяц, год или все время), в который попадает дата"""
+    if diapason == "W":
+        return (date - timedelta(days=date.weekday())).date()
+    if diapason == "M":
+        return date.year, date.month
+    if diapason == "Y":
+        return date.year
+    if diapason == "All":
+        return None
+    raise ValueError(f"Ошибка даты: неизвестный диапазон {diapason}")
+
+
+class Ranking:
+    """
+    Суммы по категориям, постоянно упорядоченные по убыванию: при изменении суммы
+    категория переставляется бинарным поиском, отбор первых n не требует сортировки.
+    """
+
+    def __init__(self) -> None:
+        self._totals: dict[str, float] = {}
+        self._order: list[tuple[float, str]] = []
+
+    def add(self, category: str, amount: float) -> None:
+        """Прибавляет amount к сумме категории"""
+        old = self._totals.get(category)
+        if old is not None:
+            del self._order[bisect.bisect_left(self._order, (-old, category))]
+        total = (old or 0.0) + amount
+        self._totals[category] = total
+        bisect.insort(self._order, (-total, category))
+
+    def top(self, n: int) -> list[tuple[str, float]]:
+        """n категорий с наибольшими суммами (при равенстве - по алфавиту)"""
+        return [(category, -total) for total, category in self._order[:n]]
+
+    def rest(self, n: int) -> float:
+        """Сумма всех категорий, кроме первых n"""
+        return float(np.nansum([-total for total, _ in self._order[n:]]))
+
+
+class PeriodTotals:
+    """Накопленные за один период показатели страниц: расходы по картам, итоги и рейтинги категорий"""
+
+    def __init__(self) -> None:
+        self.cards: dict[str, float] = {}
+        self.expenses = 0.0
+        self.income = 0.0
+        self.expense_categories = Ranking()
+        self.income_categories = Ranking()
+
+    def add(self, card: Any, category: Any, amount: float) -> None:
+        """Учитывает одну операцию"""
+        if amount < 0:
+            self.expenses += amount
+            if isinstance(card, str):
+                self.cards[card] = self.cards.get(card, 0.0) - amount
+            if isinstance(category, str):
+                self.expense_categories.add(category, -amount)
+        elif amount > 0:
+            self.income += amount
+            if isinstance(category, str):
+                self.income_categories.add(category, amount)
+
+
+class StreamProcessor:
+    """
+    Потоковый расчет показателей страниц: операции поступают по одной или пачками,
+    для каждой недели, месяца, года и всего времени поддерживаются текущие значения
+    cards_info, итогов расходов и поступлений и рейтингов категорий. Запросы значений
+    обращаются к уже накопленному состоянию и не просматривают историю операций.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._periods: dict[str, dict[Any, PeriodTotals]] = {diapason: {} for diapason in DIAPASONS}
+        self._latest: datetime | None = None
+        self._stats = {"processed": 0, "skipped": 0}
+
+    def process(self, operation: dict) -> bool:
+        """
+        Учитывает одну операцию (словарь с колонками выписки). Неуспешные операции
+        и операции без даты или суммы пропускаются. Возвращает True, если операция учтена.
+        """
+        with self._lock:
+            return self._process(operation)
+
+    def process_batch(self, operations: Iterable[dict] | pd.DataFrame) -> int:
+        """Учитывает пачку операций под одной блокировкой, возвращает число учтенных"""
+        if isinstance(operations, pd.DataFrame):
+            operations = operations.to_dict(orient="records")
+        with self._lock:
+            return sum(self._process(operation) for operation in operations)
+
+    def _process(self, operation: dict) -> bool:
+        date = operation.get(DATE_COLUMN)
+        amount = operation.get("Сумма платежа")
+        if isinstance(date, str):
+            try:
+                date = datetime.strptime(date, DATE_FORMAT)
+            except ValueError:
+                date = None
+        if not isinstance(amount, (int, float)) or math.isnan(amount):
+            amount = None
+        if operation.get("Статус", "OK") != "OK" or not isinstance(date, datetime) or amount is None:
+            self._stats["skipped"] += 1
+            return False
+        for diapason, periods in self._periods.items():
+            key = period_key(date, diapason)
+            totals = periods.get(key)
+            if totals is None:
+                totals = periods[key] = PeriodTotals()
+            totals.add(operation.get("Номер карты"), operation.get("Категория"), float(amount))
+        if self._latest is None or date > self._latest:
+            self._latest = date
+        self._stats["processed"] += 1
+        return True
+
+    def _period(self, date_str: str | None, diapason: str) -> PeriodTotals:
+        if date_str is not None:
+            date = datetime.strptime(date_str, "%Y-%m-%d %H:%M:%S")
+        else:
+            date = self._latest or datetime.now()
+        return self._periods[diapason].get(period_key(date, diapason)) or PeriodTotals()
+
+    def cards_info(self, date_str: str | None = None, diapason: str = "M") -> list:
+        """Расходы и кешбэк по картам за период, в формате utils.cards_info (по умолчанию - последний период)"""
+        with self._lock:
+            cards = sorted(self._period(date_str, diapason).cards.items())
+        result = []
+        for card, spent in cards:
+            total_spent = float(np.round(spent, 2))
+            result.append(
+                {
+                    "last_digits": card[1:],
+                    "total_spent": total_spent,
+                    "cashback": float(np.round(total_spent / 100, 2)),
+                }
+            )
+        return result
+
+    def total_expenses(self, date_str: str | None = None, diapason: str = "M") -> int:
+        """Общая сумма расходов за период (как utils.total_expenses)"""
+        with self._lock:
+            return round(int(self._period(date_str, diapason).expenses * -1), 2)
+
+    def total_income(self, date_str: str | None = None, diapason: str = "M") -> float:
+        """Общая сумма поступлений за период (как utils.total_income)"""
+        with self._lock:
+            return round(self._period(date_str, diapason).income, 2)
+
+    def _ranking(self, ranking: Ranking, n: int) -> list[dict]:
+        result = [{"category": category, "amount": round(amount, 2)} for category, amount in ranking.top(n)]
+        return result + [{"category": REMAINDER_LABEL, "amount": round(ranking.rest(n), 2)}]
+
+    def expenses_by_category(self, date_str: str | None = None, diapason: str = "M", n: int = 7) -> list:
+        """n категорий с наибольшими тратами и «Остальное» (как utils.expenses_by_category)"""
+        with self._lock:
+            return self._ranking(self._period(date_str, diapason).expense_categories, n)
+
+    def income_by_category(self, date_str: str | None = None, diapason: str = "M", n: int = 7) -> list:
+        """n категорий с наибольшими поступлениями и «Остальное» (как utils.income_by_category)"""
+        with self._lock:
+            return self._ranking(self._period(date_str, diapason).income_categories, n)
+
+    def sections(self, date_str: str | None = None, diapason: str = "M") -> dict:
+        """Разделы страниц "Главная" (карты) и "События" (расходы и поступления) за период"""
+        return {
+            "cards": self.cards_info(date_str, diapason),
+            "expenses": {
+                "total_amount": round(float(self.total_expenses(date_str, diapason)), 2),
+                "main": self.expenses_by_category(date_str, diapason),
+            },
+            "income": {
+                "total_amount": round(float(self.total_income(date_str, diapason)), 2),
+                "main": self.income_by_category(date_str, diapason),
+            },
+        }
+
+    def stats(self) -> dict[str, int]:
+        """Счетчики: учтено операций, пропущено операций"""
+        with self._lock:
+            return dict(self._stats)
+
+
+def consume(processor: StreamProcessor, operations: Iterable[dict], batch_size: int = 1) -> int:
+    """Функция, которая передает операции из итератора в processor пачками по batch_size"""
+    count = 0
+    batch: list[dict] = []
+    for operation in operations:
+        batch.append(operation)
+        if len(batch) >= batch_size:
+            count += processor.process_batch(batch)
+            batch = []
+    if batch:
+        count += processor.process_batch(batch)
+    return count
+
+
+def _parse_line(line: str | bytes) -> dict | None:
+    try:
+        operation = json.loads(line)
+    except json.JSONDecodeError:
+        logger_util.error(f"Некорректная строка потока операций: {line[:100]!r}")
+        return None
+    return operation if isinstance(operation, dict) else None
+
+
+def tail_file(
+    processor: StreamProcessor,
+    path: str,
+    stop: threading.Event,
+    from_start: bool = True,
+    interval: float = TAIL_INTERVAL,
+) -> int:
+    """
+    Функция, которая следит за файлом JSON-строк (одна операция на строку) и передает
+    дописанные операции в processor, пока не установлен stop. Незавершенная строка
+    ждет окончания записи. Возвращает число учтенных операций.
+    """
+    logger_util.info(f"Запуск чтения потока операций из файла {path}")
+    count = 0
+    with open(path, "r", encoding="utf-8") as f:
+        if not from_start:
+            f.seek(0, os.SEEK_END)
+        pending = ""
+        while True:
+            chunk = f.readline()
+            if chunk:
+                pending += chunk
+                if pending.endswith("\n"):
+                    operation = _parse_line(pending)
+                    pending = ""
+                    if operation is not None:
+                        count += processor.process(operation)
+                continue
+            if stop.wait(interval):
+                break
+    logger_util.info(f"Чтение потока операций из файла {path} завершено, учтено: {count}")
+    return count
+
+
+class _OperationsHandler(socketserver.StreamRequestHandler):
+    def handle(self) -> None:
+        for line in self.rfile:
+            operation = _parse_line(line)
+            if operation is not None:
+                self.server.processor.process(operation)  # type: ignore[attr-defined]
+
+
+def serve_socket(
+    processor: StreamProcessor, host: str = "127.0.0.1", port: int = 0
+) -> socketserver.ThreadingTCPServer:
+    """
+    Функция, которая запускает в фоновом потоке локальный TCP-сервер: каждое подключение
+    присылает операции JSON-строками. Адрес сервера - server.server_address, остановка - server.shutdown().
+    """
+    server = socketserver.ThreadingTCPServer((host, port), _OperationsHandler)
+    server.daemon_threads = True
+    server.processor = processor  # type: ignore[attr-defined]
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    logger_util.info(f"Прием потока операций на {server.server_address}")
+    return server
@@ -0,0 +1,433 @@
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import sys
+import tempfile
+import threading
+import time
+import traceback
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Any, Callable, Iterator
+
+import numpy as np
+import pandas as pd
+
+from src import services, utils, views
+from src.config import logs_path
+from src.quota import QuotaScheduler
+
+logging.basicConfig(
+    filename=f"{logs_path}/logs.log",
+    encoding="utf-8",
+    filemode="w",
+    level=logging.DEBUG,
+    format="%(asctime)s - %(filename)s - %(levelname)s: %(message)s",
+)
+
+logger_util = logging.getLogger("app.stress")
+
+DEFAULT_ROWS = 2000
+DEFAULT_THREADS = 4
+DEFAULT_PROCESSES = 1
+DEFAULT_REQUESTS = 20
+DEFAULT_DELAY = 0.05
+DEFAULT_TOLERANCE = 0.5
+SAMPLE_INTERVAL = 0.005
+LATEST_DATE = datetime(2021, 12, 31, 16, 44, 0)
+OUTPUT_FILES = ("answer_main.json", "answer_events.json", "cashback.json", "search_word.json", "search_number.json")
+
+_CATEGORIES = ["Супермаркеты", "Фастфуд", "Транспорт", "Переводы", "Авиабилеты", "Связь", "Аптеки", "Рестораны"]
+_DESCRIPTIONS = ["Колхоз", "Магнит", "Яндекс Такси", "Валерий А.", "Аэрофлот", "МТС +7 921 11-22-33", "Аптека"]
+
+
+def synthetic_statement(rows: int, seed: int = 0) -> pd.DataFrame:
+    """
+    Функция, которая строит выписку из rows случайных операций в формате data/operations.xlsx
+    (рубли, даты в пределах года до LATEST_DATE).
+    """
+    rng = np.random.default_rng(seed)
+    dates = [
+        LATEST_DATE - timedelta(minutes=int(minutes)) for minutes in np.sort(rng.integers(0, 365 * 24 * 60, rows))
+    ]
+    amounts = np.round(np.where(rng.random(rows) < 0.9, -1, 1) * rng.gamma(2.0, 500.0, rows), 2)
+    return pd.DataFrame(
+        {
+            "Дата операции": [date.strftime("%d.%m.%Y %H:%M:%S") for date in dates],
+            "Дата платежа": [date.strftime("%d.%m.%Y") for date in dates],
+            "Номер карты": rng.choice(["*7197", "*5091", "*4556"], rows),
+            "Статус": np.where(rng.random(rows) < 0.98, "OK", "FAILED"),
+            "Сумма операции": amounts,
+            "Валюта операции": "RUB",
+            "Сумма платежа": amounts,
+            "Валюта платежа": "RUB",
+            "Кэшбэк": np.where(rng.random(rows) < 0.2, np.round(np.abs(amounts) / 100, 2), np.nan),
+            "Категория": rng.choice(_CATEGORIES, rows),
+            "MCC": 5411.0,
+            "Описание": rng.choice(_DESCRIPTIONS, rows),
+            "Бонусы (включая кэшбэк)": 0,
+            "Округление на инвесткопилку": 0,
+            "Сумма операции с округлением": np.abs(amounts),
+        }
+    )
+
+
+class MarketStub:
+    """Локальная заглушка ЦБ и Alpha Vantage с задержкой ответа delay секунд; считает обращения"""
+
+    def __init__(self, delay: float = DEFAULT_DELAY) -> None:
+        self.hits: Counter = Counter()
+        lock = threading.Lock()
+        hits = self.hits
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self) -> None:
+                with lock:
+                    hits[self.path.split("?")[0]] += 1
+                time.sleep(delay)
+                if "daily_json" in self.path:
+                    body: dict = {
+                        "Valute": {"USD": {"Value": 73.2155}, "EUR": {"Value": 80.0}, "CNY": {"Value": 11.5}}
+                    }
+                else:
+                    body = {"Global Quote": {"05. price": "150.123"}}
+                data = json.dumps(body).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args: Any) -> None:
+                pass
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._server.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self._server.server_address[1]}"
+
+    def __enter__(self) -> "MarketStub":
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+
+@contextmanager
+def configured(work_path: str, path_xls: str, market_url: str) -> Iterator[None]:
+    """
+    Функция, которая на время блока with направляет views и services на синтетическую выписку path_xls,
+    каталог ответов work_path/data и заглушку рынка market_url, а затем восстанавливает модули процесса.
+    """
+    os.makedirs(os.path.join(work_path, "data"), exist_ok=True)
+    overrides: dict[Any, dict[str, Any]] = {
+        views: {
+            "data_file": path_xls,
+            "snapshot_path": os.path.join(work_path, "snapshot"),
+            "root_path": Path(work_path),
+        },
+        services: {"root_path": Path(work_path)},
+        utils: {
+            "CBR_DAILY_URL": f"{market_url}/daily_json.js",
+            "ALPHA_VANTAGE_URL": f"{market_url}/query",
+            # Заглушка рынка не ограничивает запросы: квота Alpha Vantage не должна влиять на замеры
+            "stock_quota": QuotaScheduler(per_minute=None, per_day=None),
+        },
+    }
+    saved = {module: {name: getattr(module, name) for name in values} for module, values in overrides.items()}
+    try:
+        for module, values in overrides.items():
+            for name, value in values.items():
+                setattr(module, name, value)
+        yield
+    finally:
+        for module, values in saved.items():
+            for name, value in values.items():
+                setattr(module, name, value)
+
+
+def request_mix() -> dict[str, Callable[[], Any]]:
+    """Функция, которая возвращает нагрузочные запросы: все ответы json_answer_* views"""
+    date_str = LATEST_DATE.strftime("%Y-%m-%d %H:%M:%S")
+    return {
+        "json_answer_main": lambda: views.json_answer_main(date_str),
+        "json_answer_events": lambda: views.json_answer_events(date_str, "Y"),
+        "json_answer_cashback": lambda: views.json_answer_cashback(str(LATEST_DATE.year), str(LATEST_DATE.month)),
+        "json_answer_search": lambda: views.json_answer_search("авиа"),
+        "json_answer_search_number": lambda: views.json_answer_search("cellphone"),
+    }
+
+
+def _comparable(name: str, answer: Any) -> Any:
+    # Приветствие зависит от текущего часа и не сравнивается
+    if not isinstance(answer, str):
+        return answer
+    value = json.loads(answer)
+    if name == "json_answer_main" and isinstance(value, dict):
+        value.pop("greeting", None)
+    return value
+
+
+class StackSampler:
+    """
+    Фоновый поток, который каждые interval секунд снимает стеки рабочих потоков и считает,
+    где они находятся: последний кадр кода проекта и кадр, в котором поток ждет (блокировка, сеть, файл).
+    """
+
+    def __init__(self, interval: float = SAMPLE_INTERVAL) -> None:
+        self.samples: Counter = Counter()
+        self._interval = interval
+        self._threads: set[int] = set()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def register(self) -> None:
+        """Отмечает текущий поток как рабочий"""
+        self._threads.add(threading.get_ident())
+
+    def _run(self) -> None:
+        while not self._stop.wait(self._interval):
+            for ident, frame in sys._current_frames().items():
+                if ident in self._threads:
+                    self.samples[self._location(frame)] += 1
+
+    @staticmethod
+    def _location(frame: Any) -> str:
+        inner = f"{os.path.basename(frame.f_code.co_filename)}:{frame.f_code.co_name}"
+        while frame is not None and f"{os.sep}src{os.sep}" not in frame.f_code.co_filename:
+            frame = frame.f_back
+        if frame is None:
+            return inner
+        own = f"{os.path.basename(frame.f_code.co_filename)}:{frame.f_code.co_name}:{frame.f_lineno}"
+        return own if own.startswith(inner + ":") else f"{own} -> {inner}"
+
+    def __enter__(self) -> "StackSampler":
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self._stop.set()
+        self._thread.join()
+
+
+def run_threads(threads: int, requests: int, expected: dict | None = None) -> dict:
+    """
+    Функция, которая выполняет запросы request_mix из threads потоков, по requests запросов на поток
+    (запросы чередуются). Возвращает замеры: [(запрос, задержка в с, ошибка, расхождение)], время и стеки.
+    """
+    mix = list(request_mix().items())
+    samples: list[tuple[str, float, str | None, bool]] = []
+    lock = threading.Lock()
+    barrier = threading.Barrier(threads)
+    sampler = StackSampler()
+
+    def worker(number: int) -> None:
+        sampler.register()
+        own = []
+        barrier.wait()
+        for index in range(requests):
+            name, request = mix[(number + index) % len(mix)]
+            started = time.perf_counter()
+            error = None
+            mismatch = False
+            try:
+                answer = request()
+                if expected is not None and _comparable(name, answer) != expected[name]:
+                    mismatch = True
+            except Exception as e:
+                error = f"{type(e).__name__}: {e}"
+                logger_util.error(f"Ошибка запроса {name}: {traceback.format_exc(limit=3)}")
+            own.append((name, time.perf_counter() - started, error, mismatch))
+        with lock:
+            samples.extend(own)
+
+    workers = [threading.Thread(target=worker, args=(number,)) for number in range(threads)]
+    started = time.perf_counter()
+    with sampler:
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+    return {"samples": samples, "elapsed": time.perf_counter() - started, "hotspots": dict(sampler.samples)}
+
+
+def reference_answers() -> dict:
+    """Функция, которая рассчитывает эталонные ответы последовательно (для поиска гонок)"""
+    return {name: _comparable(name, request()) for name, request in request_mix().items()}
+
+
+def _process_worker(
+    work_path: str, path_xls: str, market_url: str, threads: int, requests: int, expected: dict
+) -> dict:
+    with configured(work_path, path_xls, market_url):
+        request_mix()["json_answer_search"]()  # прогрев: снимок операций и импорты
+        return run_threads(threads, requests, expected)
+
+
+def check_outputs(work_path: str) -> list[str]:
+    """Функция, которая проверяет, что файлы ответов в work_path/data не повреждены одновременной записью"""
+    corrupted = []
+    for file_name in OUTPUT_FILES:
+        path = os.path.join(work_path, "data", file_name)
+        if not os.path.exists(path):
+            continue
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                json.loads(json.load(f))
+        except (ValueError, TypeError):
+            corrupted.append(file_name)
+    return corrupted
+
+
+def summarize(runs: list[dict]) -> dict:
+    """
+    Функция, которая сводит замеры: пропускная способность, перцентили задержки, ошибки и горячие точки.
+    Время нагрузки - наибольшее из времен прогонов (процессы отсчитывают его после запуска и прогрева).
+    """
+    wall = max((run["elapsed"] for run in runs), default=0.0)
+    samples = [sample for run in runs for sample in run["samples"]]
+    report: dict = {"requests": len(samples), "elapsed_s": round(wall, 3), "throughput_rps": 0.0, "endpoints": {}}
+    if wall > 0:
+        report["throughput_rps"] = round(len(samples) / wall, 2)
+    by_name: dict[str, list] = {}
+    for sample in samples:
+        by_name.setdefault(sample[0], []).append(sample)
+    for name, group in by_name.items():
+        latencies = np.array([sample[1] for sample in group]) * 1000
+        errors = Counter(sample[2] for sample in group if sample[2] is not None)
+        report["endpoints"][name] = {
+            "count": len(group),
+            "p50_ms": round(float(np.percentile(latencies, 50)), 2),
+            "p95_ms": round(float(np.percentile(latencies, 95)), 2),
+            "p99_ms": round(float(np.percentile(latencies, 99)), 2),
+            "error_rate": round(sum(errors.values()) / len(group), 4),
+            "mismatch_rate": round(sum(sample[3] for sample in group) / len(group), 4),
+            "errors": dict(errors.most_common(3)),
+        }
+    hotspots: Counter = Counter()
+    for run in runs:
+        hotspots.update(run["hotspots"])
+    total = sum(hotspots.values()) or 1
+    report["hotspots"] = [
+        {"location": location, "share": round(count / total, 3)} for location, count in hotspots.most_common(10)
+    ]
+    return report
+
+
+def run_stress(
+    threads: int = DEFAULT_THREADS,
+    processes: int = DEFAULT_PROCESSES,
+    requests: int = DEFAULT_REQUESTS,
+    rows: int = DEFAULT_ROWS,
+    delay: float = DEFAULT_DELAY,
+) -> dict:
+    """
+    Функция, которая нагружает ответы views из threads потоков в каждом из processes процессов
+    (processes=1 - в текущем процессе) на синтетической выписке из rows операций и заглушке рынка
+    с задержкой delay. Общий каталог ответов у всех процессов, как у рабочих процессов сервера.
+    """
+    logger_util.info(f"Запуск нагрузки: {threads} потоков x {processes} процессов, {requests} запросов на поток")
+    with tempfile.TemporaryDirectory() as work_path, MarketStub(delay) as market:
+        path_xls = os.path.join(work_path, "operations.xlsx")
+        synthetic_statement(rows).to_excel(path_xls, index=False)
+        with configured(work_path, path_xls, market.url):
+            expected = reference_answers()
+            if processes <= 1:
+                runs = [run_threads(threads, requests, expected)]
+            else:
+                context = multiprocessing.get_context("spawn")
+                with ProcessPoolExecutor(processes, mp_context=context) as pool:
+                    futures = [
+                        pool.submit(_process_worker, work_path, path_xls, market.url, threads, requests, expected)
+                        for _ in range(processes)
+                    ]
+                    runs = [future.result() for future in futures]
+            report = summarize(runs)
+            report["threads"], report["processes"], report["rows"] = threads, processes, rows
+            report["corrupted_outputs"] = check_outputs(work_path)
+            report["market_requests"] = dict(market.hits)
+    return report
+
+
+def check_baseline(report: dict, baseline: dict, tolerance: float = DEFAULT_TOLERANCE) -> list[str]:
+    """
+    Функция, которая сравнивает отчет с базовым: регрессия - ошибки или расхождения ответов,
+    поврежденные файлы, падение пропускной способности или рост p95 больше чем на tolerance.
+    """
+    regressions = []
+    if report["throughput_rps"] < baseline["throughput_rps"] * (1 - tolerance):
+        regressions.append(
+            f"пропускная способность {report['throughput_rps']} запр/с, базовая {baseline['throughput_rps']} запр/с"
+        )
+    for name, endpoint in report["endpoints"].items():
+        if endpoint["error_rate"] > 0 or endpoint["mismatch_rate"] > 0:
+            regressions.append(
+                f"{name}: ошибки {endpoint['error_rate']:.2%}, расхождения {endpoint['mismatch_rate']:.2%}"
+            )
+        base = baseline["endpoints"].get(name)
+        if base is not None and endpoint["p95_ms"] > base["p95_ms"] * (1 + tolerance):
+            regressions.append(f"{name}: p95 {endpoint['p95_ms']} мс, базовый {base['p95_ms']} мс")
+    if report.get("corrupted_outputs"):
+        regressions.append(f"поврежденные файлы ответов: {', '.join(report['corrupted_outputs'])}")
+    return regressions
+
+
+def format_report(report: dict) -> str:
+    """Функция, которая формирует текстовый отчет нагрузки"""
+    lines = [
+        f"{report['threads']} потоков x {report['processes']} процессов, {report['rows']} операций: "
+        f"{report['requests']} запросов за {report['elapsed_s']} с, {report['throughput_rps']} запр/с",
+        f"{'запрос':<28}{'шт':>6}{'p50, мс':>10}{'p95, мс':>10}{'p99, мс':>10}{'ошибки':>9}{'расхожд.':>10}",
+    ]
+    for name, endpoint in report["endpoints"].items():
+        lines.append(
+            f"{name:<28}{endpoint['count']:>6}{endpoint['p50_ms']:>10}{endpoint['p95_ms']:>10}{endpoint['p99_ms']:>10}"
+            f"{endpoint['error_rate']:>9.2%}{endpoint['mismatch_rate']:>10.2%}"
+        )
+        for error, count in endpoint["errors"].items():
+            lines.append(f"    {count} x {error[:100]}")
+    lines.append("Горячие точки (доля снимков стека рабочих потоков):")
+    lines.extend(f"  {hotspot['share']:>6.1%}  {hotspot['location']}" for hotspot in report["hotspots"])
+    if report["corrupted_outputs"]:
+        lines.append(f"Поврежденные файлы ответов: {', '.join(report['corrupted_outputs'])}")
+    lines.append(f"Запросы к рынку: {report['market_requests']}")
+    return "\n".join(lines)
+
+
+def main(argv: list[str] | None = None) -> int:
+    """
+    Точка входа: python -m src.stress [--threads N] [--processes M] [--requests K] [--rows R]
+    [--output отчет.json] [--baseline базовый.json]. Возвращает 1 при регрессии относительно базового отчета.
+    """
+    parser = argparse.ArgumentParser(description="Нагрузочное тестирование ответов views")
+    parser.add_argument("--threads", type=int, default=DEFAULT_THREADS, help="потоков в каждом процессе")
+    parser.add_argument("--processes", type=int, default=DEFAULT_PROCESSES, help="рабочих процессов")
+    parser.add_argument("--requests", type=int, default=DEFAULT_REQUESTS, help="запросов на поток")
+    parser.add_argument("--rows", type=int, default=DEFAULT_ROWS, help="операций в синтетической выписке")
+    parser.add_argument("--delay", type=float, default=DEFAULT_DELAY, help="задержка заглушки рынка, с")
+    parser.add_argument("--output", default=None, help="записать отчет в JSON")
+    parser.add_argument("--baseline", default=None, help="сравнить с базовым отчетом")
+    args = parser.parse_args(argv)
+    report = run_stress(args.threads, args.processes, args.requests, args.rows, args.delay)
+    print(format_report(report))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=4)
+    if args.baseline is None:
+        return 0
+    with open(args.baseline, "r", encoding="utf-8") as f:
+        regressions = check_baseline(report, json.load(f))
+    for regression in regressions:
+        print(f"РЕГРЕССИЯ: {regression}")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,73 @@
+import logging
+
+import numpy as np
+import pandas as pd
+
+from src.config import logs_path
+from src.query import Source, TransactionQuery, as_query, partial_argsort
+
+logging.basicConfig(
+    filename=f"{logs_path}/logs.log",
+    encoding="utf-8",
+    filemode="w",
+    level=logging.DEBUG,
+    format="%(asctime)s - %(filename)s - %(levelname)s: %(message)s",
+)
+
+logger_util = logging.getLogger("app.top_n")
+
+MONTH_COLUMN = "Месяц"
+# Строка с суммой групп, не вошедших в топ (разделы «Основные»)
+REMAINDER_LABEL = "Остальное"
+
+
+def _group_keys(query: TransactionQuery, rows: np.ndarray, per: tuple[str, ...]) -> pd.DataFrame:
+    """Значения ключей группировки (колонки per) для отобранных строк"""
+    keys = {}
+    for column in per:
+        if column == MONTH_COLUMN:
+            keys[column] = query.dates().to_numpy()[rows].astype("datetime64[M]").astype(str)
+        else:
+            keys[column] = query.frame[column].to_numpy()[rows]
+    return pd.DataFrame(keys)
+
+
+def top_n(
+    data: Source,
+    column: str = "Сумма платежа",
+    n: int = 5,
+    largest: bool = True,
+    per: tuple[str, ...] = (),
+    columns: tuple[str, ...] | None = None,
+) -> pd.DataFrame:
+    """
+    Функция, которая выдает n операций с наибольшим (наименьшим при largest=False) значением
+    колонки column. Если задан per (например ("Номер карты",) или ("Категория", "Месяц")),
+    строки упорядочиваются по (группа, значение) одной векторной сортировкой, и в каждой группе
+    берутся первые n. Без per полная сортировка не выполняется (argpartition).
+    Операции с пропуском в колонке column в выборку не попадают.
+    """
+    logger_util.info(f"Запуск функции отбора топ-{n} операций по колонке {column}")
+    query = as_query(data)
+    rows = np.flatnonzero(query.mask())
+    rows = rows[query.frame[column].notna().to_numpy()[rows]]
+    values = query.frame[column].to_numpy()[rows]
+    if not per:
+        selected = rows[partial_argsort(values, n, ascending=not largest)]
+        result = query.frame.iloc[selected]
+    else:
+        key_frame = _group_keys(query, rows, per)
+        codes = key_frame.groupby(list(per), sort=True).ngroup().fillna(-1).to_numpy(dtype="int64")
+        ranked = pd.DataFrame({"code": codes, "value": values, "position": rows})
+        ranked = ranked.loc[codes >= 0].sort_values(
+            ["code", "value", "position"], ascending=[True, not largest, True], kind="stable"
+        )
+        selected_list = ranked.groupby("code", sort=False).head(max(n, 0))["position"].to_numpy()
+        result = query.frame.iloc[selected_list]
+        if MONTH_COLUMN in per:
+            months = pd.Series(key_frame[MONTH_COLUMN].to_numpy(), index=rows)
+            result = result.assign(**{MONTH_COLUMN: months.loc[selected_list].to_numpy()})
+    if columns is not None:
+        result = result.loc[:, list(columns)]
+    logger_util.info(f"Отбор топ-{n} операций завершен, строк: {len(result)}")
+    return result
@@ -1,14 +1,33 @@
+import asyncio
 import json
 import logging
 import os
+import threading
+import time
 from datetime import datetime, timedelta
 from typing import Any, Hashable
 
+import numpy as np
 import pandas as pd
 import requests
 from dotenv import load_dotenv
 
 from src.config import logs_path, root_path, user_settings_file
+from src.engines import Table, engine_for
+from src.ingest import ingest_statement
+from src.query import DATE_COLUMN, as_query
+from src.quota import (
+    DEFAULT_TIMEOUT,
+    DEFAULT_USER,
+    INTERACTIVE,
+    QuotaExceeded,
+    is_daily_limit,
+    is_rate_limited,
+    stock_quota,
+)
+from src.snapshot import attach_snapshot
+from src.top_n import REMAINDER_LABEL
+from src.xlsx import read_statement
 
 load_dotenv()
 api_key = os.getenv("Alpha_Vantage_API_KEY")
@@ -23,19 +42,140 @@ logging.basicConfig(
 
 logger_util = logging.getLogger("app.services")
 
+CBR_DAILY_URL = "https://www.cbr-xml-daily.ru/daily_json.js"
+ALPHA_VANTAGE_URL = "https://www.alphavantage.co/query"
+RATE_LIMIT_RETRIES = 2
+FETCH_TIMEOUT = 10
+
 
-def read_info(path_xls: str) -> pd.DataFrame | None:
+class SingleFlight:
+    """
+    Объединение одновременных запросов: все потоки и корутины, запросившие один и тот же ключ,
+    пока первый запрос еще выполняется, получают его результат (или его ошибку)
+    вместо повторного обращения к внешнему сервису. Присоединившийся вызов ждет не дольше wait
+    секунд, после чего выполняет запрос сам, а не остается привязанным к чужому сроку.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._calls: dict[str, dict[str, Any]] = {}
+        self._stats = {"calls": 0, "executed": 0, "deduplicated": 0, "fallback": 0}
+
+    def _join(self, key: str) -> tuple[dict[str, Any], bool]:
+        with self._lock:
+            self._stats["calls"] += 1
+            call = self._calls.get(key)
+            if call is None:
+                call = {"done": threading.Event(), "result": None, "error": None, "cancelled": False}
+                self._calls[key] = call
+                self._stats["executed"] += 1
+                return call, True
+            self._stats["deduplicated"] += 1
+            return call, False
+
+    def _finish(self, key: str, call: dict[str, Any]) -> None:
+        with self._lock:
+            del self._calls[key]
+        call["done"].set()
+
+    def _fallback(self, key: str) -> None:
+        logger_util.info(f"Запрос {key} не дождался объединенного результата и выполняется отдельно")
+        with self._lock:
+            self._stats["fallback"] += 1
+
+    @staticmethod
+    def _outcome(call: dict[str, Any]) -> Any:
+        if call["error"] is not None:
+            raise call["error"]
+        return call["result"]
+
+    def do(self, key: str, func: Any, *args: Any, wait: float | None = None, **kwargs: Any) -> Any:
+        """
+        Выполняет func(*args, **kwargs) один раз на все одновременные вызовы с ключом key;
+        присоединившийся вызов ждет результата не дольше wait секунд (None - без ограничения),
+        а если ведущий вызов прерван (KeyboardInterrupt, отмена), выполняет func сам
+        """
+        call, leader = self._join(key)
+        if leader:
+            try:
+                call["result"] = func(*args, **kwargs)
+            except Exception as e:
+                call["error"] = e
+            except BaseException:
+                call["cancelled"] = True
+                raise
+            finally:
+                self._finish(key, call)
+        else:
+            logger_util.info(f"Запрос {key} объединен с уже выполняющимся")
+            if not call["done"].wait(wait) or call["cancelled"]:
+                self._fallback(key)
+                return func(*args, **kwargs)
+        return self._outcome(call)
+
+    async def do_async(self, key: str, func: Any, *args: Any, wait: float | None = None, **kwargs: Any) -> Any:
+        """
+        Асинхронный вариант do для корутинной функции func: объединяется и с корутинами,
+        и с потоками, запросившими тот же ключ
+        """
+        call, leader = self._join(key)
+        if leader:
+            try:
+                call["result"] = await func(*args, **kwargs)
+            except Exception as e:
+                call["error"] = e
+            except BaseException:
+                call["cancelled"] = True
+                raise
+            finally:
+                self._finish(key, call)
+        else:
+            logger_util.info(f"Запрос {key} объединен с уже выполняющимся")
+            if not await asyncio.to_thread(call["done"].wait, wait) or call["cancelled"]:
+                self._fallback(key)
+                return await func(*args, **kwargs)
+        return self._outcome(call)
+
+    def stats(self) -> dict[str, int]:
+        """Счетчики: всего вызовов, выполнено запросов, объединено с уже выполняющимися"""
+        with self._lock:
+            return dict(self._stats)
+
+
+market_data_flight = SingleFlight()
+
+
+def stock_flight_key(stock: str, priority: int) -> str:
+    """
+    Функция, которая возвращает ключ объединения запросов стоимости акции: интерактивные
+    и фоновые запросы не объединяются, чтобы страница не ждала фоновый запрос с долгим сроком
+    """
+    return f"stock:{stock}:{priority}"
+
+
+def fetch_json(url: str, timeout: int = FETCH_TIMEOUT) -> Any:
+    """Функция, которая выполняет GET запрос и возвращает JSON ответа"""
+    return requests.get(url, timeout=timeout).json()
+
+
+def read_info(path_xls: str, snapshot: str | None = None) -> pd.DataFrame | None:
     """
     Функция для считывания финансовых операций из Excel,
     принимает путь к файлу Excel в качестве аргумента.
+    Если задан каталог snapshot, операции берутся из общего для всех процессов
+    снимка в памяти (mmap), а при изменении файла в снимок дописываются только новые операции.
     """
     logger_util.info("Запуск функции чтения данных из файла")
     try:
-        df = pd.read_excel(path_xls)
+        if snapshot is not None:
+            df = attach_snapshot(snapshot, path_xls)
+            if df is None:
+                ingest_statement(path_xls, snapshot)
+                df = attach_snapshot(snapshot)
+            logger_util.info(f"Файл {path_xls} корректно прочитан")
+            return df
+        df = read_statement(path_xls)
         logger_util.info(f"Файл {path_xls} корректно прочитан")
-
-        df = df[df["Статус"] == "OK"]
-
         return df
     except FileNotFoundError:
         logger_util.error(f"Файл {path_xls} не найден")
@@ -96,81 +236,146 @@ def output_date(date_str: str, diapason: str = "M") -> datetime | str:
         return "Ошибка даты"
 
 
-def sorted_by_date(df: pd.DataFrame, date_str: str, diapason: str = "M") -> pd.DataFrame:
+def date_window(data: Table, date_str: str, diapason: str = "M") -> Table:
+    """
+    Функция, которая принимает данные, конечную дату и диапазон и возвращает операции
+    в этом диапазоне (W - неделя, M - месяц, Y = год, All = все опрерации).
+    Для таблицы pandas это ленивый запрос, для таблицы Arrow - отобранная таблица.
+    """
+    end_date = datetime.strptime(date_str, "%Y-%m-%d %H:%M:%S")
+    start_date = output_date(date_str, diapason)
+    if not isinstance(start_date, datetime):
+        raise ValueError(f"Ошибка даты: неизвестный диапазон {diapason}")
+    return engine_for(data).window(data, start_date, end_date)
+
+
+def sorted_by_date(df: Table, date_str: str, diapason: str = "M") -> pd.DataFrame:
     """
     Функция, которая принимает данные, конечную дату и диапазон и выдает все операции
     в этом диапазоне (W - неделя, M - месяц, Y = год, All = все опрерации)
     """
     logger_util.info("Запуск функции сортировки данных по диапазону дат")
-    df = df.assign(daytime=pd.to_datetime(df["Дата операции"], format="%d.%m.%Y %H:%M:%S"))
-    end_date = datetime.strptime(date_str, "%Y-%m-%d %H:%M:%S")
-    start_date = output_date(date_str, diapason)
-    df = df[df["daytime"].between(start_date, end_date)]
-    df = df.sort_values(by="daytime", ascending=False)
-    df = df.drop("daytime", axis=1)
+    operations = engine_for(df).to_frame(date_window(df, date_str, diapason))
+    df = as_query(operations).sort(DATE_COLUMN, ascending=False).collect()
     logger_util.info("Сортировка данных по диапазону дат успешна")
     return df
 
 
-def cards_info(df: pd.DataFrame) -> list:
+def _using(df: Table, backend: str | None) -> Table:
+    # движок группировки для одного вызова: глобальный set_aggregation_backend общий для всех потоков
+    if backend is None or engine_for(df).name != "pandas":
+        return df
+    return as_query(df).using(backend)
+
+
+def cards_info(df: Table, backend: str | None = None) -> list:
     """
     Функция, которая принимает отсортированные данные и выдает информацию по картам:
         последние 4 цифры карты;
         общая сумма расходов;
         кешбэк (1 рубль на каждые 100 рублей).
         Возвращает список.
+    backend - движок группировки для этого вызова (pandas или numpy, None - движок по умолчанию).
     """
     logger_util.info("Запуск функции сбора информации по кредитным картам для страницы Main")
-    df = df[df["Сумма платежа"] < 0]
-    df = df.loc[:, ["Номер карты", "Сумма платежа"]].groupby("Номер карты").sum().reset_index()
-    df["Номер карты"] = df["Номер карты"].str.slice(1)
-    df["Сумма платежа"] = df["Сумма платежа"] * -1
-    df["Сумма платежа"] = df["Сумма платежа"].round(2)
-    df = df.assign(cashback=(df["Сумма платежа"] / 100))
-    df["cashback"] = df["cashback"].round(2)
-    df.rename(columns={"Номер карты": "last_digits"}, inplace=True)
-    df.rename(columns={"Сумма платежа": "total_spent"}, inplace=True)
-    df_list = df.to_dict(orient="records")
+    df = _using(df, backend)
+    engine = engine_for(df)
+    sums = engine.group_sum(engine.filter(df, "Сумма платежа", "<", 0), "Номер карты", "Сумма платежа")
+    df_list = []
+    for card in engine.to_records(sums):
+        total_spent = float(np.round(card["Сумма платежа"] * -1, 2))
+        df_list.append(
+            {
+                "last_digits": card["Номер карты"][1:],
+                "total_spent": total_spent,
+                "cashback": float(np.round(total_spent / 100, 2)),
+            }
+        )
     logger_util.info("Информация по кредитным картам для страницы Main собрана корректно")
     return df_list
 
 
-def top_transactions(df: pd.DataFrame) -> list:
-    """Функция, которая принимает данные и выдает информацию - топ-5 транзакций по сумме платежа."""
+def top_transactions(df: Table, n: int = 5) -> list:
+    """Функция, которая принимает данные и выдает информацию - топ-5 (топ-n) транзакций по сумме платежа."""
     logger_util.info("Запуск функции сбора топ-5 транзакций по сумме платежа для страницы Main")
-    df = df[df["Сумма платежа"] < 0]
-    df = df.sort_values(by="Сумма платежа", ascending=True)
-    df = df.loc[:, ["Дата операции", "Сумма платежа", "Категория", "Описание"]]
-    df = df[:5]
-    df["Сумма платежа"] = df["Сумма платежа"] * -1
-    df["Дата операции"] = df["Дата операции"].str.slice(0, 10)
-    df.rename(columns={"Дата операции": "date"}, inplace=True)
-    df.rename(columns={"Сумма платежа": "amount"}, inplace=True)
-    df.rename(columns={"Категория": "category"}, inplace=True)
-    df.rename(columns={"Описание": "description"}, inplace=True)
-    df_list = df.to_dict(orient="records")
+    engine = engine_for(df)
+    top = engine.top_n(
+        engine.filter(df, "Сумма платежа", "<", 0),
+        "Сумма платежа",
+        n,
+        largest=False,
+        columns=("Дата операции", "Сумма платежа", "Категория", "Описание"),
+    )
+    df_list = [
+        {
+            "date": row["Дата операции"][0:10],
+            "amount": row["Сумма платежа"] * -1,
+            "category": row["Категория"],
+            "description": row["Описание"],
+        }
+        for row in engine.to_records(top)
+    ]
     logger_util.info("Топ-5 транзакций по сумме платежа для страницы Main собрана корректно")
     return df_list
 
 
+def select_rates(data: dict, valute_list: list) -> list:
+    """Функция, которая выбирает из ответа ЦБ курсы валют из настроек пользователя"""
+    data = data["Valute"]
+    sample_valute = {}
+    sorted_valute = []
+    for valute in valute_list:
+        for key, value in data.items():
+            if key == valute:
+                sample_valute["currency"] = valute
+                sample_valute["rate"] = round(value["Value"], 2)
+                sorted_valute.append(sample_valute)
+                sample_valute = {}
+            else:
+                continue
+    return sorted_valute
+
+
+def stock_url(stock: str) -> str:
+    """Функция, формирующая адрес запроса стоимости акции к Alpha Vantage"""
+    return f"{ALPHA_VANTAGE_URL}?function=GLOBAL_QUOTE&symbol={stock}&apikey={api_key}"
+
+
+def select_stock_price(stock: str, data: dict) -> dict:
+    """Функция, которая выбирает стоимость акции из ответа Alpha Vantage"""
+    return {"stock": stock, "price": round(float(data["Global Quote"]["05. price"]), 2)}
+
+
+def fetch_stock_quote(
+    stock: str, user: str = DEFAULT_USER, priority: int = INTERACTIVE, timeout: float | None = DEFAULT_TIMEOUT
+) -> Any:
+    """
+    Функция, которая запрашивает стоимость акции у Alpha Vantage в пределах квоты stock_quota:
+    запрос ждет разрешения планировщика (не дольше timeout секунд), а при ответе о превышении
+    лимита квота обнуляется и запрос повторяется. QuotaExceeded - если квота не освободилась вовремя.
+    """
+    deadline = None if timeout is None else time.monotonic() + timeout
+    data: Any = None
+    for _ in range(RATE_LIMIT_RETRIES + 1):
+        remaining = None if deadline is None else max(deadline - time.monotonic(), 0.0)
+        stock_quota.acquire(user, priority, remaining)
+        data = fetch_json(stock_url(stock))
+        if not is_rate_limited(data):
+            return data
+        stock_quota.report_limited(is_daily_limit(data))
+    return data
+
+
 def currency_rates() -> list | str:
     """Функция получения курса валют"""
     try:
         logger_util.info("Запуск функции получения курса валют")
         valute_list = read_user_settings("user_currencies")
-        data = requests.get("https://www.cbr-xml-daily.ru/daily_json.js").json()
-        data = data["Valute"]
-        sample_valute = {}
-        sorted_valute = []
-        for valute in valute_list:
-            for key, value in data.items():
-                if key == valute:
-                    sample_valute["currency"] = valute
-                    sample_valute["rate"] = round(value["Value"], 2)
-                    sorted_valute.append(sample_valute)
-                    sample_valute = {}
-                else:
-                    continue
+        if valute_list is None:
+            logger_util.error("Ошибка получения курса валют: не прочитан список валют пользователя")
+            return "Ошибка получения курса валют: не прочитан список валют пользователя"
+        data = market_data_flight.do("cbr", fetch_json, CBR_DAILY_URL, wait=FETCH_TIMEOUT)
+        sorted_valute = select_rates(data, valute_list)
         logger_util.info("Курсы валют собраны успешно")
         return sorted_valute
     except requests.exceptions.RequestException as e:
@@ -181,21 +386,35 @@ def currency_rates() -> list | str:
         return f"Ошибка получения курса валют. Код ошибки {e}"
 
 
-def stocks_prices() -> list | str:
-    """Функция получения стоимости акций"""
+def stocks_prices(
+    user: str = DEFAULT_USER, priority: int = INTERACTIVE, timeout: float | None = DEFAULT_TIMEOUT
+) -> list | str:
+    """
+    Функция получения стоимости акций. Запросы к Alpha Vantage проходят через планировщик квоты
+    (priority - INTERACTIVE или BACKGROUND, user - чей это запрос); акция, для которой квота
+    не освободилась за timeout секунд или поставщик отказал по лимиту, выводится с ценой None.
+    """
     try:
         logger_util.info("Запуск функции получения стоимости акций")
         stock_list = read_user_settings("user_stocks")
-        sample_stock = {}
+        if stock_list is None:
+            logger_util.error("Ошибка получения стоимости акций: не прочитан список акций пользователя")
+            return "Ошибка получения стоимости акций: не прочитан список акций пользователя"
         sorted_stock = []
         for stock in stock_list:
-            url = f"https://www.alphavantage.co/query?function=GLOBAL_QUOTE&symbol={stock}&apikey={api_key}"
-            response = requests.get(url, timeout=10)
-            stock_price = round(float(response.json()["Global Quote"]["05. price"]), 2)
-            sample_stock["stock"] = stock
-            sample_stock["price"] = stock_price
-            sorted_stock.append(sample_stock)
-            sample_stock = {}
+            try:
+                data = market_data_flight.do(
+                    stock_flight_key(stock, priority), fetch_stock_quote, stock, user, priority, timeout, wait=timeout
+                )
+            except QuotaExceeded as e:
+                logger_util.error(f"Стоимость акции {stock} не получена: {e}")
+                sorted_stock.append({"stock": stock, "price": None})
+                continue
+            if is_rate_limited(data):
+                logger_util.error(f"Стоимость акции {stock} не получена: превышен лимит запросов")
+                sorted_stock.append({"stock": stock, "price": None})
+                continue
+            sorted_stock.append(select_stock_price(stock, data))
             logger_util.info("Стоимости акций собраны успешно")
         return sorted_stock
     except requests.exceptions.RequestException as e:
@@ -206,68 +425,61 @@ def stocks_prices() -> list | str:
         return f"Ошибка получения стоимости акций. Код ошибки: {e}"
 
 
-def total_expenses(df: pd.DataFrame) -> int:
+def total_expenses(df: Table) -> int:
     """Функция, подсчитывающая общую сумму расходов"""
     logger_util.info("Запуск функции подсчета суммы всех расходов за период")
-    df = df[df["Сумма платежа"] < 0]
-    total = df["Сумма платежа"].sum().sum()
+    engine = engine_for(df)
+    total = engine.total(engine.filter(df, "Сумма платежа", "<", 0), "Сумма платежа")
     logger_util.info("Подсчет суммы всех расходов за период успешен")
     return round(int(total * -1), 2)
 
 
-def expenses_by_category(df: pd.DataFrame) -> list[dict[Hashable, Any]]:
+def _top_categories(df: Table, op: str, n: int, largest: bool, backend: str | None) -> list[dict]:
+    # n категорий с наибольшей (наименьшей) суммой и строка «Остальное» с суммой прочих категорий
+    df = _using(df, backend)
+    engine = engine_for(df)
+    sums = engine.group_sum(engine.filter(df, "Сумма платежа", op, 0), "Категория", "Сумма платежа")
+    top: list[dict] = engine.to_records(engine.top_n(sums, "Сумма платежа", n, largest))
+    selected = {row["Категория"] for row in top}
+    rest = [row["Сумма платежа"] for row in engine.to_records(sums) if row["Категория"] not in selected]
+    return top + [{"Категория": REMAINDER_LABEL, "Сумма платежа": float(np.nansum(rest))}]
+
+
+def expenses_by_category(df: Table, n: int = 7, backend: str | None = None) -> list[dict[Hashable, Any]]:
     """
     Функция, формирующая раздел «Основные», в котором траты по категориям
-    отсортированы по убыванию. Данные предоставляются по 7 категориям с
+    отсортированы по убыванию. Данные предоставляются по 7 (n) категориям с
     наибольшими тратами, траты по остальным категориям суммируются и попадают
-    в категорию «Остальное».
+    в категорию «Остальное». backend - движок группировки, как в cards_info.
     """
     logger_util.info("Запуск функции подсчета расходов за период по категориям")
-    df = df[df["Сумма платежа"] < 0]
-    df["Сумма платежа"] = df["Сумма платежа"] * -1
-    df = df.loc[:, ["Сумма платежа", "Категория"]].groupby("Категория").sum().reset_index()
-    df = df.sort_values(by="Сумма платежа", ascending=False)
-    df_top = df[:7]
-    df_other = df[8:]
-    df_other_sum = float(df_other["Сумма платежа"].sum())
-    new_row = pd.DataFrame([{"Категория": "Остальное", "Сумма платежа": df_other_sum}])
-    df = pd.concat([df_top, new_row], ignore_index=True)
-    df.rename(columns={"Категория": "category"}, inplace=True)
-    df.rename(columns={"Сумма платежа": "amount"}, inplace=True)
-    df_list = df.to_dict(orient="records")
-    for amount in df_list:
-        amount["amount"] = round(amount["amount"], 2)
+    df_list: list[dict[Hashable, Any]] = [
+        {"category": row["Категория"], "amount": round(row["Сумма платежа"] * -1, 2)}
+        for row in _top_categories(df, "<", n, False, backend)
+    ]
     logger_util.info("Подсчет всех расходов за период по категориям успешен")
     return df_list
 
 
-def total_income(df: pd.DataFrame) -> Any:
+def total_income(df: Table) -> Any:
     """Функция, подсчитывающая общую сумму поступлений"""
     logger_util.info("Запуск функции подсчета суммы всех поступлений за период")
-    df = df[df["Сумма платежа"] > 0]
-    total = df["Сумма платежа"].sum().sum()
+    engine = engine_for(df)
+    total = engine.total(engine.filter(df, "Сумма платежа", ">", 0), "Сумма платежа")
     logger_util.info("Подсчет суммы всех поступлений за период успешен")
     return round(total, 2)
 
 
-def income_by_category(df: pd.DataFrame) -> list:
+def income_by_category(df: Table, n: int = 7, backend: str | None = None) -> list:
     """
     Функция, формирующая раздел «Основные», в котором поступления по
-    категориям отсортированы по убыванию.
+    категориям отсортированы по убыванию (n категорий и «Остальное»).
+    backend - движок группировки, как в cards_info.
     """
     logger_util.info("Запуск функции подсчета поступлений за период по категориям")
-    df = df[df["Сумма платежа"] > 0]
-    df = df.loc[:, ["Сумма платежа", "Категория"]].groupby("Категория").sum().reset_index()
-    df = df.sort_values(by="Сумма платежа", ascending=False)
-    df_top = df[:7]
-    df_other = df[8:]
-    df_other_sum = float(round(df_other["Сумма платежа"].sum(), 2))
-    new_row = pd.DataFrame([{"Категория": "Остальное", "Сумма платежа": df_other_sum}])
-    df = pd.concat([df_top, new_row], ignore_index=True)
-    df.rename(columns={"Категория": "category"}, inplace=True)
-    df.rename(columns={"Сумма платежа": "amount"}, inplace=True)
-    df_list = df.to_dict(orient="records")
-    for x in df_list:
-        x["amount"] = round(x["amount"], 2)
+    df_list = [
+        {"category": row["Категория"], "amount": round(row["Сумма платежа"], 2)}
+        for row in _top_categories(df, ">", n, True, backend)
+    ]
     logger_util.info("Подсчет всех поступлений за период по категориям успешен")
     return df_list
@@ -1,16 +1,24 @@
 import json
 import logging
 from datetime import datetime
+from typing import Any, Callable, Iterable
 
-from src.config import data_file, logs_path, root_path
+import pandas as pd
+
+from src.config import data_file, logs_path, rates_file, root_path, snapshot_path
+from src.engines import Table, get_engine
+from src.ingest import ingest_statement
+from src.rates import BASE_CURRENCY, normalize_currency
 from src.services import cashback, search_name, search_number, search_word
+from src.sketch import load_sketches, spend_quantiles
 from src.utils import (
     cards_info,
     currency_rates,
+    date_window,
     expenses_by_category,
     income_by_category,
+    output_date,
     read_info,
-    sorted_by_date,
     stocks_prices,
     top_transactions,
     total_expenses,
@@ -51,7 +59,128 @@ def greeting() -> str | None:
         return None
 
 
-def json_answer_main(start_date_str: str, diapason: str = "M") -> str:
+def statement(currency: str | None = None) -> Table:
+    """
+    Функция, которая возвращает успешные операции выписки (при указанной валюте - пересчитанные
+    в нее) в виде таблицы движка, выбранного настройкой DATAFRAME_ENGINE
+    """
+
+    def load() -> pd.DataFrame | None:
+        operations = read_info(data_file, snapshot_path)
+        if operations is None or currency is None:
+            return operations
+        return normalize_currency(operations, currency)
+
+    depends = () if currency is None else (rates_file,)
+    return get_engine().open(data_file, load, currency or "raw", depends)
+
+
+def page_operations(start_date_str: str, diapason: str = "M", currency: str = BASE_CURRENCY) -> Table:
+    """Функция, которая возвращает операции страницы за диапазон дат в выбранной валюте"""
+    return date_window(statement(currency), start_date_str, diapason)
+
+
+def _events_totals(operations: Table, total: Callable, by_category: Callable) -> dict:
+    return {"total_amount": round(float(total(operations)), 2), "main": by_category(operations)}
+
+
+# Разделы страниц в порядке вывода в ответе
+PAGE_SECTIONS = {
+    "main": ("greeting", "cards", "top_transactions", "currency_rates", "stock_prices"),
+    "events": ("expenses", "income", "currency_rates", "stock_prices"),
+}
+# Разделы страниц, которые считаются только по операциям (без приветствия и запросов в сеть)
+OPERATION_SECTIONS = {"main": ("cards", "top_transactions"), "events": ("expenses", "income")}
+# Граф расчета разделов: имя -> (зависимости, функция от значений зависимостей).
+# request - параметры запроса (дата, диапазон, валюта), operations - операции страницы за диапазон;
+# функции обращаются к именам модуля при вызове, поэтому их можно подменять в тестах
+SECTION_GRAPH: dict[str, tuple[tuple[str, ...], Callable[..., Any]]] = {
+    "operations": (("request",), lambda request: page_operations(*request)),
+    "greeting": ((), lambda: greeting()),
+    "cards": (("operations",), lambda operations: cards_info(operations)),
+    "top_transactions": (("operations",), lambda operations: top_transactions(operations)),
+    "expenses": (("operations",), lambda operations: _events_totals(operations, total_expenses, expenses_by_category)),
+    "income": (("operations",), lambda operations: _events_totals(operations, total_income, income_by_category)),
+    "currency_rates": ((), lambda: currency_rates()),
+    "stock_prices": ((), lambda: stocks_prices()),
+}
+
+
+def select_sections(page: str, sections: Iterable[str] | None = None) -> tuple[str, ...]:
+    """
+    Функция, которая проверяет запрошенные разделы страницы page и возвращает их в порядке вывода
+    (все разделы страницы, если sections не задан)
+    """
+    if page not in PAGE_SECTIONS:
+        raise ValueError(f"Неизвестная страница: {page}")
+    available = PAGE_SECTIONS[page]
+    if sections is None:
+        return available
+    requested = set(sections)
+    unknown = requested.difference(available)
+    if unknown:
+        raise ValueError(f"Неизвестные разделы страницы {page}: {', '.join(sorted(unknown))}")
+    return tuple(name for name in available if name in requested)
+
+
+def evaluate_sections(names: Iterable[str], known: dict[str, Any]) -> dict[str, Any]:
+    """
+    Функция, которая рассчитывает разделы names по графу SECTION_GRAPH: каждая зависимость
+    считается не более одного раза и используется всеми разделами, которым она нужна,
+    а разделы, не нужные для names, не считаются совсем. known - уже готовые значения.
+    """
+    values = dict(known)
+
+    def resolve(name: str) -> Any:
+        if name not in values:
+            if name not in SECTION_GRAPH:
+                raise ValueError(f"Неизвестный раздел страницы: {name}")
+            depends, compute = SECTION_GRAPH[name]
+            values[name] = compute(*(resolve(depend) for depend in depends))
+        return values[name]
+
+    for name in names:
+        resolve(name)
+    return values
+
+
+def render_page(
+    page: str,
+    start_date_str: str,
+    diapason: str = "M",
+    currency: str = BASE_CURRENCY,
+    sections: Iterable[str] | None = None,
+) -> dict:
+    """Функция, которая рассчитывает только запрошенные разделы страницы page ("main" или "events")"""
+    selected = select_sections(page, sections)
+    values = evaluate_sections(selected, {"request": (start_date_str, diapason, currency)})
+    return {name: values[name] for name in selected}
+
+
+def compute_sections(operations: Table, sections: Iterable[str]) -> dict:
+    """
+    Функция, которая считает по операциям страницы разделы sections, зависящие только от операций
+    (например OPERATION_SECTIONS["main"] или OPERATION_SECTIONS["events"])
+    """
+    sections = tuple(sections)
+    values = evaluate_sections(sections, {"operations": operations})
+    return {name: values[name] for name in sections}
+
+
+def save_answer(answer_dict: dict, file_name: str) -> str:
+    """Функция, которая формирует JSON ответ и записывает его в файл data/<file_name>"""
+    answer_string = json.dumps(answer_dict, ensure_ascii=False, indent=4)
+    with open(f"{root_path}/data/{file_name}", "w", encoding="utf-8") as f:
+        json.dump(answer_string, f, ensure_ascii=False, indent=4)
+    return answer_string
+
+
+def json_answer_main(
+    start_date_str: str,
+    diapason: str = "M",
+    currency: str = BASE_CURRENCY,
+    sections: Iterable[str] | None = None,
+) -> str:
     """
     Функция, формирующая JSON ответ для страницы "Главная":
         Приветствие в формате "???", где ??? — «Доброе утро» / «Добрый день» /
@@ -64,22 +193,21 @@ def json_answer_main(start_date_str: str, diapason: str = "M") -> str:
         Топ-5 транзакций по сумме платежа.
         Курс валют.
         Стоимость акций из S&P500.
+        Суммы выражаются в валюте currency (по курсу ЦБ на дату операции).
+        Если задан sections, считаются и выводятся только эти разделы
+        (greeting, cards, top_transactions, currency_rates, stock_prices).
         Возвращает строку в формате JSON.
     """
-    answer_dict: dict = {
-        "greeting": greeting(),
-        "cards": cards_info(sorted_by_date(read_info(data_file), start_date_str, diapason)),
-        "top_transactions": top_transactions(sorted_by_date(read_info(data_file), start_date_str, diapason)),
-        "currency_rates": currency_rates(),
-        "stock_prices": stocks_prices(),
-    }
-    answer_string = json.dumps(answer_dict, ensure_ascii=False, indent=4)
-    with open(f"{root_path}/data/answer_main.json", "w", encoding="utf-8") as f:
-        json.dump(answer_string, f, ensure_ascii=False, indent=4)
-    return answer_string
+    answer_dict = render_page("main", start_date_str, diapason, currency, sections)
+    return save_answer(answer_dict, "answer_main.json")
 
 
-def json_answer_events(start_date_str: str, diapason: str = "M") -> str:
+def json_answer_events(
+    start_date_str: str,
+    diapason: str = "M",
+    currency: str = BASE_CURRENCY,
+    sections: Iterable[str] | None = None,
+) -> str:
     """
     Функция, формирующая JSON ответ для страницы "События":
         «Расходы»:
@@ -92,28 +220,13 @@ def json_answer_events(start_date_str: str, diapason: str = "M") -> str:
             Раздел «Основные», в котором поступления по категориям отсортированы по убыванию.
         Курс валют.
         Стоимость акций из S&P500.
+        Суммы выражаются в валюте currency (по курсу ЦБ на дату операции).
+        Если задан sections, считаются и выводятся только эти разделы
+        (expenses, income, currency_rates, stock_prices).
         Возвращает строку в формате JSON.
     """
-    answer_dict: dict = {
-        "expenses": {
-            "total_amount": round(
-                float(total_expenses(sorted_by_date(read_info(data_file), start_date_str, diapason))), 2
-            ),
-            "main": expenses_by_category(sorted_by_date(read_info(data_file), start_date_str, diapason)),
-        },
-        "income": {
-            "total_amount": round(
-                float(total_income(sorted_by_date(read_info(data_file), start_date_str, diapason))), 2
-            ),
-            "main": income_by_category(sorted_by_date(read_info(data_file), start_date_str, diapason)),
-        },
-        "currency_rates": currency_rates(),
-        "stock_prices": stocks_prices(),
-    }
-    answer_string = json.dumps(answer_dict, ensure_ascii=False, indent=4)
-    with open(f"{root_path}/data/answer_events.json", "w", encoding="utf-8") as f:
-        json.dump(answer_string, f, ensure_ascii=False, indent=4)
-    return answer_string
+    answer_dict = render_page("events", start_date_str, diapason, currency, sections)
+    return save_answer(answer_dict, "answer_events.json")
 
 
 def json_answer_cashback(year_str: str, month_str: str) -> str:
@@ -127,20 +240,60 @@ def json_answer_cashback(year_str: str, month_str: str) -> str:
                     "Категория 3": 500
                 }
     """
-    answer_dict: dict = {"cashback": cashback(read_info(data_file), year_str, month_str)}
-    answer_string = json.dumps(answer_dict, ensure_ascii=False, indent=4)
-    with open(f"{root_path}/data/answer_events.json", "w", encoding="utf-8") as f:
-        json.dump(answer_string, f, ensure_ascii=False, indent=4)
-    return answer_string
+    operations = statement()
+    answer_dict: dict = {"cashback": cashback(operations, year_str, month_str)}
+    return save_answer(answer_dict, "answer_events.json")
 
 
-def json_answer_search(search_data: str) -> str | None:
+def spend_distribution(start_date_str: str, diapason: str = "M") -> dict:
+    """
+    Функция, которая возвращает приблизительные медиану, p90 и p99 сумм расходов за диапазон
+    (всего, по категориям и по картам) из скетчей, накопленных при загрузке выписки в снимок.
+    Окно берется целыми днями; операции заново не просматриваются и не сортируются.
+    """
+    end_date = datetime.strptime(start_date_str, "%Y-%m-%d %H:%M:%S")
+    start_date = output_date(start_date_str, diapason)
+    if not isinstance(start_date, datetime):
+        raise ValueError(f"Ошибка даты: неизвестный диапазон {diapason}")
+    read_info(data_file, snapshot_path)
+    sketches = load_sketches(snapshot_path)
+    if sketches is None:
+        # Снимок загружен до появления скетчей: загрузка выписки достроит их по всем операциям
+        ingest_statement(data_file, snapshot_path)
+        sketches = load_sketches(snapshot_path)
+    return spend_quantiles(sketches or {}, start_date, end_date)
+
+
+def json_answer_distribution(start_date_str: str, diapason: str = "M") -> str:
+    """
+    Функция, формирующая JSON ответ с распределением трат для страницы "События":
+        Приблизительные медиана, p90 и p99 суммы расхода и число расходов
+        за весь диапазон, по категориям и по картам.
+        Возвращает строку в формате JSON.
+    """
+    answer_dict: dict = {"distribution": spend_distribution(start_date_str, diapason)}
+    return save_answer(answer_dict, "answer_distribution.json")
+
+
+def json_answer_search(
+    search_data: str,
+    limit: int | None = None,
+    cursor: str | None = None,
+    order: str = "rank",
+    columns: list[str] | None = None,
+) -> str | None:
+    """
+    Функция, формирующая JSON ответ поиска: список найденных операций, а если задан limit (или cursor) -
+    страница из limit операций, упорядоченных по order (rank, date, amount), с колонками columns
+    и курсором next_cursor для следующей страницы.
+    """
+    operations = statement()
     if search_data == "cellphone":
-        result = search_number(read_info(data_file), "cellphone")
+        result = search_number(operations, "cellphone", limit, cursor, "date" if order == "rank" else order, columns)
         return result
     elif search_data == "transfer":
-        result = search_name(read_info(data_file), "transfer")
+        result = search_name(operations, "transfer", limit, cursor, "date" if order == "rank" else order, columns)
         return result
     else:
-        result = search_word(read_info(data_file), search_data)
+        result = search_word(operations, search_data, limit, cursor, order, columns)
         return result
@@ -0,0 +1,485 @@
+import functools
+import hashlib
+import logging
+import math
+import posixpath
+import re
+import xml.parsers.expat
+import zipfile
+from array import array
+from datetime import datetime
+from typing import IO, Any, Callable, Iterator
+from xml.sax.saxutils import unescape
+
+import numpy as np
+import pandas as pd
+
+from src.config import logs_path
+from src.query import DATE_COLUMN, DATE_FORMAT
+
+logging.basicConfig(
+    filename=f"{logs_path}/logs.log",
+    encoding="utf-8",
+    filemode="w",
+    level=logging.DEBUG,
+    format="%(asctime)s - %(filename)s - %(levelname)s: %(message)s",
+)
+
+logger_util = logging.getLogger("app.xlsx")
+
+# Схема выписки: колонки в порядке файла и их вид (text - строки, number - числа)
+STATEMENT_SCHEMA = {
+    "Дата операции": "text",
+    "Дата платежа": "text",
+    "Номер карты": "text",
+    "Статус": "text",
+    "Сумма операции": "number",
+    "Валюта операции": "text",
+    "Сумма платежа": "number",
+    "Валюта платежа": "text",
+    "Кэшбэк": "number",
+    "Категория": "text",
+    "MCC": "number",
+    "Описание": "text",
+    "Бонусы (включая кэшбэк)": "number",
+    "Округление на инвесткопилку": "number",
+    "Сумма операции с округлением": "number",
+}
+# Строки, которые pandas.read_excel по умолчанию считает пропуском
+NA_STRINGS = frozenset(
+    {"", "#N/A", "#N/A N/A", "#NA", "-1.#IND", "-1.#QNAN", "-NaN", "-nan", "1.#IND", "1.#QNAN", "<NA>", "N/A", "NA"}
+    | {"NULL", "NaN", "None", "n/a", "nan", "null"}
+)
+# Встроенные форматы дат Excel: такие ячейки openpyxl превращает в datetime
+DATE_FORMAT_IDS = frozenset(range(14, 23)) | {27, 30, 36, 45, 46, 47, 50, 57}
+CHUNK_SIZE = 1 << 16
+
+_CELL = re.compile(rb'<c r="([A-Z]+)(\d+)"([^>]*?)(?:/>|><v>([^<]*)</v></c>|>(.*?)</c>)', re.S)
+_VALUE = re.compile(rb"<v>([^<]*)</v>")
+_INLINE = re.compile(rb"<t(?: [^>]*)?>([^<]*)</t>")
+_TYPE = re.compile(rb' t="(\w+)"')
+_STYLE = re.compile(rb' s="(\d+)"')
+_DATE_TOKENS = re.compile(r"[dmyhs]")
+_NAMESPACE_REL = "http://schemas.openxmlformats.org/officeDocument/2006/relationships"
+
+
+class UnknownLayout(ValueError):
+    """Файл не соответствует известной схеме выписки (читается через pandas)"""
+
+
+@functools.lru_cache(maxsize=None)
+def _local(name: str) -> str:
+    # Имя элемента без префикса или пространства имен
+    return name.rsplit(" ", 1)[-1].rsplit(":", 1)[-1]
+
+
+def _expat(
+    stream: IO[bytes],
+    start: Callable[[str, dict[str, str]], None],
+    end: Callable[[str], None],
+    data: Callable[[str], None],
+) -> None:
+    # Инкрементальный разбор: XML подается парсеру порциями, документ целиком в память не читается
+    parser = xml.parsers.expat.ParserCreate()
+    parser.buffer_text = True
+    parser.StartElementHandler = start
+    parser.EndElementHandler = end
+    parser.CharacterDataHandler = data
+    while chunk := stream.read(CHUNK_SIZE):
+        parser.Parse(chunk, False)
+    parser.Parse(b"", True)
+
+
+def shared_strings(archive: zipfile.ZipFile, path: str = "xl/sharedStrings.xml") -> list[str]:
+    """Функция, которая потоково читает таблицу общих строк книги"""
+    if path not in archive.namelist():
+        return []
+    strings: list[str] = []
+    parts: list[str] = []
+    state = {"text": False, "phonetic": False}
+
+    def start(name: str, attrs: dict) -> None:
+        name = _local(name)
+        if name == "si":
+            parts.clear()
+        elif name == "rPh":
+            state["phonetic"] = True
+        elif name == "t" and not state["phonetic"]:
+            state["text"] = True
+
+    def end(name: str) -> None:
+        name = _local(name)
+        if name == "si":
+            strings.append("".join(parts))
+        elif name == "rPh":
+            state["phonetic"] = False
+        elif name == "t":
+            state["text"] = False
+
+    def data(text: str) -> None:
+        if state["text"]:
+            parts.append(text)
+
+    with archive.open(path) as stream:
+        _expat(stream, start, end, data)
+    return strings
+
+
+def _date_styles(archive: zipfile.ZipFile, path: str = "xl/styles.xml") -> set[int]:
+    # Номера стилей ячеек с форматом даты
+    if path not in archive.namelist():
+        return set()
+    custom: dict[int, str] = {}
+    formats: list[int] = []
+    state = {"xfs": False}
+
+    def start(name: str, attrs: dict) -> None:
+        name = _local(name)
+        if name == "numFmt":
+            custom[int(attrs.get("numFmtId", -1))] = attrs.get("formatCode", "")
+        elif name == "cellXfs":
+            state["xfs"] = True
+        elif name == "xf" and state["xfs"]:
+            formats.append(int(attrs.get("numFmtId", 0)))
+
+    def end(name: str) -> None:
+        if _local(name) == "cellXfs":
+            state["xfs"] = False
+
+    with archive.open(path) as stream:
+        _expat(stream, start, end, lambda text: None)
+
+    def is_date(number: int) -> bool:
+        if number in custom:
+            return bool(_DATE_TOKENS.search(re.sub(r'"[^"]*"|\[[^]]*]', "", custom[number]).lower()))
+        return number in DATE_FORMAT_IDS
+
+    return {style for style, number in enumerate(formats) if is_date(number)}
+
+
+def _first_sheet(archive: zipfile.ZipFile) -> str:
+    # Путь к первому листу книги по workbook.xml и его связям
+    sheets: list[str] = []
+    targets: dict[str, str] = {}
+
+    def workbook_start(name: str, attrs: dict) -> None:
+        if _local(name) == "sheet":
+            sheets.append(attrs.get(f"{_NAMESPACE_REL} id") or attrs.get("r:id", ""))
+
+    def rels_start(name: str, attrs: dict) -> None:
+        if _local(name) == "Relationship":
+            targets[attrs.get("Id", "")] = attrs.get("Target", "")
+
+    try:
+        with archive.open("xl/workbook.xml") as stream:
+            parser = xml.parsers.expat.ParserCreate(namespace_separator=" ")
+            parser.StartElementHandler = workbook_start
+            parser.ParseFile(stream)
+        with archive.open("xl/_rels/workbook.xml.rels") as stream:
+            _expat(stream, rels_start, lambda name: None, lambda text: None)
+    except KeyError:
+        raise UnknownLayout("в книге нет описания листов")
+    if not sheets or sheets[0] not in targets:
+        raise UnknownLayout("не найден первый лист книги")
+    target = targets[sheets[0]]
+    return target.lstrip("/") if target.startswith("/") else posixpath.normpath(posixpath.join("xl", target))
+
+
+class _SheetDigest:
+    """
+    Отпечаток исходного XML строк листа. Если задан номер строки first, строки до нее не разбираются,
+    а только добавляются в отпечаток; prefix - отпечаток этих строк для сверки с предыдущим чтением.
+    """
+
+    def __init__(self, first: int | None = None) -> None:
+        self.hasher = hashlib.blake2b(digest_size=16)
+        self.marker = None if first is None else b'<row r="%d"' % first
+        self.prefix: str | None = None
+
+    def hexdigest(self) -> str:
+        """Отпечаток всех прочитанных строк"""
+        return self.hasher.hexdigest()
+
+
+def _rows_end(pending: bytes, start: int, end: int) -> int:
+    # Конец последней завершенной строки в pending[start:end] (start, если строк нет)
+    position = pending.rfind(b"</row>", start, end)
+    return start if position < 0 else position + len(b"</row>")
+
+
+def _rows(
+    stream: IO[bytes], digest: _SheetDigest | None = None
+) -> Iterator[tuple[int, list[tuple[bytes, bytes, bytes, bytes]]]]:
+    # Потоковый разбор листа: из порции XML выбираются только завершенные строки <row>,
+    # ячейки разбираются одним регулярным выражением без создания объектов XML
+    pending = b""
+    started = False
+    while True:
+        chunk = stream.read(CHUNK_SIZE)
+        pending += chunk
+        if not started:
+            position = pending.find(b"<sheetData")
+            if position < 0:
+                if not chunk:
+                    raise UnknownLayout("в листе нет данных")
+                continue
+            pending = pending[position:]
+            started = True
+        end = pending.rfind(b"</row>") + len(b"</row>") if chunk else len(pending)
+        if end < len(b"</row>"):
+            if not chunk:
+                return
+            continue
+        start = 0
+        if digest is not None:
+            if digest.marker is not None:
+                # Уже загруженные строки только добавляются в отпечаток, регулярное выражение по ним не запускается
+                start = pending.find(digest.marker, 0, end)
+                if start < 0:
+                    digest.hasher.update(pending[: _rows_end(pending, 0, end)])
+                    pending = pending[end:]
+                    if not chunk:
+                        return
+                    continue
+                digest.hasher.update(pending[:start])
+                digest.prefix = digest.hexdigest()
+                digest.marker = None
+            rows_end = _rows_end(pending, start, end)
+            digest.hasher.update(pending[start:rows_end])
+        found = _CELL.findall(pending, start, end)
+        if len(found) != pending.count(b"<c ", start, end):
+            raise UnknownLayout("ячейки без адреса или с другим порядком атрибутов")
+        row_number = b""
+        cells: list[tuple[bytes, bytes, bytes, bytes]] = []
+        for column, number, attrs, value, inner in found:
+            if number != row_number:
+                if cells:
+                    yield int(row_number), cells
+                row_number, cells = number, []
+            cells.append((column, attrs, value, inner))
+        if cells:
+            yield int(row_number), cells
+        pending = pending[end:]
+        if not chunk:
+            return
+
+
+class _Decoder:
+    """Значения ячеек листа: общие строки, числа, встроенные строки; кеши адресов колонок и атрибутов"""
+
+    def __init__(self, strings: list[str], date_styles: set[int]) -> None:
+        self.strings = strings
+        self.date_styles = date_styles
+        self._columns: dict[bytes, int] = {}
+        self._attrs: dict[bytes, bytes] = {}
+        self._texts: dict[str, str] = {}
+
+    def column(self, letters: bytes) -> int:
+        """Номер колонки (с нуля) по буквам адреса"""
+        index = self._columns.get(letters)
+        if index is None:
+            index = 0
+            for letter in letters:
+                index = index * 26 + letter - 64
+            index = self._columns[letters] = index - 1
+        return index
+
+    def kind(self, attrs: bytes) -> bytes:
+        """Тип ячейки по ее атрибутам; числа в формате даты не поддерживаются"""
+        kind = self._attrs.get(attrs)
+        if kind is None:
+            found = _TYPE.search(attrs)
+            kind = found.group(1) if found else b"n"
+            style = _STYLE.search(attrs)
+            if kind == b"n" and style and int(style.group(1)) in self.date_styles:
+                raise UnknownLayout("ячейка с форматом даты")
+            if kind not in (b"n", b"s", b"str", b"e", b"inlineStr"):
+                raise UnknownLayout(f"ячейка типа {kind.decode()}")
+            self._attrs[attrs] = kind
+        return kind
+
+    def value(self, attrs: bytes, value: bytes, inner: bytes) -> str | float | None:
+        """Значение ячейки: строка, число или None (пустая ячейка)"""
+        if not value and not inner:
+            return None
+        kind = self.kind(attrs)
+        if not value:
+            if kind == b"inlineStr":
+                return self.text(b"".join(_INLINE.findall(inner)))
+            found = _VALUE.search(inner)
+            if found is None:
+                return None
+            value = found.group(1)
+        if kind == b"s":
+            return self.strings[int(value)]
+        if kind == b"n":
+            return float(value)
+        return self.text(value)
+
+    def text(self, raw: bytes) -> str:
+        """Строка ячейки; повторяющиеся строки (категории, валюты, статусы) хранятся в одном экземпляре"""
+        value = unescape(raw.decode("utf-8"))
+        return self._texts.setdefault(value, value)
+
+
+def _strings_digest(strings: list[str]) -> str:
+    hasher = hashlib.blake2b(digest_size=16)
+    for string in strings:
+        hasher.update(string.encode("utf-8") + b"\x1f")
+    return hasher.hexdigest()
+
+
+def read_statement_fast(path_xls: str, status: str | None = "OK", dates: bool = False) -> pd.DataFrame:
+    """
+    Функция, которая потоково читает выписку известной схемы (STATEMENT_SCHEMA) прямо в типизированные
+    колонки. Строки со статусом, отличным от status, отбрасываются во время разбора (status=None - все
+    строки); при dates=True дата операции разбирается во время разбора (каждая общая строка один раз).
+    Результат совпадает с pandas.read_excel с последующим фильтром по статусу.
+    Если файл устроен иначе, вызывает UnknownLayout.
+    """
+    return _read_statement_fast(path_xls, status, dates)[0]
+
+
+def read_statement_tail(path_xls: str, known: dict | None = None) -> tuple[pd.DataFrame, dict] | None:
+    """
+    Функция, которая дочитывает выписку после уже загруженного начала. known - состояние предыдущего
+    чтения: число строк листа и отпечатки их исходного XML и таблицы общих строк. Начало файла
+    только сверяется по отпечатку, а разбираются лишь строки после known["rows"] (при known=None - все);
+    статус не фильтруется. Возвращает новые строки (с номерами строк файла в индексе) и состояние
+    для следующего чтения или None, если начало файла изменилось или файл другой схемы.
+    """
+    try:
+        df, state = _read_statement_fast(path_xls, None, False, known, track=True)
+    except (UnknownLayout, zipfile.BadZipFile, OSError, KeyError, IndexError) as e:
+        logger_util.info(f"Выписка {path_xls} не дочитывается потоково: {e}")
+        return None
+    if known is not None and state.pop("prefix") != (known["rows_digest"], known["strings_digest"]):
+        logger_util.info(f"Начало выписки {path_xls} изменилось")
+        return None
+    return df, state
+
+
+def _read_statement_fast(
+    path_xls: str, status: str | None, dates: bool, known: dict | None = None, track: bool = False
+) -> tuple[pd.DataFrame, dict]:
+    # Строки листа до known["rows"] не разбираются: по их исходному XML и первым known["strings"]
+    # общим строкам считается отпечаток начала файла для сверки с сохраненным. При track=True
+    # вторым результатом возвращается состояние чтения (число строк листа и отпечатки) для следующей сверки
+    skip = known["rows"] if known is not None else 0
+    names = list(STATEMENT_SCHEMA)
+    width = len(names)
+    text = [STATEMENT_SCHEMA[name] == "text" for name in names]
+    status_index = names.index("Статус")
+    date_index = names.index(DATE_COLUMN)
+    # Числа копятся в array("d") (8 байт на значение), строки - ссылками на общие строки
+    values: list = [[] if is_text else array("d") for is_text in text]
+    blank: list[Any] = [None if is_text else math.nan for is_text in text]
+    index: list[int] = []
+    # По всем строкам файла (как pandas до фильтра): число значений и наличие дробных чисел в колонке
+    counts = [0] * width
+    fractional = [False] * width
+    parsed_dates: dict[str, datetime | None] = {}
+    total = 0
+    digest = _SheetDigest(skip + 2 if known is not None else None) if track else None
+    last_row = skip + 1
+    with zipfile.ZipFile(path_xls) as archive:
+        strings = shared_strings(archive)
+        decoder = _Decoder(strings, _date_styles(archive))
+        with archive.open(_first_sheet(archive)) as stream:
+            rows = _rows(stream, digest)
+            # Заголовок входит в уже загруженное начало файла, которое сверяется по отпечатку
+            if known is None:
+                header_number, header_cells = next(rows, (None, []))
+                header = [decoder.value(attrs, value, inner) for _, attrs, value, inner in header_cells]
+                if header_number != 1 or header != names:
+                    raise UnknownLayout("заголовок не совпадает со схемой выписки")
+            expected, skipped = skip + 2, False
+            for row_number, cells in rows:
+                last_row = row_number
+                row = blank.copy()
+                filled = 0
+                for letters, attrs, raw, inner in cells:
+                    position = decoder.column(letters)
+                    if position >= width:
+                        raise UnknownLayout("лишние колонки в строке")
+                    value = decoder.value(attrs, raw, inner)
+                    if value is None:
+                        continue
+                    if text[position]:
+                        if not isinstance(value, str):
+                            raise UnknownLayout(f"число в текстовой колонке {names[position]}")
+                        if value in NA_STRINGS:
+                            continue
+                    elif isinstance(value, str):
+                        raise UnknownLayout(f"строка в числовой колонке {names[position]}")
+                    elif not fractional[position] and not value.is_integer():
+                        fractional[position] = True
+                    row[position] = value
+                    counts[position] += 1
+                    filled += 1
+                if not filled:
+                    skipped = True
+                    continue
+                # пустые строки в конце pandas отбрасывает, а в середине оставляет строками пропусков
+                if skipped or row_number != expected:
+                    raise UnknownLayout("пустые строки внутри выписки")
+                expected = row_number + 1
+                total += 1
+                if status is not None and row[status_index] != status:
+                    continue
+                if dates and row[date_index] is not None:
+                    date = row[date_index]
+                    if date not in parsed_dates:
+                        try:
+                            parsed_dates[date] = datetime.strptime(date, DATE_FORMAT)
+                        except ValueError:
+                            parsed_dates[date] = None
+                    row[date_index] = parsed_dates[date]
+                index.append(row_number - 2)
+                for position in range(width):
+                    values[position].append(row[position])
+    columns = {}
+    for position, name in enumerate(names):
+        column = values[position]
+        if dates and position == date_index:
+            columns[name] = pd.Series(pd.to_datetime(column), dtype="datetime64[us]").to_numpy()
+        elif not counts[position]:
+            columns[name] = np.full(len(column), np.nan)
+        elif text[position]:
+            columns[name] = pd.array(column, dtype="str")
+        else:
+            numbers = np.frombuffer(column, dtype="float64").copy()
+            # как pandas.read_excel: колонка целых чисел без пропусков становится целочисленной
+            integer = counts[position] == total and not fractional[position]
+            columns[name] = numbers.astype("int64") if integer else numbers
+    state: dict = {}
+    if digest is not None:
+        state = {
+            "rows": last_row - 1,
+            "rows_digest": digest.hexdigest(),
+            "strings": len(strings),
+            "strings_digest": _strings_digest(strings),
+        }
+        if known is not None:
+            # Если строка после загруженных не найдена, новых строк нет: начало файла - весь лист
+            prefix = digest.prefix if digest.marker is None else digest.hexdigest()
+            strings_prefix = _strings_digest(strings[: known["strings"]]) if len(strings) >= known["strings"] else None
+            state["prefix"] = (prefix, strings_prefix)
+    return pd.DataFrame(columns, index=pd.Index(index, dtype="int64")), state
+
+
+def read_statement(path_xls: str, status: str | None = "OK", dates: bool = False) -> pd.DataFrame:
+    """
+    Функция, которая читает выписку: файл известной схемы - быстрым потоковым разбором,
+    иначе - через pandas.read_excel. Строки со статусом, отличным от status, отбрасываются.
+    """
+    try:
+        return read_statement_fast(path_xls, status, dates)
+    except (UnknownLayout, zipfile.BadZipFile, OSError, KeyError, IndexError) as e:
+        logger_util.info(f"Выписка {path_xls} читается через pandas: {e}")
+    df = pd.read_excel(path_xls)
+    if status is not None:
+        df = df[df["Статус"] == status]
+    if dates:
+        df = df.assign(**{DATE_COLUMN: pd.to_datetime(df[DATE_COLUMN], format=DATE_FORMAT, errors="coerce")})
+    return df
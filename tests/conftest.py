@@ -1,9 +1,43 @@
 import datetime
+import json
+import shutil
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
 from unittest.mock import patch
 
 import pandas as pd
 import pytest
 
+# Модули src настраивают логирование при импорте, поэтому они импортируются в фикстурах,
+# после того как pytest_configure направит логи во временный каталог
+
+
+def pytest_configure(config):
+    from src import config as src_config
+
+    src_config.logs_path = Path(tempfile.mkdtemp(prefix="logs-"))
+
+
+def pytest_unconfigure(config):
+    from src import config as src_config
+
+    shutil.rmtree(src_config.logs_path, ignore_errors=True)
+
+
+@pytest.fixture(autouse=True)
+def output_path(tmp_path):
+    """Файлы ответов (data/*.json) и отчетов тесты пишут во временный каталог, а не в рабочую копию"""
+    (tmp_path / "data").mkdir(exist_ok=True)
+    with (
+        patch("src.reports.root_path", tmp_path),
+        patch("src.services.root_path", tmp_path),
+        patch("src.views.root_path", tmp_path),
+    ):
+        yield tmp_path
+
 
 @pytest.fixture
 def mock_transactions():
@@ -99,3 +133,98 @@ def mock_requests_get():
 @pytest.fixture
 def api_key():
     return "test_api_key"
+
+
+@pytest.fixture
+def market_stub():
+    """Локальная заглушка ЦБ и Alpha Vantage: отвечает с задержкой и считает обращения"""
+    from src.quota import QuotaScheduler
+
+    hits: dict = {}
+    lock = threading.Lock()
+
+    class Handler(BaseHTTPRequestHandler):
+        delay = 0.2
+
+        def do_GET(self):
+            with lock:
+                hits[self.path] = hits.get(self.path, 0) + 1
+            time.sleep(self.delay)
+            if "daily_json" in self.path:
+                body = {"Valute": {"USD": {"ID": "R01235", "Value": 73.2155}, "EUR": {"ID": "R01239", "Value": 80.0}}}
+            else:
+                body = {"Global Quote": {"05. price": "150.123"}}
+            data = json.dumps(body).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+    with (
+        patch("src.utils.CBR_DAILY_URL", f"{base_url}/daily_json.js"),
+        patch("src.utils.ALPHA_VANTAGE_URL", f"{base_url}/query"),
+        patch("src.utils.stock_quota", QuotaScheduler(per_minute=None, per_day=None)),
+    ):
+        yield {"url": base_url, "hits": hits, "handler": Handler}
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def limited_stock_server():
+    """
+    Фабрика заглушек Alpha Vantage, которые сами соблюдают лимиты per_minute и per_day
+    (минута и день сжаты в time_scale раз): сверх лимита отвечают, как поставщик, "Note" или "Information".
+    Запрос, пришедший раньше пополнения не более чем на jitter секунд (задержка сети), принимается.
+    """
+    from src.quota import DAY, MINUTE, TokenBucket
+
+    jitter = 0.02
+    servers = []
+
+    def start(per_minute: int, per_day: int, time_scale: float) -> dict:
+        stats = {"served": 0, "limited": 0}
+        lock = threading.Lock()
+        minute = TokenBucket(per_minute, MINUTE * time_scale)
+        day = TokenBucket(per_day, DAY * time_scale)
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                with lock:
+                    if day.wait_time() > jitter:
+                        body = {"Information": "Our standard API rate limit is 25 requests per day."}
+                    elif minute.wait_time() > jitter:
+                        body = {"Note": "Our standard API call frequency is 5 calls per minute."}
+                    else:
+                        minute.take()
+                        day.take()
+                        body = {"Global Quote": {"05. price": "150.123"}}
+                    stats["served" if "Global Quote" in body else "limited"] += 1
+                data = json.dumps(body).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        return {"url": f"http://127.0.0.1:{server.server_address[1]}/query", "stats": stats}
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,85 @@
+import asyncio
+import json
+import time
+from unittest.mock import patch
+
+import pytest
+
+from src import async_views
+from src.quota import QuotaScheduler
+
+CBR_ANSWER = {"Valute": {"USD": {"Value": 73.2155}, "EUR": {"Value": 80.0}}}
+STOCK_ANSWER = {"Global Quote": {"05. price": "150.123"}}
+
+
+async def fake_get_json(session, url):
+    await asyncio.sleep(0.2)
+    return CBR_ANSWER if "cbr" in url else STOCK_ANSWER
+
+
+def slow_sections(operations, sections):
+    time.sleep(0.2)
+    return {"cards": [], "top_transactions": []}
+
+
+@pytest.fixture
+def offline_views():
+    with (
+        patch("src.async_views._get_json", side_effect=fake_get_json),
+        patch("src.async_views.page_operations", return_value=None),
+        patch("src.async_views.save_answer", side_effect=lambda answer, _: json.dumps(answer)),
+        patch("src.async_views.stock_quota", QuotaScheduler(per_minute=None, per_day=None)),
+        patch(
+            "src.async_views.read_user_settings",
+            side_effect=lambda key: {"user_currencies": ["USD"], "user_stocks": ["AAPL", "MSFT"]}[key],
+        ),
+    ):
+        yield
+
+
+def test_json_answer_main_async_overlaps_compute_and_network(offline_views):
+    with patch("src.async_views.compute_sections", side_effect=slow_sections):
+        started = time.perf_counter()
+        answer = json.loads(asyncio.run(async_views.json_answer_main_async("2021-12-31 23:59:59", session=object())))
+        elapsed = time.perf_counter() - started
+    assert elapsed < 0.35
+    assert list(answer) == ["greeting", "cards", "top_transactions", "currency_rates", "stock_prices"]
+    assert answer["currency_rates"] == [{"currency": "USD", "rate": 73.22}]
+    assert answer["stock_prices"] == [{"stock": "AAPL", "price": 150.12}, {"stock": "MSFT", "price": 150.12}]
+
+
+def test_json_answer_events_async_sections(offline_views):
+    sections = {"expenses": {"total_amount": 1.0, "main": []}, "income": {"total_amount": 2.0, "main": []}}
+    with patch("src.async_views.compute_sections", return_value=sections):
+        answer = json.loads(asyncio.run(async_views.json_answer_events_async("2021-12-31 23:59:59", session=object())))
+    assert answer["income"]["total_amount"] == 2.0
+    assert answer["currency_rates"][0]["currency"] == "USD"
+
+
+def test_stocks_prices_async_network_error(offline_views):
+    with patch("src.async_views._get_json", side_effect=async_views.requests.exceptions.ConnectionError("down")):
+        result = asyncio.run(async_views.stocks_prices_async(session=object()))
+    assert result == "Ошибка получения стоимости акций. Код ошибки: down"
+
+
+def test_json_answer_main_async_requested_sections_only(offline_views):
+    with (
+        patch("src.async_views.compute_sections", side_effect=slow_sections) as sections,
+        patch("src.async_views.stocks_prices_async") as stocks,
+    ):
+        answer = json.loads(
+            asyncio.run(
+                async_views.json_answer_main_async(
+                    "2021-12-31 23:59:59", session=object(), sections=["currency_rates"]
+                )
+            )
+        )
+    assert answer == {"currency_rates": [{"currency": "USD", "rate": 73.22}]}
+    assert not sections.called and not stocks.called
+
+
+def test_json_answer_search_async_forwards_paging():
+    with patch("src.async_views.json_answer_search", return_value="[]") as search:
+        answer = asyncio.run(async_views.json_answer_search_async("кино", 2, "cursor", "date", ["Описание"]))
+    assert answer == "[]"
+    search.assert_called_once_with("кино", 2, "cursor", "date", ["Описание"])
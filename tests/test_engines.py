@@ -0,0 +1,104 @@
+import json
+from unittest.mock import patch
+
+import pandas as pd
+import pytest
+
+from src.engines import engine_for, get_engine, set_engine
+from src.reports import spending_by_category
+from src.services import cashback, search_name, search_word
+from src.utils import cards_info, date_window, expenses_by_category, income_by_category, top_transactions, total_income
+
+
+@pytest.fixture(params=["pandas", "arrow", "sqlite"])
+def engine(request):
+    if request.param == "arrow":
+        pytest.importorskip("pyarrow")
+    return get_engine(request.param)
+
+
+@pytest.fixture
+def operations():
+    return pd.DataFrame(
+        {
+            "Дата операции": [
+                "01.01.2023 12:00:00",
+                "07.01.2023 15:30:00",
+                "15.01.2023 10:15:00",
+                "25.02.2023 18:45:00",
+                "26.02.2023 09:00:00",
+            ],
+            "Номер карты": ["*1111", "*2222", "*1111", None, "*2222"],
+            "Статус": ["OK", "OK", "OK", "OK", "OK"],
+            "Сумма платежа": [-100.0, -250.0, 300.0, -50.0, -250.0],
+            "Кэшбэк": [1.0, None, 0.0, 2.0, 3.0],
+            "Категория": ["Еда", "Кино", "Доход", "Еда", "Авиабилеты"],
+            "Описание": ["Магнит", "Синема", "Зарплата", None, "Перевод Иван П."],
+        }
+    )
+
+
+def test_engine_is_detected_from_table(engine, operations):
+    assert engine_for(engine.from_frame(operations)).name == engine.name
+    with pytest.raises(ValueError):
+        set_engine("polars")
+
+
+def test_engine_operations(engine, operations):
+    table = engine.from_frame(operations)
+    expenses = engine.filter(table, "Сумма платежа", "<", 0)
+    assert engine.total(expenses, "Сумма платежа") == -650.0
+    assert engine.to_records(engine.group_sum(expenses, "Категория", "Сумма платежа")) == [
+        {"Категория": "Авиабилеты", "Сумма платежа": -250.0},
+        {"Категория": "Еда", "Сумма платежа": -150.0},
+        {"Категория": "Кино", "Сумма платежа": -250.0},
+    ]
+    top = engine.to_records(engine.top_n(expenses, "Сумма платежа", 2, largest=False, columns=("Описание",)))
+    assert top == [{"Описание": "Синема"}, {"Описание": "Перевод Иван П."}]
+    found = engine.to_records(engine.search(table, ("Описание", "Категория"), "АВИА|магн"))
+    assert [row["Описание"] for row in found] == ["Магнит", "Перевод Иван П."]
+    assert len(engine.to_records(engine.filter(table, "Номер карты", "in", ["*1111"]))) == 2
+
+
+def test_page_helpers(engine, operations):
+    table = engine.from_frame(operations)
+    window = date_window(table, "2023-01-31 23:59:59")
+    assert cards_info(window) == [
+        {"last_digits": "1111", "total_spent": 100.0, "cashback": 1.0},
+        {"last_digits": "2222", "total_spent": 250.0, "cashback": 2.5},
+    ]
+    assert top_transactions(table, 2)[0] == {
+        "date": "07.01.2023",
+        "amount": 250.0,
+        "category": "Кино",
+        "description": "Синема",
+    }
+    assert expenses_by_category(table, 2) == [
+        {"category": "Авиабилеты", "amount": 250.0},
+        {"category": "Кино", "amount": 250.0},
+        {"category": "Остальное", "amount": 150.0},
+    ]
+    assert income_by_category(window) == [
+        {"category": "Доход", "amount": 300.0},
+        {"category": "Остальное", "amount": 0.0},
+    ]
+    assert total_income(window) == 300.0
+
+
+def test_services_and_reports(engine, operations):
+    table = engine.from_frame(operations)
+    assert json.loads(cashback(table, "2023", "02")) == [
+        {"Категория": "Авиабилеты", "Кэшбэк": 3.0},
+        {"Категория": "Еда", "Кэшбэк": 2.0},
+    ]
+    assert [row["Описание"] for row in json.loads(search_word(table, "кино"))] == ["Синема"]
+    assert json.loads(search_word(table, "кино", limit=1))["results"][0]["Описание"] == "Синема"
+    assert [row["Описание"] for row in json.loads(search_name(table, "transfer"))] == ["Перевод Иван П."]
+    report = spending_by_category.__wrapped__(table, "Еда", "2023-03-01 00:00:00")
+    assert report["Еда"] == -150.0
+
+
+def test_arrow_engine_without_pyarrow_explains_how_to_install():
+    with patch("src.engines.pa", None):
+        with pytest.raises(ImportError, match="poetry install -E arrow"):
+            get_engine("arrow")
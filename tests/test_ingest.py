@@ -0,0 +1,104 @@
+from unittest.mock import patch
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.ingest import fingerprints, ingest_statement, load_aggregates
+from src.snapshot import attach_snapshot
+from src.xlsx import STATEMENT_SCHEMA, read_statement_tail
+
+
+def statement(rows):
+    return pd.DataFrame(
+        rows, columns=["Дата операции", "Номер карты", "Статус", "Сумма платежа", "Категория", "Описание"]
+    )
+
+
+@pytest.fixture
+def first_rows():
+    return [
+        ["02.01.2023 12:00:00", "*1111", "OK", -100.0, "Еда", "Магнит"],
+        ["01.01.2023 12:00:00", "*1111", "OK", -100.0, "Еда", "Магнит"],
+        ["01.01.2023 10:00:00", "*2222", "FAILED", -50.0, "Кино", "Синема"],
+        ["01.01.2023 09:00:00", None, "OK", 1000.0, "Пополнения", "Перевод"],
+    ]
+
+
+def test_fingerprints_are_stable_and_count_repeats():
+    keys = [("01.01.2023 12:00:00", "*1111", -100.0, "Магнит")] * 2 + [("01.01.2023 12:00:00", None, -100, "Магнит")]
+    result = fingerprints(keys)
+    assert len(set(result.tolist())) == 3
+    assert np.array_equal(result, fingerprints(keys))
+
+
+def test_ingest_appends_only_new_rows(tmp_path, first_rows):
+    source = str(tmp_path / "operations.xlsx")
+    state = str(tmp_path / "state")
+    statement(first_rows).to_excel(source, index=False)
+    assert ingest_statement(source, state) == {"new": 3, "total": 3}
+
+    new_row = ["03.01.2023 08:00:00", "*2222", "OK", -30.0, "Кино", "Синема"]
+    statement([new_row] + first_rows).to_excel(source, index=False)
+    assert ingest_statement(source, state) == {"new": 1, "total": 4}
+
+    operations = attach_snapshot(state, source)
+    assert operations["Сумма платежа"].tolist() == [-100.0, -100.0, 1000.0, -30.0]
+    aggregates = load_aggregates(state)
+    assert aggregates["cards"]["*1111"] == {"total_spent": 200.0, "cashback": 2.0}
+    assert aggregates["cards"]["*2222"] == {"total_spent": 30.0, "cashback": 0.3}
+    assert aggregates["categories"]["2023-01"]["Кино"] == {"expenses": 30.0, "income": 0.0}
+
+
+def test_ingest_rebuilds_when_rows_disappear(tmp_path, first_rows):
+    source = str(tmp_path / "operations.xlsx")
+    state = str(tmp_path / "state")
+    statement(first_rows).to_excel(source, index=False)
+    ingest_statement(source, state)
+    statement(first_rows[1:]).to_excel(source, index=False)
+    assert ingest_statement(source, state) == {"new": 2, "total": 2}
+    assert load_aggregates(state)["cards"]["*1111"]["total_spent"] == 100.0
+
+
+def full_statement(rows):
+    df = pd.DataFrame({name: [None] * len(rows) for name in STATEMENT_SCHEMA})
+    df[["Дата операции", "Номер карты", "Статус", "Сумма платежа", "Категория", "Описание"]] = rows
+    df["Валюта платежа"] = "RUB"
+    return df
+
+
+def test_ingest_decodes_only_appended_rows_and_matches_full_load(tmp_path, first_rows):
+    source = str(tmp_path / "operations.xlsx")
+    state = str(tmp_path / "state")
+    full_statement(first_rows).to_excel(source, index=False)
+    ingest_statement(source, state)
+    rows = first_rows + [
+        ["03.01.2023 08:00:00", "*2222", "OK", -30.0, "Аптеки", "Аптека"],
+        ["01.01.2023 12:00:00", "*1111", "OK", -100.0, "Еда", "Магнит"],
+    ]
+    full_statement(rows).to_excel(source, index=False)
+    decoded: list = []
+
+    def tail(*args):
+        decoded.append(read_statement_tail(*args))
+        return decoded[-1]
+
+    with patch("src.ingest.read_statement_tail", side_effect=tail):
+        assert ingest_statement(source, state) == {"new": 2, "total": 5}
+    assert [len(result[0]) for result in decoded] == [2]
+    fresh = str(tmp_path / "fresh")
+    ingest_statement(source, fresh)
+    pd.testing.assert_frame_equal(attach_snapshot(state, source), attach_snapshot(fresh, source))
+    assert np.array_equal(np.load(f"{state}/fingerprints.npy"), np.load(f"{fresh}/fingerprints.npy"))
+    assert attach_snapshot(state)["Категория"].cat.categories.tolist() == ["Аптеки", "Еда", "Пополнения"]
+
+
+def test_ingest_picks_up_status_change(tmp_path, first_rows):
+    source = str(tmp_path / "operations.xlsx")
+    state = str(tmp_path / "state")
+    full_statement(first_rows).to_excel(source, index=False)
+    ingest_statement(source, state)
+    first_rows[2][2] = "OK"
+    full_statement(first_rows).to_excel(source, index=False)
+    assert ingest_statement(source, state) == {"new": 4, "total": 4}
+    assert load_aggregates(state)["cards"]["*2222"]["total_spent"] == 50.0
@@ -0,0 +1,57 @@
+import json
+
+from src.memory_profile import check_budgets, load_budgets, main, measure, profile_functions
+
+_leak = []
+
+
+def test_measure_peak_and_retained():
+    result = measure(lambda: bytearray(4 * 1024 * 1024))
+    assert result["peak_kb"] >= 4096
+    assert result["retained_kb"] < 1024
+
+    result = measure(lambda: _leak.append(bytearray(2 * 1024 * 1024)))
+    assert result["retained_kb"] >= 2048
+    _leak.clear()
+
+
+def test_check_budgets_flags_regression():
+    budgets = {"tolerance": 0.25, "slack_kb": 0, "budgets": {"cards_info": {"1000": {"peak_kb": 100}}}}
+    within = {"cards_info": {"1000": {"peak_kb": 120, "retained_kb": 1, "rss_peak_kb": None}}}
+    over = {"cards_info": {"1000": {"peak_kb": 130, "retained_kb": 1, "rss_peak_kb": None}}}
+    assert check_budgets(within, budgets) == []
+    assert len(check_budgets(over, budgets)) == 1
+
+
+def test_check_budgets_covers_retained_and_rss_when_defined():
+    budgets = {
+        "tolerance": 0,
+        "slack_kb": 0,
+        "budgets": {"cards_info": {"1000": {"peak_kb": 100, "retained_kb": 10, "rss_kb": 500}}},
+    }
+    leak = {"cards_info": {"1000": {"peak_kb": 100, "retained_kb": 11, "rss_peak_kb": 400}}}
+    rss = {"cards_info": {"1000": {"peak_kb": 100, "retained_kb": 10, "rss_peak_kb": 600}}}
+    unmeasured = {"cards_info": {"1000": {"peak_kb": 100, "retained_kb": 10, "rss_peak_kb": None}}}
+    assert [message.split(":")[1].split()[0] for message in check_budgets(leak, budgets)] == ["остаток"]
+    assert "пик RSS 600 КБ" in check_budgets(rss, budgets)[0]
+    assert check_budgets(unmeasured, budgets) == []
+
+
+def test_budgets_cover_profiled_functions():
+    budgets = load_budgets()
+    results = profile_functions((200,), ["cards_info", "json_answer_events"])
+    assert set(results) == {"cards_info", "json_answer_events"}
+    assert results["cards_info"]["200"]["peak_kb"] > 0
+    assert {"read_info", "cashback", "json_answer_main"} <= set(budgets["budgets"])
+
+
+def test_budget_gate_on_fixture_workload(tmp_path, capsys):
+    # Гейт на выписке data/operations.xlsx: на наименьшем размере из бюджетов все функции в пределах
+    assert main(["--sizes", "1000"]) == 0
+    budgets = load_budgets()
+    budgets["slack_kb"] = 0
+    budgets["budgets"]["cards_info"]["1000"]["peak_kb"] = 1
+    tight = tmp_path / "memory_budgets.json"
+    tight.write_text(json.dumps(budgets), encoding="utf-8")
+    assert main(["--sizes", "1000", "--only", "cards_info", "--budgets", str(tight)]) == 1
+    assert "РЕГРЕССИЯ: cards_info на 1000 строках" in capsys.readouterr().out
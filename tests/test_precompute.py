@@ -0,0 +1,115 @@
+import json
+import os
+import time
+from datetime import datetime
+from unittest.mock import patch
+
+import pandas as pd
+import pytest
+
+from src import views
+from src.precompute import MARKET_TIMEOUT, PrecomputeScheduler, hot_jobs, previous_period_end
+
+NOW = datetime(2023, 1, 20, 12, 0, 0)
+
+
+@pytest.fixture
+def offline_statement(tmp_path):
+    path_xls = str(tmp_path / "operations.xlsx")
+    pd.DataFrame(
+        {
+            "Дата операции": ["28.12.2022 12:00:00", "05.01.2023 15:30:00", "15.01.2023 10:15:00"],
+            "Номер карты": ["*1111", "*2222", "*1111"],
+            "Статус": ["OK", "OK", "OK"],
+            "Сумма платежа": [-100.0, -250.0, 300.0],
+            "Валюта платежа": ["RUB", "RUB", "RUB"],
+            "Кэшбэк": [1.0, 2.0, None],
+            "Категория": ["Еда", "Кино", "Доход"],
+            "Описание": ["Магнит", "Синема", "Зарплата"],
+        }
+    ).to_excel(path_xls, index=False)
+    with (
+        patch.object(views, "data_file", path_xls),
+        patch.object(views, "snapshot_path", str(tmp_path / "snapshot")),
+        patch.object(views, "currency_rates", lambda: [{"currency": "USD", "rate": 70.0}]),
+        patch.object(views, "stocks_prices", lambda **kwargs: []),
+    ):
+        yield path_xls
+
+
+def test_hot_jobs_cover_current_and_previous_periods():
+    assert previous_period_end(NOW, "M") == datetime(2022, 12, 31, 23, 59, 59)
+    jobs = hot_jobs(NOW)
+    assert ("main", ("2023-01-20 12:00:00", "Y", "RUB")) in jobs
+    assert ("events", ("2022-12-31 23:59:59", "M", "RUB")) in jobs
+    assert jobs[-1] == ("cashback", ("2023", "1"))
+
+
+def test_answers_served_from_precomputed_results(offline_statement):
+    scheduler = PrecomputeScheduler(max_workers=2, watched=(offline_statement,), clock=lambda: NOW)
+    try:
+        scheduler.refresh()
+        scheduler.wait()
+        for date_str, diapason in (("2023-01-20 18:00:00", "M"), ("2022-12-31 23:59:59", "M")):
+            expected = json.loads(views.json_answer_main(date_str, diapason))
+            answer = json.loads(scheduler.answer_main(date_str, diapason))
+            assert {**answer, "greeting": None} == {**expected, "greeting": None}
+        assert json.loads(scheduler.answer_events("2023-01-20 18:00:00", "Y"))["expenses"]["total_amount"] == 250.0
+        assert json.loads(scheduler.answer_cashback("2023", "1")) == json.loads(
+            views.json_answer_cashback("2023", "1")
+        )
+        assert scheduler.stats()["hits"] == 4
+
+        stat = os.stat(offline_statement)
+        os.utime(offline_statement, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+        assert scheduler.due()
+        scheduler.answer_main("2023-01-20 18:00:00")
+        assert scheduler.stats()["misses"] == 1
+    finally:
+        scheduler.stop()
+
+
+def test_background_cashback_does_not_write_answer_file(offline_statement, tmp_path):
+    scheduler = PrecomputeScheduler(max_workers=1, watched=(offline_statement,), clock=lambda: NOW)
+    try:
+        scheduler.refresh()
+        scheduler.wait()
+        assert scheduler.stats()["hits"] == 0
+        assert json.loads(json.loads(scheduler.answer_cashback("2023", "1"))["cashback"]) is not None
+        assert not (tmp_path / "data" / "cashback.json").exists()
+    finally:
+        scheduler.stop()
+
+
+def test_stale_jobs_are_cancelled(offline_statement):
+    def slow_sections(operations, sections):
+        time.sleep(0.05)
+        return {"cards": [], "top_transactions": []}
+
+    scheduler = PrecomputeScheduler(max_workers=1, watched=(offline_statement,), clock=lambda: NOW)
+    try:
+        with patch.object(views, "compute_sections", side_effect=slow_sections):
+            scheduler.refresh()
+            scheduler.refresh()
+            scheduler.wait()
+        stats = scheduler.stats()
+        assert stats["cancelled"] + stats["discarded"] >= len(hot_jobs(NOW))
+        assert scheduler.answer_main("2023-01-20 18:00:00") is not None
+        assert scheduler.stats()["hits"] == 1
+    finally:
+        scheduler.stop()
+
+
+def test_unreadable_statement_and_bounded_market_wait(offline_statement):
+    stocks = []
+    scheduler = PrecomputeScheduler(interval=300, max_workers=1, watched=(offline_statement,), clock=lambda: NOW)
+    try:
+        with (
+            patch.object(views, "read_info", return_value=None),
+            patch.object(views, "stocks_prices", lambda **kwargs: stocks.append(kwargs) or []),
+        ):
+            scheduler.refresh()
+            scheduler.wait()
+        assert stocks and stocks[0]["timeout"] == MARKET_TIMEOUT < scheduler.interval
+    finally:
+        scheduler.stop()
@@ -0,0 +1,136 @@
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.query import (
+    TransactionQuery,
+    as_query,
+    get_aggregation_backend,
+    json_ready,
+    set_aggregation_backend,
+)
+
+
+@pytest.fixture
+def operations():
+    return pd.DataFrame(
+        {
+            "Дата операции": [
+                "01.01.2023 12:00:00",
+                "07.01.2023 15:30:00",
+                "15.01.2023 10:15:00",
+                "25.02.2023 18:45:00",
+            ],
+            "Номер карты": ["*1111", "*2222", "*1111", None],
+            "Сумма платежа": [-100.0, -250.0, 300.0, -50.0],
+            "Категория": ["Еда", "Кино", "Доход", "Еда"],
+            "Описание": ["Магнит", "Синема", "Зарплата", None],
+        }
+    )
+
+
+def test_query_is_lazy_and_immutable(operations):
+    base = TransactionQuery(operations)
+    expenses = base.filter("Сумма платежа", "<", 0)
+    assert len(base.collect()) == 4
+    assert len(expenses.collect()) == 3
+    assert as_query(expenses) is expenses
+
+
+def test_query_fuses_filters_and_window(operations):
+    result = (
+        TransactionQuery(operations)
+        .between(datetime(2023, 1, 1), datetime(2023, 1, 31, 23, 59, 59))
+        .filter("Сумма платежа", "<", 0)
+        .project("Категория", "Сумма платежа")
+        .collect()
+    )
+    assert list(result.columns) == ["Категория", "Сумма платежа"]
+    assert result["Сумма платежа"].tolist() == [-100.0, -250.0]
+
+
+def test_query_group_aggregate_sort(operations):
+    result = (
+        TransactionQuery(operations)
+        .filter("Сумма платежа", "<", 0)
+        .group("Категория")
+        .aggregate("Сумма платежа")
+        .sort("Сумма платежа")
+        .collect()
+    )
+    assert result.to_dict(orient="records") == [
+        {"Категория": "Кино", "Сумма платежа": -250.0},
+        {"Категория": "Еда", "Сумма платежа": -150.0},
+    ]
+
+
+def test_query_sort_by_date_and_limit(operations):
+    result = TransactionQuery(operations).sort("Дата операции", ascending=False).limit(2).collect()
+    assert result["Описание"].tolist()[1] == "Зарплата"
+    assert len(result) == 2
+
+
+@pytest.mark.parametrize("ascending", [True, False])
+def test_query_sort_puts_missing_values_last_with_and_without_limit(operations, ascending):
+    operations.loc[0, "Сумма платежа"] = np.nan
+    operations.loc[0, "Описание"] = None
+    for column in ("Сумма платежа", "Описание"):
+        ordered = TransactionQuery(operations).sort(column, ascending).collect()
+        limited = TransactionQuery(operations).sort(column, ascending).limit(len(operations)).collect()
+        assert ordered.index.tolist() == limited.index.tolist()
+        missing = ordered[column].isna().tolist()
+        assert len(ordered) == len(operations) and missing == sorted(missing) and missing[-1]
+
+
+def test_query_search_any_column(operations):
+    result = TransactionQuery(operations).search(("Описание", "Категория"), "еда").collect()
+    assert len(result) == 2
+
+
+def test_query_unknown_operator(operations):
+    with pytest.raises(ValueError):
+        TransactionQuery(operations).filter("Сумма платежа", "~", 0)
+
+
+def test_json_ready_replaces_missing_values(operations):
+    result = json_ready(operations).to_dict(orient="records")
+    assert result[3]["Номер карты"] is None
+    assert result[3]["Описание"] is None
+
+
+@pytest.mark.parametrize(
+    "keys, func",
+    [
+        (["Номер карты"], "sum"),
+        (["Категория", "Номер карты"], "mean"),
+        (["Категория"], "min"),
+        (["Категория"], "count"),
+    ],
+)
+def test_numpy_backend_matches_pandas(operations, keys, func):
+    query = TransactionQuery(operations).group(*keys).aggregate("Сумма платежа", func)
+    expected = query.using("pandas").collect()
+    result = query.using("numpy").collect()
+    pd.testing.assert_frame_equal(result, expected.reset_index(drop=True))
+
+
+def test_numpy_backend_categorical_codes(operations):
+    categorical = operations.astype({"Категория": "category"})
+    query = TransactionQuery(categorical).filter("Сумма платежа", "<", 0).group("Категория").aggregate("Сумма платежа")
+    result = query.using("numpy").collect()
+    assert result["Категория"].tolist() == ["Еда", "Кино"]
+    assert result["Сумма платежа"].tolist() == [-150.0, -250.0]
+
+
+def test_default_aggregation_backend(operations):
+    set_aggregation_backend("numpy")
+    try:
+        assert get_aggregation_backend() == "numpy"
+        result = TransactionQuery(operations).group("Категория").aggregate("Сумма платежа").collect()
+        assert result["Сумма платежа"].tolist() == [300.0, -150.0, -250.0]
+    finally:
+        set_aggregation_backend("pandas")
+    with pytest.raises(ValueError):
+        set_aggregation_backend("polars")
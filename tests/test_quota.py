@@ -0,0 +1,131 @@
+import sqlite3
+import time
+from unittest.mock import patch
+
+import pytest
+
+from src.quota import BACKGROUND, QuotaExceeded, QuotaScheduler, is_daily_limit
+from src.utils import stocks_prices
+
+STOCKS = ["AAPL", "AMZN", "GOOGL", "MSFT", "TSLA"]
+
+
+def test_interactive_first_and_users_take_turns():
+    # Один маркер в 0.12 с: первый запрос забирает его, остальные ждут в очереди
+    quota = QuotaScheduler(per_minute=1, per_day=None, time_scale=0.002)
+    quota.submit("x").result(1)
+    order: list = []
+    futures = {
+        "background": quota.submit("a", BACKGROUND),
+        "a1": quota.submit("a"),
+        "a2": quota.submit("a"),
+        "b1": quota.submit("b"),
+    }
+    for name, future in futures.items():
+        future.add_done_callback(lambda _, name=name: order.append(name))
+    for future in futures.values():
+        future.result(2)
+    quota.close()
+    assert order == ["a1", "b1", "a2", "background"]
+    assert quota.stats()["granted"] == 5
+
+
+def test_requests_that_miss_deadline_are_dropped():
+    quota = QuotaScheduler(per_minute=None, per_day=2)
+    quota.acquire(timeout=1)
+    quota.acquire(timeout=1)
+    started = time.perf_counter()
+    with pytest.raises(QuotaExceeded):
+        quota.acquire(timeout=5)
+    assert time.perf_counter() - started < 1
+    waiting = quota.submit(priority=BACKGROUND)
+    quota.close()
+    with pytest.raises(QuotaExceeded):
+        waiting.result(1)
+    assert quota.stats()["dropped"] == 1
+
+
+def test_stocks_prices_stay_within_stand_in_limits(limited_stock_server):
+    # Минута сжата до 0.3 с, день - до 432 с: за прогон доступно 8 запросов
+    server = limited_stock_server(per_minute=3, per_day=8, time_scale=0.005)
+    quota = QuotaScheduler(per_minute=3, per_day=8, time_scale=0.005)
+    with (
+        patch("src.utils.ALPHA_VANTAGE_URL", server["url"]),
+        patch("src.utils.stock_quota", quota),
+        patch("src.utils.read_user_settings", return_value=STOCKS),
+    ):
+        first = stocks_prices(timeout=2)
+        second = stocks_prices(timeout=2)
+    quota.close()
+    assert first == [{"stock": stock, "price": 150.12} for stock in STOCKS]
+    assert [entry["price"] for entry in second] == [150.12, 150.12, 150.12, None, None]
+    assert server["stats"] == {"served": 8, "limited": 0}
+
+
+def test_provider_rate_limit_answers_back_off(limited_stock_server):
+    # Поставщик строже, чем настроенный лимит: ответы "Note" обнуляют квоту, а не ломают раздел
+    server = limited_stock_server(per_minute=2, per_day=100, time_scale=0.005)
+    quota = QuotaScheduler(per_minute=5, per_day=None, time_scale=0.005)
+    with (
+        patch("src.utils.ALPHA_VANTAGE_URL", server["url"]),
+        patch("src.utils.stock_quota", quota),
+        patch("src.utils.read_user_settings", return_value=STOCKS),
+    ):
+        result = stocks_prices(timeout=2)
+    quota.close()
+    assert isinstance(result, list) and [entry["stock"] for entry in result] == STOCKS
+    assert sum(entry["price"] is not None for entry in result) == server["stats"]["served"]
+    assert quota.stats()["limited"] == server["stats"]["limited"] > 0
+
+
+def test_day_quota_is_shared_between_processes_and_restarts(tmp_path):
+    state = str(tmp_path / "quota.sqlite")
+    first = QuotaScheduler(per_minute=None, per_day=3, state_path=state)
+    first.acquire(timeout=1)
+    first.acquire(timeout=1)
+    first.close()
+    # Перезапуск и другой процесс видят уже израсходованную квоту
+    restarted = QuotaScheduler(per_minute=None, per_day=3, state_path=state)
+    other = QuotaScheduler(per_minute=None, per_day=3, state_path=state)
+    restarted.acquire(timeout=1)
+    with pytest.raises(QuotaExceeded):
+        other.acquire(timeout=1)
+    restarted.close()
+    other.close()
+
+
+def test_daily_limit_answer_drains_day_bucket():
+    quota = QuotaScheduler(per_minute=None, per_day=25)
+    quota.report_limited(is_daily_limit({"Note": "5 calls per minute and 500 calls per day"}))
+    quota.acquire(timeout=1)
+    quota.report_limited(is_daily_limit({"Information": "Our standard API rate limit is 25 requests per day."}))
+    with pytest.raises(QuotaExceeded):
+        quota.acquire(timeout=60)
+    quota.close()
+
+
+def test_zero_timeout_is_granted_when_tokens_are_available():
+    quota = QuotaScheduler(per_minute=1, per_day=None)
+    quota.acquire(timeout=0)
+    with pytest.raises(QuotaExceeded):
+        quota.acquire(timeout=0)
+    quota.close()
+
+
+def test_locked_shared_state_does_not_block_submit(tmp_path):
+    state = str(tmp_path / "quota.sqlite")
+    quota = QuotaScheduler(per_minute=None, per_day=5, state_path=state)
+    quota.acquire(timeout=1)
+    other = sqlite3.connect(state, isolation_level=None)
+    other.execute("BEGIN IMMEDIATE")
+    started = time.perf_counter()
+    first = quota.submit(timeout=5)
+    second = quota.submit(timeout=5)
+    assert time.perf_counter() - started < 0.1
+    time.sleep(0.2)
+    assert not first.done()
+    other.execute("COMMIT")
+    first.result(2)
+    second.result(2)
+    other.close()
+    quota.close()
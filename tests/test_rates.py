@@ -0,0 +1,140 @@
+import os
+from datetime import datetime
+from unittest.mock import MagicMock, patch
+
+import pandas as pd
+import pytest
+
+from src import rates as rates_module
+from src.rates import load_rates, normalize_currency, rates_asof, to_currency, update_rates
+
+DYNAMIC_XML = """<?xml version="1.0" encoding="windows-1251"?>
+<ValCurs ID="R01235" DateRange1="01.01.2023" DateRange2="10.01.2023" name="Foreign Currency Market Dynamic">
+<Record Date="10.01.2023" Id="R01235"><Nominal>1</Nominal><Value>70,0000</Value></Record>
+<Record Date="11.01.2023" Id="R01235"><Nominal>1</Nominal><Value>80,0000</Value></Record>
+</ValCurs>"""
+
+
+@pytest.fixture
+def rates():
+    return pd.DataFrame(
+        {
+            "date": pd.to_datetime(["2023-01-10", "2023-01-11", "2023-01-10"]),
+            "currency": ["USD", "USD", "EUR"],
+            "rate": [70.0, 80.0, 75.0],
+        }
+    )
+
+
+@pytest.fixture
+def cbr_responses():
+    daily = MagicMock()
+    daily.json.return_value = {"Valute": {"USD": {"ID": "R01235"}}}
+    dynamic = MagicMock()
+    dynamic.content = DYNAMIC_XML.encode("windows-1251")
+    with patch("src.rates.requests.get", side_effect=[daily, dynamic]) as mock_get:
+        yield mock_get
+
+
+def test_rates_asof_uses_last_known_rate(rates):
+    dates = pd.Series(
+        pd.to_datetime(["2023-01-09 00:00:00", "2023-01-10 15:00:00", "2023-01-14 00:00:00", "2023-01-14 00:00:00"])
+    )
+    currencies = pd.Series(["USD", "USD", "USD", "RUB"])
+    result = rates_asof(rates, dates, currencies)
+    assert pd.isna(result[0])
+    assert result[1:].tolist() == [70.0, 80.0, 1.0]
+
+
+def test_rates_asof_empty_store(tmp_path):
+    dates = pd.Series(pd.to_datetime(["2023-01-10 12:00:00", "2023-01-11 12:00:00"]))
+    result = rates_asof(load_rates(str(tmp_path / "rates.csv")), dates, pd.Series(["CNY", "RUB"]))
+    assert pd.isna(result[0])
+    assert result[1] == 1.0
+
+
+def test_to_currency_converts_every_amount(rates):
+    df = pd.DataFrame(
+        {
+            "Дата операции": ["10.01.2023 12:00:00", "12.01.2023 12:00:00"],
+            "Сумма платежа": [-700.0, 75.0],
+            "Валюта платежа": ["RUB", "EUR"],
+        }
+    )
+    result, unconverted = to_currency(df, "USD", rates)
+    assert result["Сумма платежа"].tolist() == [-10.0, 70.31]
+    assert result["Валюта платежа"].tolist() == ["USD", "USD"]
+    assert unconverted.empty
+
+
+def test_update_rates_backfills_once(tmp_path, cbr_responses):
+    path = str(tmp_path / "rates.csv")
+    result = update_rates(["USD", "RUB"], datetime(2023, 1, 1), datetime(2023, 1, 12), path)
+    assert result["rate"].tolist() == [70.0, 80.0]
+    assert cbr_responses.call_count == 2
+    assert len(load_rates(path)) == 2
+
+    update_rates(["USD"], datetime(2023, 1, 5), datetime(2023, 1, 12), path)
+    assert cbr_responses.call_count == 2
+
+
+def test_update_rates_network_error(tmp_path):
+    from requests.exceptions import RequestException
+
+    with patch("src.rates.requests.get", side_effect=RequestException("Network error")):
+        result = update_rates(["USD"], datetime(2023, 1, 1), datetime(2023, 1, 12), str(tmp_path / "rates.csv"))
+    assert result.empty
+
+
+def test_to_currency_reports_amounts_without_rate(rates):
+    df = pd.DataFrame(
+        {
+            "Дата операции": ["09.01.2023 12:00:00", "10.01.2023 12:00:00", "10.01.2023 12:00:00"],
+            "Сумма платежа": [-50.0, -700.0, -20.0],
+            "Валюта платежа": ["USD", "RUB", "CNY"],
+        }
+    )
+    result, unconverted = to_currency(df, "RUB", rates)
+    assert result["Сумма платежа"].tolist() == [-700.0]
+    assert unconverted["Сумма платежа"].tolist() == [-50.0, -20.0]
+    assert unconverted["Валюта платежа"].tolist() == ["USD", "CNY"]
+
+
+def test_update_rates_skips_unknown_currency_and_writes_atomically(tmp_path, cbr_responses):
+    path = str(tmp_path / "rates.csv")
+    with patch.object(rates_module, "_unknown_currencies", set()):
+        result = update_rates(["XYZ", "USD"], datetime(2023, 1, 1), datetime(2023, 1, 12), path)
+        assert result["currency"].tolist() == ["USD", "USD"]
+        assert update_rates(["XYZ"], datetime(2023, 1, 1), datetime(2023, 1, 12), path).equals(load_rates(path))
+    assert cbr_responses.call_count == 2
+    assert {"rates.csv", "rates_coverage.json"} <= set(os.listdir(tmp_path))
+    assert not [name for name in os.listdir(tmp_path) if ".tmp" in name]
+
+
+def test_normalize_currency_skips_same_currency(tmp_path):
+    df = pd.DataFrame({"Дата операции": ["10.01.2023 12:00:00"], "Сумма платежа": [-700.0], "Валюта платежа": ["USD"]})
+    with patch("src.rates.update_rates", side_effect=AssertionError("курсы не запрашивались")):
+        assert normalize_currency(df, "USD", str(tmp_path / "rates.csv")) is df
+
+
+def test_normalize_currency_looks_back_and_backs_off(tmp_path):
+    from requests.exceptions import RequestException
+
+    df = pd.DataFrame(
+        {
+            "Дата операции": ["10.01.2023 12:00:00", "11.01.2023 12:00:00"],
+            "Сумма платежа": [-700.0, -10.0],
+            "Валюта платежа": ["RUB", "USD"],
+        }
+    )
+    path = str(tmp_path / "rates.csv")
+    with (
+        patch.dict(rates_module._failures, clear=True),
+        patch("src.rates.requests.get", side_effect=RequestException("Network error")) as mock_get,
+        patch("src.rates.update_rates", wraps=update_rates) as mock_update,
+    ):
+        first = normalize_currency(df, "RUB", path)
+        second = normalize_currency(df, "RUB", path)
+    assert mock_update.call_args.args[1] == datetime(2022, 12, 27, 12, 0)
+    assert mock_get.call_count == 1
+    assert first["Сумма платежа"].tolist() == second["Сумма платежа"].tolist() == [-700.0]
@@ -1,6 +1,5 @@
 from unittest.mock import patch
 
-from src.config import root_path
 from src.reports import spending_by_category, writing_report_to_file, writing_report_to_file_by_user
 
 
@@ -15,13 +14,13 @@ def test_spending_by_category_no_results(mock_transactions):
 
 
 @patch("pandas.DataFrame.to_excel")
-def test_writing_report_to_file_decorator(mock_to_excel, mock_transactions):
+def test_writing_report_to_file_decorator(mock_to_excel, mock_transactions, output_path):
     @writing_report_to_file
     def test_func():
         return mock_transactions
 
     result = test_func()
-    mock_to_excel.assert_called_once_with(root_path / "report.xlsx")
+    mock_to_excel.assert_called_once_with(output_path / "report.xlsx")
     assert result.equals(mock_transactions)
 
 
@@ -38,13 +37,13 @@ def test_writing_report_to_file_error(mock_to_excel, mock_transactions, caplog):
 
 # Тесты декоратора writing_report_to_file_by_user
 @patch("pandas.DataFrame.to_excel")
-def test_writing_report_to_file_by_user_decorator(mock_to_excel, mock_transactions):
+def test_writing_report_to_file_by_user_decorator(mock_to_excel, mock_transactions, output_path):
     @writing_report_to_file_by_user("custom_report.xlsx")
     def test_func():
         return mock_transactions
 
     result = test_func()
-    mock_to_excel.assert_called_once_with(root_path / "custom_report.xlsx")
+    mock_to_excel.assert_called_once_with(output_path / "custom_report.xlsx")
     assert result.equals(mock_transactions)
 
 
@@ -0,0 +1,74 @@
+import base64
+import json
+from unittest.mock import mock_open, patch
+
+import pandas as pd
+import pytest
+
+from src.services import search_number, search_word
+
+
+@pytest.fixture
+def operations():
+    return pd.DataFrame(
+        {
+            "Дата операции": [
+                "01.01.2023 12:00:00",
+                "02.01.2023 12:00:00",
+                "03.01.2023 12:00:00",
+                "04.01.2023 12:00:00",
+                "05.01.2023 12:00:00",
+            ],
+            "Сумма платежа": [-10.0, -500.0, -30.0, -40.0, -20.0],
+            "Категория": ["Такси", "Переводы", "Такси", "Супермаркеты", "Связь"],
+            "Описание": ["Яндекс Такси", "Такси Максим", "Ситимобил", "Магнит", "МТС +7 921 11-22-33"],
+        }
+    )
+
+
+@pytest.fixture(autouse=True)
+def no_answer_files():
+    with patch("src.services.open", mock_open(), create=True):
+        yield
+
+
+def test_search_word_legacy_list(operations):
+    result = json.loads(search_word(operations, "такси"))
+    assert [row["Описание"] for row in result] == ["Яндекс Такси", "Такси Максим", "Ситимобил"]
+
+
+def test_search_word_ranked_page_with_projection(operations):
+    page = json.loads(search_word(operations, "такси", limit=2, columns=["Описание"]))
+    assert page["results"] == [{"Описание": "Ситимобил"}, {"Описание": "Яндекс Такси"}]
+    assert page["next_cursor"] is not None
+    last = json.loads(search_word(operations, "такси", limit=2, cursor=page["next_cursor"], columns=["Описание"]))
+    assert last == {"results": [{"Описание": "Такси Максим"}], "next_cursor": None}
+
+
+def test_search_word_order_by_amount(operations):
+    page = json.loads(search_word(operations, "такси", limit=5, order="amount", columns=["Сумма платежа"]))
+    assert [row["Сумма платежа"] for row in page["results"]] == [-500.0, -30.0, -10.0]
+
+
+def test_search_word_cursor_for_other_order(operations):
+    page = json.loads(search_word(operations, "такси", limit=1))
+    with pytest.raises(ValueError):
+        search_word(operations, "такси", limit=1, cursor=page["next_cursor"], order="date")
+
+
+def test_search_word_page_treats_query_as_text(operations):
+    page = json.loads(search_word(operations, "+7 921", limit=5, columns=["Описание"]))
+    assert page == {"results": [{"Описание": "МТС +7 921 11-22-33"}], "next_cursor": None}
+    assert json.loads(search_word(operations, "такси|магнит", limit=5)) == {"results": [], "next_cursor": None}
+
+
+@pytest.mark.parametrize("payload", [[1, 2], {"order": "rank"}, {"order": "rank", "key": "1"}])
+def test_search_word_rejects_malformed_cursor(operations, payload):
+    cursor = base64.urlsafe_b64encode(json.dumps(payload).encode("utf-8")).decode("ascii")
+    with pytest.raises(ValueError):
+        search_word(operations, "такси", limit=1, cursor=cursor)
+
+
+def test_search_number_page(operations):
+    page = json.loads(search_number(operations, "cellphone", limit=1, columns=["Категория"]))
+    assert page == {"results": [{"Категория": "Связь"}], "next_cursor": None}
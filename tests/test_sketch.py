@@ -0,0 +1,74 @@
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.ingest import ingest_statement
+from src.sketch import QuantileSketch, load_sketches, spend_quantiles, update_sketches
+
+
+def statement(rows):
+    return pd.DataFrame(
+        rows, columns=["Дата операции", "Номер карты", "Статус", "Сумма платежа", "Категория", "Описание"]
+    )
+
+
+def test_quantiles_within_relative_accuracy_and_merge_is_exact():
+    values = np.random.default_rng(1).lognormal(6, 1.5, 20000)
+    whole = QuantileSketch()
+    whole.add_many(values)
+    left, right = QuantileSketch(), QuantileSketch()
+    left.add_many(values[:7000])
+    right.add_many(values[7000:])
+    merged = QuantileSketch.from_dict(left.merge(right).to_dict())
+    for q in (0.5, 0.9, 0.99):
+        exact = np.quantile(values, q, method="inverted_cdf")
+        assert merged.quantile(q) == whole.quantile(q)
+        assert abs(merged.quantile(q) - exact) <= 0.011 * exact
+    assert merged.count == 20000
+    assert merged.quantile(0) == values.min() and merged.quantile(1) == values.max()
+
+
+def test_sketch_memory_is_bounded():
+    sketch = QuantileSketch(max_bins=64)
+    sketch.add_many(np.geomspace(0.01, 1e9, 5000))
+    assert len(sketch.bins) <= 64
+    assert sketch.quantile(0.99) == pytest.approx(np.quantile(np.geomspace(0.01, 1e9, 5000), 0.99), rel=0.011)
+    with pytest.raises(ValueError):
+        sketch.add(-1.0)
+
+
+def test_window_combines_months_and_edge_days():
+    rows = [
+        ["30.12.2022 10:00:00", "*1111", "OK", -10.0, "Еда", "Магнит"],
+        ["03.01.2023 12:00:00", "*1111", "OK", -100.0, "Еда", "Магнит"],
+        ["20.01.2023 12:00:00", "*2222", "OK", -200.0, "Еда", "Магнит"],
+        ["01.02.2023 09:00:00", "*2222", "OK", -400.0, "Кино", "Синема"],
+        ["02.02.2023 09:00:00", "*2222", "OK", -800.0, "Кино", "Синема"],
+        ["01.02.2023 10:00:00", "*2222", "OK", 1000.0, "Пополнения", "Перевод"],
+    ]
+    sketches = update_sketches({}, statement(rows))
+    result = spend_quantiles(sketches, datetime(2023, 1, 1), datetime(2023, 2, 1, 23, 59, 59))
+    assert result["total"]["count"] == 3
+    assert result["total"]["median"] == pytest.approx(200.0, rel=0.01)
+    assert [entry["category"] for entry in result["categories"]] == ["Еда", "Кино"]
+    assert result["categories"][1]["p99"] == pytest.approx(400.0, rel=0.01)
+    card = result["cards"][0]
+    assert (card["last_digits"], card["count"]) == ("2222", 2)
+    assert (card["median"], card["p90"]) == (pytest.approx(200.0, rel=0.01), 400.0)
+
+
+def test_ingest_keeps_sketches_incremental(tmp_path):
+    source = str(tmp_path / "operations.xlsx")
+    state = str(tmp_path / "state")
+    rows = [["03.01.2023 12:00:00", "*1111", "OK", -100.0, "Еда", "Магнит"]]
+    statement(rows).to_excel(source, index=False)
+    ingest_statement(source, state)
+    rows.append(["04.01.2023 12:00:00", "*1111", "OK", -300.0, "Еда", "Магнит"])
+    rows.append(["05.01.2023 12:00:00", "*1111", "FAILED", -900.0, "Еда", "Магнит"])
+    statement(rows).to_excel(source, index=False)
+    ingest_statement(source, state)
+    result = spend_quantiles(load_sketches(state), datetime(2023, 1, 1), datetime(2023, 1, 31))
+    assert result["total"]["count"] == 2
+    assert result["total"]["p99"] == pytest.approx(300.0, rel=0.01)
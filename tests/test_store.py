@@ -0,0 +1,59 @@
+import os
+
+import pandas as pd
+import pytest
+
+from src.store import SqliteEngine
+
+
+@pytest.fixture
+def statement(tmp_path):
+    path_xls = tmp_path / "operations.xlsx"
+    pd.DataFrame(
+        {
+            "Дата операции": ["01.01.2023 12:00:00", "07.01.2023 15:30:00", "15.01.2023 10:15:00"],
+            "Статус": ["OK", "OK", "FAILED"],
+            "Сумма платежа": [-100.0, -250.5, 300.0],
+            "Категория": ["Авиабилеты", "Кино", "Доход"],
+            "Описание": ["Аэрофлот", "Синема Парк", "Зарплата"],
+        }
+    ).to_excel(path_xls, index=False)
+    return str(path_xls)
+
+
+def test_store_is_built_once(tmp_path, statement):
+    engine = SqliteEngine(str(tmp_path / "store.sqlite"))
+    calls = []
+
+    def load():
+        calls.append(1)
+        df = pd.read_excel(statement)
+        return df[df["Статус"] == "OK"]
+
+    first = engine.open(statement, load)
+    again = SqliteEngine(engine.path).open(statement, load)
+    assert len(calls) == 1
+    assert engine.to_records(first) == engine.to_records(again)
+    assert engine.total(again, "Сумма платежа") == -350.5
+
+    stat = os.stat(statement)
+    os.utime(statement, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    engine.open(statement, load)
+    assert len(calls) == 2
+
+
+def test_store_window_and_search(tmp_path, statement):
+    engine = SqliteEngine(str(tmp_path / "store.sqlite"))
+    table = engine.load(statement)
+    assert table.fts is not None
+    window = engine.window(
+        table, pd.Timestamp("2023-01-05").to_pydatetime(), pd.Timestamp("2023-01-31").to_pydatetime()
+    )
+    assert [row["Описание"] for row in engine.to_records(window)] == ["Синема Парк"]
+    # подстрока без учета регистра ищется по индексу FTS5, регулярное выражение - функцией regexp
+    assert [row["Описание"] for row in engine.to_records(engine.search(table, ("Описание", "Категория"), "АВИА"))] == [
+        "Аэрофлот"
+    ]
+    found = engine.search(table, ("Описание",), r"\w+ Парк", case=True)
+    assert [row["Описание"] for row in engine.to_records(found)] == ["Синема Парк"]
+    assert engine.to_records(engine.search(table, ("Описание",), "синема", case=True)) == []
@@ -0,0 +1,117 @@
+import json
+import socket
+import threading
+import time
+
+import pandas as pd
+import pytest
+
+from src.stream import StreamProcessor, consume, period_key, serve_socket, tail_file
+from src.utils import cards_info, date_window, expenses_by_category, income_by_category, total_expenses
+
+OPERATIONS = [
+    {
+        "Дата операции": "03.01.2023 12:00:00",
+        "Статус": "OK",
+        "Номер карты": "*1111",
+        "Сумма платежа": -100.0,
+        "Категория": "Еда",
+    },
+    {
+        "Дата операции": "05.01.2023 15:30:00",
+        "Статус": "OK",
+        "Номер карты": "*2222",
+        "Сумма платежа": -250.5,
+        "Категория": "Кино",
+    },
+    {
+        "Дата операции": "10.01.2023 10:15:00",
+        "Статус": "OK",
+        "Номер карты": "*1111",
+        "Сумма платежа": 300.0,
+        "Категория": "Доход",
+    },
+    {
+        "Дата операции": "11.01.2023 18:45:00",
+        "Статус": "FAILED",
+        "Номер карты": "*1111",
+        "Сумма платежа": -999.0,
+        "Категория": "Еда",
+    },
+    {
+        "Дата операции": "20.01.2023 09:00:00",
+        "Статус": "OK",
+        "Номер карты": None,
+        "Сумма платежа": -40.0,
+        "Категория": "Еда",
+    },
+    {
+        "Дата операции": "02.02.2023 09:00:00",
+        "Статус": "OK",
+        "Номер карты": "*2222",
+        "Сумма платежа": -10.0,
+        "Категория": "Кино",
+    },
+]
+
+
+def _wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.02)
+    assert condition()
+
+
+def test_running_totals_match_batch_helpers():
+    processor = StreamProcessor()
+    assert consume(processor, iter(OPERATIONS)) == 5
+    assert processor.stats() == {"processed": 5, "skipped": 1}
+
+    df = pd.DataFrame(OPERATIONS)
+    df = df[df["Статус"] == "OK"]
+    window = date_window(df, "2023-01-31 23:59:59")
+    assert processor.cards_info("2023-01-31 23:59:59") == cards_info(window)
+    assert processor.total_expenses("2023-01-31 23:59:59") == total_expenses(window)
+    assert processor.expenses_by_category("2023-01-31 23:59:59", n=1) == expenses_by_category(window, n=1)
+    assert processor.income_by_category("2023-01-31 23:59:59") == income_by_category(window)
+    # без даты - последний период
+    assert processor.cards_info() == [{"last_digits": "2222", "total_spent": 10.0, "cashback": 0.1}]
+    assert processor.total_income(diapason="Y") == 300.0
+
+
+def test_period_key():
+    assert str(period_key(pd.Timestamp("2023-01-05").to_pydatetime(), "W")) == "2023-01-02"
+    with pytest.raises(ValueError):
+        period_key(pd.Timestamp("2023-01-05").to_pydatetime(), "D")
+
+
+def test_tail_file_reads_appended_lines(tmp_path):
+    path = tmp_path / "operations.jsonl"
+    path.write_text(json.dumps(OPERATIONS[0], ensure_ascii=False) + "\n", encoding="utf-8")
+    processor, stop = StreamProcessor(), threading.Event()
+    reader = threading.Thread(target=tail_file, args=(processor, str(path), stop), kwargs={"interval": 0.01})
+    reader.start()
+    with open(path, "a", encoding="utf-8") as f:
+        line = json.dumps(OPERATIONS[1], ensure_ascii=False)
+        f.write(line[:10])
+        f.flush()
+        time.sleep(0.05)
+        f.write(line[10:] + "\nне json\n")
+    _wait_for(lambda: processor.stats()["processed"] == 2)
+    stop.set()
+    reader.join()
+    assert processor.total_expenses("2023-01-31 23:59:59") == 350
+
+
+def test_socket_stream():
+    processor = StreamProcessor()
+    server = serve_socket(processor)
+    try:
+        with socket.create_connection(server.server_address) as connection:
+            for operation in OPERATIONS:
+                connection.sendall((json.dumps(operation, ensure_ascii=False) + "\n").encode("utf-8"))
+        _wait_for(lambda: sum(processor.stats().values()) == len(OPERATIONS))
+    finally:
+        server.shutdown()
+        server.server_close()
+    assert processor.expenses_by_category("2023-02-28 23:59:59")[0] == {"category": "Кино", "amount": 10.0}
@@ -0,0 +1,46 @@
+import pytest
+
+from src import services, utils, views
+from src.stress import check_baseline, configured, run_stress, synthetic_statement
+
+
+def test_synthetic_statement_format():
+    df = synthetic_statement(50)
+    assert len(df) == 50
+    assert {"Дата операции", "Сумма платежа", "Категория", "Описание", "Кэшбэк"} <= set(df.columns)
+    assert (df["Валюта платежа"] == "RUB").all()
+
+
+def test_run_stress_reports_latency_and_errors():
+    data_file = views.data_file
+    report = run_stress(threads=3, processes=1, requests=5, rows=300, delay=0.01)
+    assert views.data_file == data_file
+    assert report["requests"] == 15
+    assert report["throughput_rps"] > 0
+    assert set(report["endpoints"]) == {
+        "json_answer_main",
+        "json_answer_events",
+        "json_answer_cashback",
+        "json_answer_search",
+        "json_answer_search_number",
+    }
+    for endpoint in report["endpoints"].values():
+        assert endpoint["error_rate"] == 0
+        assert endpoint["mismatch_rate"] == 0
+        assert endpoint["p50_ms"] <= endpoint["p95_ms"] <= endpoint["p99_ms"]
+    assert report["hotspots"]
+    assert report["corrupted_outputs"] == []
+    assert report["market_requests"]["/daily_json.js"] >= 1
+
+    assert check_baseline(report, report) == []
+    slower = {**report, "throughput_rps": report["throughput_rps"] / 3}
+    assert len(check_baseline(slower, report)) == 1
+
+
+def test_configured_restores_modules_on_error(tmp_path):
+    before = (views.data_file, views.root_path, services.root_path, utils.stock_quota)
+    with pytest.raises(RuntimeError):
+        with configured(str(tmp_path), str(tmp_path / "operations.xlsx"), "http://127.0.0.1:1"):
+            assert views.root_path == services.root_path == tmp_path
+            raise RuntimeError("сбой прогона")
+    assert (views.data_file, views.root_path, services.root_path, utils.stock_quota) == before
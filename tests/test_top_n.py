@@ -0,0 +1,71 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.query import partial_argsort
+from src.top_n import top_n
+from src.utils import expenses_by_category
+
+
+@pytest.fixture
+def operations():
+    return pd.DataFrame(
+        {
+            "Дата операции": [
+                "01.01.2023 12:00:00",
+                "02.01.2023 12:00:00",
+                "03.01.2023 12:00:00",
+                "01.02.2023 12:00:00",
+                "02.02.2023 12:00:00",
+            ],
+            "Номер карты": ["*1111", "*1111", "*2222", "*1111", "*2222"],
+            "Сумма платежа": [-10.0, -30.0, -20.0, -50.0, -5.0],
+            "Категория": ["Еда", "Еда", "Кино", "Еда", "Кино"],
+        }
+    )
+
+
+def test_partial_argsort_matches_stable_sort():
+    values = np.array([3.0, 1.0, np.nan, 1.0, 7.0, 2.0])
+    assert partial_argsort(values, 3).tolist() == [1, 3, 5]
+    assert partial_argsort(values, 2, ascending=False).tolist() == [4, 0]
+    assert partial_argsort(values, 10).tolist() == [1, 3, 5, 0, 4, 2]
+    assert partial_argsort(values, 10, ascending=False).tolist() == [4, 0, 5, 1, 3, 2]
+    assert partial_argsort(np.array([True, False, True]), 2, ascending=False).tolist() == [0, 2]
+
+
+def test_top_n_per_group_skips_missing_values(operations):
+    operations.loc[3, "Сумма платежа"] = np.nan
+    result = top_n(operations, n=2, largest=False, per=("Номер карты",))
+    assert result["Сумма платежа"].tolist() == [-30.0, -10.0, -20.0, -5.0]
+    assert top_n(operations, n=1, largest=False)["Сумма платежа"].tolist() == [-30.0]
+
+
+def test_top_n_global(operations):
+    result = top_n(operations, n=2, largest=False)
+    assert result["Сумма платежа"].tolist() == [-50.0, -30.0]
+
+
+def test_top_n_per_card(operations):
+    result = top_n(operations, n=1, largest=False, per=("Номер карты",), columns=("Номер карты", "Сумма платежа"))
+    assert result.to_dict(orient="records") == [
+        {"Номер карты": "*1111", "Сумма платежа": -50.0},
+        {"Номер карты": "*2222", "Сумма платежа": -20.0},
+    ]
+
+
+def test_top_n_per_category_per_month(operations):
+    result = top_n(operations, n=1, largest=False, per=("Категория", "Месяц"))
+    assert result[["Категория", "Месяц", "Сумма платежа"]].values.tolist() == [
+        ["Еда", "2023-01", -30.0],
+        ["Еда", "2023-02", -50.0],
+        ["Кино", "2023-01", -20.0],
+        ["Кино", "2023-02", -5.0],
+    ]
+
+
+def test_expenses_by_category_remainder_keeps_every_category():
+    df = pd.DataFrame({"Сумма платежа": [-float(i) for i in range(1, 10)], "Категория": list("ABCDEFGHI")})
+    result = expenses_by_category(df)
+    assert len(result) == 8
+    assert result[-1] == {"category": "Остальное", "amount": 3.0}
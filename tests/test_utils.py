@@ -1,16 +1,27 @@
+import asyncio
+import os
+import threading
+import time
 from unittest.mock import MagicMock, patch
 
 import pandas as pd
 import pytest
 
+from src.query import get_aggregation_backend, group_aggregate_numpy
+from src.quota import BACKGROUND, INTERACTIVE
+from src.snapshot import attach_snapshot, current_version, publish_snapshot
 from src.utils import (
+    SingleFlight,
     cards_info,
     currency_rates,
     expenses_by_category,
     income_by_category,
+    market_data_flight,
     read_info,
     read_user_settings,
     sorted_by_date,
+    stock_flight_key,
+    stocks_prices,
     top_transactions,
     total_expenses,
     total_income,
@@ -212,6 +223,13 @@ def test_currency_rates_keyerror_or_typeerror(mock_logger, mock_read_user_settin
     assert "Ошибка получения курса валют. Код ошибки 'Valute'" in result
 
 
+def test_currency_rates_without_user_settings(mock_logger, mock_read_user_settings, mock_requests_get):
+    mock_read_user_settings.return_value = None
+    result = currency_rates()
+    assert result == "Ошибка получения курса валют: не прочитан список валют пользователя"
+    assert not mock_requests_get.called
+
+
 def test_total_expenses_positive_and_negative_values(mock_logger):
     data = {"Сумма платежа": [100, -50, -20, 30]}
     df = pd.DataFrame(data)
@@ -299,6 +317,28 @@ def test_logging_calls_expenses_by_category(mock_logger):
     expenses_by_category(df)
 
 
+def test_category_helpers_use_backend_per_call():
+    df = pd.DataFrame(
+        {
+            "Сумма платежа": [-100.0, -50.0, 200.0, -25.0],
+            "Категория": ["A", "B", "C", "A"],
+            "Номер карты": ["*1111", "*2222", "*1111", "*1111"],
+        }
+    )
+    expected = (cards_info(df), expenses_by_category(df), income_by_category(df))
+    with patch("src.query.group_aggregate_numpy", wraps=group_aggregate_numpy) as numpy_path:
+        result = (
+            cards_info(df, backend="numpy"),
+            expenses_by_category(df, backend="numpy"),
+            income_by_category(df, backend="numpy"),
+        )
+    assert result == expected
+    assert numpy_path.call_count == 3
+    assert get_aggregation_backend() == "pandas"
+    with pytest.raises(ValueError):
+        cards_info(df, backend="polars")
+
+
 def test_income_by_category_basic(mock_logger):
     data = {
         "Сумма платежа": [100, 50, -200, 300],
@@ -334,3 +374,131 @@ def test_logging_calls(mock_logger):
     data = {"Сумма платежа": [100], "Категория": ["Test"]}
     df = pd.DataFrame(data)
     income_by_category(df)
+
+
+def test_read_info_snapshot_is_shared_and_reused(tmp_path):
+    source = str(tmp_path / "operations.xlsx")
+    snapshot = str(tmp_path / "snapshot")
+    test_data = {
+        "Дата операции": ["01.01.2023 12:00:00", "02.01.2023 12:00:00", "03.01.2023 12:00:00"],
+        "Номер карты": ["*1111", "*1111", None],
+        "Статус": ["OK", "FAILED", "OK"],
+        "Сумма платежа": [-100.0, 5.0, 200.0],
+        "Категория": ["А", "Б", None],
+        "Описание": ["Магазин", "Отмена", "Перевод"],
+    }
+    pd.DataFrame(test_data).to_excel(source, index=False)
+    first = read_info(source, snapshot)
+    with patch("src.utils.ingest_statement") as mock_ingest:
+        second = read_info(source, snapshot)
+    mock_ingest.assert_not_called()
+    assert second["Сумма платежа"].tolist() == [-100.0, 200.0]
+    assert second["Категория"].tolist()[0] == "А" and pd.isna(second["Категория"].tolist()[1])
+    assert not second["Сумма платежа"].to_numpy().flags.writeable
+    assert first["Статус"].tolist() == ["OK", "OK"]
+
+
+def test_single_flight_shares_result_and_error():
+    flight = SingleFlight()
+    assert flight.do("key", lambda: 42) == 42
+    with pytest.raises(ValueError):
+        flight.do("key", lambda: _raise(ValueError))
+    assert flight.stats() == {"calls": 2, "executed": 2, "deduplicated": 0, "fallback": 0}
+
+
+def test_single_flight_follower_stops_waiting_and_fetches_itself():
+    flight = SingleFlight()
+    started, release = threading.Event(), threading.Event()
+
+    def slow():
+        started.set()
+        release.wait(5)
+        return "leader"
+
+    leader = threading.Thread(target=lambda: flight.do("key", slow))
+    leader.start()
+    started.wait(5)
+    begun = time.perf_counter()
+    assert flight.do("key", lambda: "own", wait=0.05) == "own"
+    assert time.perf_counter() - begun < 1
+    release.set()
+    leader.join()
+    assert flight.stats()["fallback"] == 1
+    assert stock_flight_key("AAPL", INTERACTIVE) != stock_flight_key("AAPL", BACKGROUND)
+
+
+def test_async_and_sync_callers_share_one_request():
+    flight = SingleFlight()
+    started, calls = threading.Event(), []
+
+    async def fetch():
+        calls.append("async")
+        started.set()
+        await asyncio.sleep(0.2)
+        return 42
+
+    thread_result: list = []
+    loop_thread = threading.Thread(target=lambda: thread_result.append(asyncio.run(flight.do_async("key", fetch))))
+    loop_thread.start()
+    started.wait(5)
+    assert flight.do("key", lambda: calls.append("sync")) == 42
+    loop_thread.join()
+    assert thread_result == [42] and calls == ["async"]
+
+
+def test_cancelled_async_leader_is_not_shared_with_followers():
+    flight = SingleFlight()
+    started = threading.Event()
+
+    async def fetch():
+        started.set()
+        await asyncio.sleep(5)
+
+    async def cancel_leader():
+        task = asyncio.ensure_future(flight.do_async("key", fetch))
+        await asyncio.to_thread(started.wait, 5)
+        follower = asyncio.ensure_future(asyncio.to_thread(flight.do, "key", lambda: "own"))
+        await asyncio.sleep(0.05)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        return await follower
+
+    assert asyncio.run(cancel_leader()) == "own"
+    assert flight.stats()["fallback"] == 1
+
+
+def test_concurrent_market_data_requests_are_coalesced(market_stub):
+    barrier = threading.Barrier(8)
+    before = market_data_flight.stats()
+
+    def worker(func, results):
+        barrier.wait()
+        results.append(func())
+
+    results: list = []
+    threads = [threading.Thread(target=worker, args=(currency_rates, results)) for _ in range(4)]
+    threads += [threading.Thread(target=worker, args=(stocks_prices, results)) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    after = market_data_flight.stats()
+    assert market_stub["hits"]["/daily_json.js"] == 1
+    assert after["deduplicated"] - before["deduplicated"] > 0
+    assert [{"currency": "USD", "rate": 73.22}, {"currency": "EUR", "rate": 80.0}] in results
+
+
+def test_snapshot_publishes_new_version_and_keeps_readers_consistent(tmp_path):
+    source = str(tmp_path / "operations.xlsx")
+    snapshot = str(tmp_path / "snapshot")
+    pd.DataFrame({"Категория": ["Б"]}).to_excel(source, index=False)
+    publish_snapshot(pd.DataFrame({"Сумма": [1.0, 2.0], "Категория": ["Б", "В"]}), snapshot, source)
+    before = attach_snapshot(snapshot)
+    for categories in (["А", "Б"], ["А", "Я"]):
+        publish_snapshot(pd.DataFrame({"Сумма": [3.0, 4.0], "Категория": categories}), snapshot, source)
+    assert before["Категория"].tolist() == ["Б", "В"] and before["Сумма"].tolist() == [1.0, 2.0]
+    assert attach_snapshot(snapshot, source)["Категория"].tolist() == ["А", "Я"]
+    versions = [name for name in os.listdir(snapshot) if name.startswith("v")]
+    assert len(versions) == 2 and current_version(snapshot) == max(versions)
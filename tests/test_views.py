@@ -0,0 +1,68 @@
+import json
+from unittest.mock import MagicMock, patch
+
+import pandas as pd
+import pytest
+
+from src import views
+
+OPERATIONS = pd.DataFrame(
+    {
+        "Дата операции": ["03.01.2023 12:00:00", "05.01.2023 15:30:00", "10.01.2023 10:15:00"],
+        "Номер карты": ["*1111", "*2222", "*1111"],
+        "Сумма платежа": [-100.0, -250.5, 300.0],
+        "Категория": ["Еда", "Кино", "Доход"],
+        "Описание": ["Магнит", "Синема", "Перевод"],
+    }
+)
+
+
+@pytest.fixture
+def offline_page():
+    page_operations = MagicMock(return_value=OPERATIONS)
+    with (
+        patch("src.views.page_operations", page_operations),
+        patch("src.views.currency_rates", side_effect=AssertionError("курсы не запрашивались")) as rates,
+        patch("src.views.stocks_prices", side_effect=AssertionError("акции не запрашивались")) as stocks,
+        patch("src.views.save_answer", side_effect=lambda answer, _: json.dumps(answer, ensure_ascii=False)),
+    ):
+        yield page_operations, rates, stocks
+
+
+def test_requested_sections_skip_network_and_share_operations(offline_page):
+    page_operations, rates, stocks = offline_page
+    answer = json.loads(views.json_answer_main("2023-01-31 23:59:59", "M", sections=["top_transactions", "cards"]))
+    assert list(answer) == ["cards", "top_transactions"]
+    assert answer["cards"][0] == {"last_digits": "1111", "total_spent": 100.0, "cashback": 1.0}
+    page_operations.assert_called_once_with("2023-01-31 23:59:59", "M", "RUB")
+    assert not rates.called and not stocks.called
+
+
+def test_market_only_sections_skip_operations(offline_page):
+    page_operations, rates, stocks = offline_page
+    stocks.side_effect = None
+    stocks.return_value = [{"stock": "AAPL", "price": 150.12}]
+    answer = json.loads(views.json_answer_events("2023-01-31 23:59:59", sections={"stock_prices"}))
+    assert answer == {"stock_prices": [{"stock": "AAPL", "price": 150.12}]}
+    assert not page_operations.called and not rates.called
+
+
+def test_full_page_matches_sections_and_unknown_section_fails(offline_page):
+    _, rates, stocks = offline_page
+    rates.side_effect, stocks.side_effect = None, None
+    rates.return_value, stocks.return_value = [], []
+    answer = json.loads(views.json_answer_events("2023-01-31 23:59:59"))
+    assert list(answer) == ["expenses", "income", "currency_rates", "stock_prices"]
+    assert answer["expenses"] == views.compute_sections(OPERATIONS, views.OPERATION_SECTIONS["events"])["expenses"]
+    with pytest.raises(ValueError):
+        views.json_answer_events("2023-01-31 23:59:59", sections=["cards"])
+
+
+def test_search_returns_plain_list_unless_paging_requested():
+    with (
+        patch("src.views.statement", return_value=OPERATIONS),
+        patch("src.services.open", MagicMock(), create=True),
+    ):
+        assert [row["Описание"] for row in json.loads(views.json_answer_search("синема"))] == ["Синема"]
+        page = json.loads(views.json_answer_search("синема", limit=1, columns=["Описание"]))
+    assert page == {"results": [{"Описание": "Синема"}], "next_cursor": None}
@@ -0,0 +1,51 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.xlsx import STATEMENT_SCHEMA, UnknownLayout, read_statement, read_statement_fast
+
+
+@pytest.fixture
+def statement_file(tmp_path):
+    rows = 4
+    df = pd.DataFrame({name: [None] * rows for name in STATEMENT_SCHEMA})
+    df["Дата операции"] = ["31.12.2021 16:44:00", "31.12.2021 16:42:04", "30.12.2021 10:00:00", "29.12.2021 09:15:00"]
+    df["Дата платежа"] = ["31.12.2021", "31.12.2021", "30.12.2021", "29.12.2021"]
+    df["Номер карты"] = ["*7197", None, "*7197", "*5091"]
+    df["Статус"] = ["OK", "OK", "FAILED", "OK"]
+    df["Сумма платежа"] = [-160.89, -64.0, 500.0, 1000.0]
+    df["Сумма операции"] = df["Сумма платежа"]
+    df["Валюта операции"] = df["Валюта платежа"] = "RUB"
+    df["Кэшбэк"] = [None, 1.0, None, 5.0]
+    df["Категория"] = ["Супермаркеты", "Фастфуд", "Пополнения", "Переводы"]
+    df["MCC"] = [5411.0, 5814.0, np.nan, None]
+    df["Описание"] = ["Колхоз", "Mouse & Cat <1>", "Пополнение", "NA"]
+    df["Бонусы (включая кэшбэк)"] = [3, 1, 0, 0]
+    df["Округление на инвесткопилку"] = 0
+    df["Сумма операции с округлением"] = df["Сумма платежа"].abs()
+    path_xls = tmp_path / "operations.xlsx"
+    df.to_excel(path_xls, index=False)
+    return str(path_xls)
+
+
+@pytest.mark.parametrize("status", ["OK", None])
+def test_fast_reader_matches_pandas(statement_file, status):
+    expected = pd.read_excel(statement_file)
+    if status is not None:
+        expected = expected[expected["Статус"] == status]
+    pd.testing.assert_frame_equal(read_statement_fast(statement_file, status), expected)
+
+
+def test_fast_reader_parses_dates(statement_file):
+    df = read_statement_fast(statement_file, dates=True)
+    assert df["Дата операции"].dtype == "datetime64[us]"
+    assert df["Дата операции"].iloc[0] == pd.Timestamp("2021-12-31 16:44:00")
+    assert list(df.index) == [0, 1, 3]
+
+
+def test_unknown_layout_falls_back_to_pandas(tmp_path):
+    path_xls = str(tmp_path / "other.xlsx")
+    pd.DataFrame({"Статус": ["OK", "FAILED"], "Сумма": [100, 200]}).to_excel(path_xls, index=False)
+    with pytest.raises(UnknownLayout):
+        read_statement_fast(path_xls)
+    pd.testing.assert_frame_equal(read_statement(path_xls), pd.DataFrame({"Статус": ["OK"], "Сумма": [100]}))